@@ -2,5 +2,12 @@
 
 # This file makes this directory a Python package.
 
-# Optionally, you can import your main app here for easier imports
-from .backend import app
+# `from app import app` still gives the HTMX backend app, but it is only
+# built when asked for: importing app.main, app.outbox or any other module
+# of the package no longer builds (and imports everything behind) a second
+# application.
+def __getattr__(name):
+    if name == "app":
+        from .backend import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
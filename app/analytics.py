@@ -0,0 +1,168 @@
+# app/analytics.py
+"""
+Pre-aggregated queue analytics.
+
+Every call ("next") records the ticket's wait time into an in-memory
+buffer; ``RollupRecorder.flush`` folds the buffer into ``QueueRollup``
+rows, one per (queue, attendant, hour, wait bucket), with plain
+``served = served + n`` updates. The analytics endpoint only reads those
+rows, so it never scans raw tickets however long the history is.
+"""
+import asyncio
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from tortoise import timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+
+from app.models import QueueRollup
+
+logger = logging.getLogger("qapp_analytics")
+
+# Upper bounds (seconds) of the wait-time histogram; longer waits land in the last bucket
+WAIT_BUCKETS = [10, 30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 5400, 7200, 14400, 86400]
+
+# (queue_id, atendente_id, hour, wait_le)
+_Key = Tuple[int, Optional[int], datetime, int]
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def wait_bucket(seconds: float) -> int:
+    index = bisect.bisect_left(WAIT_BUCKETS, seconds)
+    return WAIT_BUCKETS[min(index, len(WAIT_BUCKETS) - 1)]
+
+
+class RollupRecorder:
+    """
+    Buffers call statistics in memory and flushes them as increments.
+    """
+
+    def __init__(self):
+        self._pending: Dict[_Key, List[float]] = defaultdict(lambda: [0, 0.0])
+
+    def record_call(self, atendimento, called_at: Optional[datetime] = None):
+        """Account one called ticket (cheap, no I/O)."""
+        called_at = called_at or timezone.now()
+        wait = max(0.0, (called_at - atendimento.created_at).total_seconds())
+        key = (atendimento.queue_id, atendimento.atendente_id, hour_bucket(called_at), wait_bucket(wait))
+        entry = self._pending[key]
+        entry[0] += 1
+        entry[1] += wait
+
+    async def flush(self) -> int:
+        """
+        Write buffered increments to QueueRollup. Returns rows touched.
+        Increments not written when a write fails (or the flush is
+        cancelled) go back into the buffer for the next flush.
+        """
+        pending, self._pending = self._pending, defaultdict(lambda: [0, 0.0])
+        written = 0
+        try:
+            for key, (served, wait_total) in list(pending.items()):
+                await self._write(key, served, wait_total)
+                del pending[key]
+                written += 1
+        except BaseException:
+            for key, (served, wait_total) in pending.items():
+                entry = self._pending[key]
+                entry[0] += served
+                entry[1] += wait_total
+            raise
+        return written
+
+    @staticmethod
+    async def _write(key: _Key, served: int, wait_total: float):
+        queue_id, atendente_id, bucket, wait_le = key
+        lookup = dict(queue_id=queue_id, atendente_id=atendente_id, bucket=bucket, wait_le=wait_le)
+        increments = dict(served=F("served") + served, wait_total=F("wait_total") + wait_total)
+        if await QueueRollup.filter(**lookup).update(**increments):
+            return
+        try:
+            await QueueRollup.create(served=served, wait_total=wait_total, **lookup)
+        except IntegrityError:
+            # Another worker created the row first
+            await QueueRollup.filter(**lookup).update(**increments)
+
+    async def run(self, interval_seconds: float = 10):
+        """Flush periodically (run as a background task)."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush queue rollups: {e}")
+
+
+# Shared recorder; the queue engine records every call into it
+recorder = RollupRecorder()
+
+
+# -----------------------
+# Reading
+# -----------------------
+def histogram_percentile(histogram: Dict[int, int], fraction: float) -> Optional[float]:
+    """
+    Estimate a percentile from bucket counts, interpolating inside the bucket.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    target = fraction * total
+    seen, lower = 0, 0
+    for upper in WAIT_BUCKETS:
+        count = histogram.get(upper, 0)
+        if count and seen + count >= target:
+            return round(lower + (upper - lower) * (target - seen) / count, 1)
+        seen += count
+        lower = upper
+    return float(WAIT_BUCKETS[-1])
+
+
+async def queue_analytics(
+    queue_id: int,
+    granularity: str = "hour",
+    by_atendente: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[dict]:
+    """
+    Throughput and wait statistics of a queue per hour or day, optionally
+    split per attendant.
+    """
+    until = until or timezone.now()
+    since = since or until - timedelta(days=7)
+    rows = await QueueRollup.filter(
+        queue_id=queue_id, bucket__gte=hour_bucket(since), bucket__lte=until
+    ).values("atendente_id", "bucket", "wait_le", "served", "wait_total")
+
+    groups: Dict[tuple, dict] = {}
+    for row in rows:
+        bucket = row["bucket"]
+        if granularity == "day":
+            bucket = bucket.replace(hour=0)
+        key = (bucket, row["atendente_id"] if by_atendente else None)
+        group = groups.setdefault(key, {"served": 0, "wait_total": 0.0, "histogram": defaultdict(int)})
+        group["served"] += row["served"]
+        group["wait_total"] += row["wait_total"]
+        group["histogram"][row["wait_le"]] += row["served"]
+
+    result = []
+    for (bucket, atendente_id), group in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        entry = {
+            "bucket": bucket.isoformat(),
+            "served": group["served"],
+            "avg_wait_seconds": round(group["wait_total"] / group["served"], 1) if group["served"] else None,
+            "p50_wait_seconds": histogram_percentile(group["histogram"], 0.50),
+            "p95_wait_seconds": histogram_percentile(group["histogram"], 0.95),
+        }
+        if by_atendente:
+            entry["atendente_id"] = atendente_id
+        result.append(entry)
+    return result
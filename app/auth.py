@@ -1,31 +1,40 @@
 # app/auth.py
 from datetime import datetime, timedelta
 from typing import Optional
+import time
+import uuid
 import jwt
-from passlib.context import CryptContext
-from fastapi import HTTPException, Depends
+from fastapi import HTTPException, Depends, Request
 from fastapi.security import OAuth2PasswordBearer
 from app.models import User
 from tortoise.exceptions import DoesNotExist
-from app.config import config  # optional, you can load JWT secret here
+from tortoise.signals import pre_save, post_save, post_delete
+from app.cache import TTLCache
+from app.revocation import RevocationList
+from app.hashing import PasswordHasher, hash_password, verify_password
+from app.config import get_settings
 
 # -----------------------
 # Password hashing setup
 # -----------------------
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on a bounded worker pool; the sync helpers stay for scripts
+password_hasher = PasswordHasher(
+    max_workers=get_settings().password_hash_workers,
+    max_queue=get_settings().password_hash_max_queue,
+    use_processes=get_settings().password_hash_processes,
+)
 
-def hash_password(password: str) -> str:
-    """Hash a plain password"""
-    return pwd_context.hash(password)
+async def hash_password_async(password: str) -> str:
+    """Hash a plain password off the event loop"""
+    return await password_hasher.hash(password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash off the event loop"""
+    return await password_hasher.verify(plain_password, hashed_password)
 
 # -----------------------
 # JWT token setup
 # -----------------------
-JWT_SECRET = config.get("jwt_secret", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60  # 1 hour
 
@@ -34,22 +43,129 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 def create_access_token(user_id: int, role: str, expires_delta: Optional[timedelta] = None) -> str:
     """Generate a JWT token"""
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    payload = {"sub": str(user_id), "role": role, "exp": expire}
-    token = jwt.encode(payload, JWT_SECRET, algorithm=ALGORITHM)
+    # jti identifies the token for logout; a float iat orders it against per-user cutoffs
+    payload = {"sub": str(user_id), "role": role, "exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex}
+    token = jwt.encode(payload, get_settings().jwt_secret, algorithm=ALGORITHM)
     return token
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    """Get the current user from JWT token"""
-    from tortoise.exceptions import DoesNotExist
+# -----------------------
+# Token and user caches
+# -----------------------
+# Verified token payloads, so a token is decoded once and not on every request
+token_cache = TTLCache(maxsize=get_settings().token_cache_size, ttl=300)
+# Users by id, so authenticated requests do not each run User.get
+user_cache = TTLCache(maxsize=get_settings().user_cache_size, ttl=get_settings().user_cache_ttl)
+
+def decode_token(token: str) -> dict:
+    """Verify a JWT once and memoize its payload until it expires"""
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, get_settings().jwt_secret, algorithms=[ALGORITHM])
+        expires_in = payload.get("exp", float("inf")) - time.time()
+        token_cache.set(token, payload, ttl=min(token_cache.ttl, expires_in))
+    elif payload.get("exp", float("inf")) <= time.time():
+        token_cache.pop(token)
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+# Logged-out tokens and per-user cutoffs, checked in memory on every request
+revocations = RevocationList(get_settings().revocation_backend)
+
+def verify_token(token: str) -> dict:
+    """
+    The single token check: signature and expiry (memoized by decode_token)
+    plus revocation. Raises 401 on any failure.
+    """
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        user_id = int(payload.get("sub"))
-        user = await User.get(id=user_id)
-        return user
+        claims = decode_token(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except (jwt.InvalidTokenError, DoesNotExist):
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if revocations.is_revoked(claims):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return claims
+
+def request_claims(request: Request, token: str) -> dict:
+    """
+    Verified claims of the request's token, checked once per request and
+    kept in request.state (shared by the JWT middleware and dependencies).
+    """
+    cached = getattr(request.state, "token_claims", None)
+    if cached is not None and request.state.token == token:
+        return cached
+    claims = verify_token(token)
+    request.state.token, request.state.token_claims = token, claims
+    return claims
+
+async def logout(claims: dict, all_sessions: bool = False):
+    """Revoke this token, or every token of the user issued so far"""
+    if all_sessions:
+        await revocations.revoke_user(int(claims["sub"]))
+    else:
+        await revocations.revoke_token(claims)
+
+def invalidate_user(user_id: int):
+    """Forget a cached user (role change, deletion)"""
+    user_cache.pop(user_id)
+
+@pre_save(User)
+async def _user_saving(sender, instance, using_db, update_fields):
+    # Tokens carry the role claim, so a role change must retire the old tokens
+    if instance.id is None or (update_fields and "role" not in update_fields):
+        return
+    old_role = await User.filter(id=instance.id).using_db(using_db).first().values_list("role", flat=True)
+    if old_role is not None and old_role != instance.role:
+        await revocations.revoke_user(instance.id)
+
+@post_save(User)
+async def _user_saved(sender, instance, created, using_db, update_fields):
+    invalidate_user(instance.id)
+
+@post_delete(User)
+async def _user_deleted(sender, instance, using_db):
+    # require_role trusts the token alone, so a deleted user's tokens must be retired too
+    await revocations.revoke_user(instance.id)
+    invalidate_user(instance.id)
+
+def auth_cache_stats() -> dict:
+    """Hit/miss counters of the token and user caches, and password pool depth"""
+    return {
+        "tokens": token_cache.stats(),
+        "users": user_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "revocations": revocations.stats(),
+    }
+
+async def get_token_claims(request: Request, token: str = Depends(oauth2_scheme)) -> dict:
+    """Verified token claims, without loading the user"""
+    return request_claims(request, token)
+
+def require_role(*roles: str):
+    """
+    Dependency that trusts the role claim of a verified token, so role-only
+    checks need no database lookup.
+    """
+    async def checker(claims: dict = Depends(get_token_claims)) -> dict:
+        if claims.get("role") not in roles:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        return claims
+    return checker
+
+async def get_current_user(claims: dict = Depends(get_token_claims)) -> User:
+    """Get the current user from JWT token"""
+    try:
+        user_id = int(claims.get("sub"))
+    except (TypeError, ValueError):
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    user = user_cache.get(user_id)
+    # A token carrying a different role than the cached user means the cache is stale
+    if user is None or user.role != claims.get("role"):
+        user = await User.get_or_none(id=user_id)
+        if user is None:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        user_cache.set(user_id, user)
+    return user
 
 # -----------------------
 # User authentication
@@ -60,7 +176,7 @@ async def authenticate_user(phone: str, password: str) -> User:
         user = await User.get(phone=phone)
     except DoesNotExist:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
     return user
 
@@ -1,66 +1,45 @@
-from fastapi import FastAPI, Request, Form, BackgroundTasks
+# Time the imports below as the first startup phase (see app.startup)
+from app.startup import startup_timer
+startup_timer.begin("imports")
+
+import asyncio
+from fastapi import FastAPI, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from tortoise.contrib.fastapi import register_tortoise
-from models import User, Queue, Atendimento, MessageLog, AtendimentoStatus, MessageType
+from app.models import User, Queue, Atendimento, MessageLog, AtendimentoStatus, MessageType
+from app.queue_engine import engine
+from app.coordination import coordinator
+from app.crud import now_serving, ticket_position
+from app.migrations import migrate
+from app.analytics import recorder
 from pydantic import BaseModel
-import yaml
-import smtplib
-from email.mime.text import MIMEText
+from app.config import get_settings, production, settings_store
+from app.database import tortoise_config
+from app.metrics import MetricsMiddleware, instrument_db, metrics_endpoint
+from app.outbox import enqueue_email
+from app.events import sse_response
+from app.fragments import dashboard_response, fragment_response, panel, render
+from app.templating import compile_templates
 
 app = FastAPI()
-templates = Jinja2Templates(directory="templates")
-
-# Load configuration
-with open("config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-
-# Helper function to send emails
-def send_email(to_email: str, subject: str, content: str):
-    smtp_config = config.get("smtp")
-    if not smtp_config:
-        print("SMTP configuration missing in config.yaml")
-        return
-    msg = MIMEText(content)
-    msg["Subject"] = subject
-    msg["From"] = smtp_config["from_email"]
-    msg["To"] = to_email
-
-    try:
-        with smtplib.SMTP(smtp_config["host"], smtp_config["port"]) as server:
-            if smtp_config.get("use_tls"):
-                server.starttls()
-            if smtp_config.get("username") and smtp_config.get("password"):
-                server.login(smtp_config["username"], smtp_config["password"])
-            server.send_message(msg)
-        print(f"Email sent to {to_email}")
-    except Exception as e:
-        print(f"Failed to send email: {e}")
+app.add_middleware(MetricsMiddleware)
+app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
 
 # Dashboard
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    # Get all queues and their pending atendimentos
-    queues = await Queue.all().prefetch_related("atendimentos")
-    queue_data = []
-    for q in queues:
-        atendimentos = await q.atendimentos.filter(status=AtendimentoStatus.AGUARDANDO)
-        queue_data.append({"queue": q, "atendimentos": atendimentos})
-    return templates.TemplateResponse("fila.html", {"request": request, "queues": queue_data})
+    # All queues and their first pending atendimentos, from cached fragments (or 304)
+    return await dashboard_response(request)
 
 # Add number to queue
 @app.post("/add")
-async def add_fila(queue_id: int = Form(...), phone: str = Form(...), background_tasks: BackgroundTasks = None):
-    atendimento = await Atendimento.create(
-        queue_id=queue_id,
-        phone=phone,
-        status=AtendimentoStatus.AGUARDANDO
-    )
+async def add_fila(queue_id: int = Form(...), phone: str = Form(...)):
+    atendimento = await engine.add(queue_id, phone)
     # Optional email notification
-    if "notification_email" in config:
-        background_tasks.add_task(
-            send_email,
-            to_email=config["notification_email"],
+    notification_email = get_settings().notification_email
+    if notification_email:
+        await enqueue_email(
+            to_email=notification_email,
             subject="Queue Update",
             content=f"New entry added to queue {queue_id}: {phone}"
         )
@@ -68,31 +47,104 @@ async def add_fila(queue_id: int = Form(...), phone: str = Form(...), background
 
 # Call next in queue
 @app.post("/next", response_class=HTMLResponse)
-async def chamar_proximo(request: Request, queue_id: int = Form(...), atendente_id: int = Form(...), background_tasks: BackgroundTasks = None):
-    atendimento = await Atendimento.filter(
-        queue_id=queue_id,
-        status=AtendimentoStatus.AGUARDANDO
-    ).first()
+async def chamar_proximo(request: Request, queue_id: int = Form(...), atendente_id: int = Form(...)):
+    atendimento = await engine.next(queue_id, atendente_id)
     if atendimento:
-        atendimento.status = AtendimentoStatus.CHAMADO
-        atendimento.atendente_id = atendente_id
-        await atendimento.save()
         # Optional email notification
-        if "notification_email" in config:
-            background_tasks.add_task(
-                send_email,
-                to_email=config["notification_email"],
+        notification_email = get_settings().notification_email
+        if notification_email:
+            await enqueue_email(
+                to_email=notification_email,
                 subject="Queue Update",
                 content=f"Now serving: {atendimento.phone} in queue {queue_id}"
             )
-        return templates.TemplateResponse("partial.html", {"request": request, "proximo": atendimento.phone})
+        return HTMLResponse(render("partial.html", proximo=atendimento.phone))
     return HTMLResponse("<p>Fila vazia</p>")
 
+# Now serving, shared by all workers
+@app.get("/queue/{queue_id}/now-serving")
+async def queue_now_serving(queue_id: int):
+    return await now_serving(queue_id)
+
+# One queue's section for panels that poll (ETag / 304 while nothing changes)
+@app.get("/queue/{queue_id}/panel", response_class=HTMLResponse)
+async def queue_panel(request: Request, queue_id: int):
+    fragment = await panel(queue_id)
+    if fragment is None:
+        raise HTTPException(status_code=404, detail="Queue not found")
+    return fragment_response(request, fragment.etag, fragment.html)
+
+# Position and estimated wait of a ticket, for the customer holding it
+@app.get("/atendimentos/{atendimento_id}/position")
+async def atendimento_position(atendimento_id: int):
+    result = await ticket_position(atendimento_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Atendimento not found")
+    return result
+
+# Live queue events for the lobby screens (SSE)
+@app.get("/queue/{queue_id}/events")
+async def queue_events(queue_id: int):
+    return sse_response(queue_id)
+
 # Tortoise ORM initialization
 register_tortoise(
     app,
-    db_url=config.get("database_url", "sqlite://db.sqlite3"),
-    modules={"models": ["models"]},
-    generate_schemas=True,
+    config=tortoise_config(),
+    generate_schemas=False,  # schema is managed by app.migrations
     add_exception_handlers=True
 )
+app.router.lifespan_context = startup_timer.lifespan(app.router.lifespan_context)
+
+# Create missing tables and indexes on new and existing databases (in
+# production only pending migrations: the deploy runs python -m app.migrations)
+@app.on_event("startup")
+async def apply_migrations():
+    startup_timer.begin("migrations")
+    await migrate(generate_schemas=not production())
+
+# Count and time DB queries for /metrics
+@app.on_event("startup")
+async def start_db_metrics():
+    instrument_db()
+
+# Join the other workers (events, shared counters), then rebuild the
+# in-memory queue index once the ORM is up
+@app.on_event("startup")
+async def rebuild_queue_engine():
+    startup_timer.begin("coordination")
+    await coordinator.start(get_settings().coordination)
+    startup_timer.begin("queue_engine")
+    await engine.rebuild()
+
+# Compile the templates before the first request
+@app.on_event("startup")
+async def warm_templates():
+    startup_timer.begin("templates")
+    compile_templates()
+
+# Reload config.yaml on SIGHUP (and on change, if config_watch_interval is set)
+@app.on_event("startup")
+async def start_config_reload():
+    startup_timer.begin("background")
+    app.state.config_watch = settings_store.start()
+
+# Fold call statistics into the analytics rollup every few seconds
+@app.on_event("startup")
+async def start_rollup_flush():
+    app.state.rollup_task = asyncio.create_task(recorder.run())
+
+# Log how long each phase took (also on /metrics)
+@app.on_event("startup")
+async def report_startup():
+    startup_timer.finish()
+
+@app.on_event("shutdown")
+async def flush_rollups():
+    if app.state.config_watch:
+        app.state.config_watch.cancel()
+    app.state.rollup_task.cancel()
+    await recorder.flush()
+    await coordinator.close()
+
+startup_timer.end()
@@ -0,0 +1,201 @@
+# app/config.py
+"""
+Application settings.
+
+config.yaml is parsed once into an immutable ``Settings`` snapshot that
+every module reads through ``get_settings()``. Reloading (SIGHUP, or the
+optional file watch) parses the file again and swaps the snapshot in with
+a single assignment: a request sees either the old or the new settings,
+never a mix. A file that fails to parse or validate is logged and ignored,
+and the running snapshot stays in place.
+
+Values read on every use (SMTP, CORS origins, notification texts,
+notification_email) take effect on reload. Pool and cache sizes and the
+database URL are read at startup and need a restart.
+
+The file is ``$QAPP_CONFIG`` if set, else config.yaml at the project root.
+"""
+import asyncio
+import logging
+import os
+import signal
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+from pydantic import BaseModel, model_validator
+
+logger = logging.getLogger("qapp_config")
+
+DEFAULT_PATH = Path(__file__).resolve().parent.parent / "config.yaml"
+
+
+class Settings(BaseModel):
+    database_url: str = "sqlite://db.sqlite3"
+    jwt_secret: str = "supersecretkey"
+    cors_origins: List[str] = ["*"]
+    notification_email: Optional[str] = None
+    # "production": no schema generation at startup (see app.migrations) and
+    # no template reloading; startup-only
+    environment: str = "development"
+
+    # Startup-only: worker pools and caches are sized once
+    password_hash_workers: int = 4
+    password_hash_max_queue: Optional[int] = None
+    password_hash_processes: bool = False
+    token_cache_size: int = 4096
+    user_cache_size: int = 1024
+    user_cache_ttl: float = 60
+    # "memory" (one worker) or "database", shared by all workers; required
+    # when there are several (see several_workers)
+    revocation_backend: str = "memory"
+    revocation_sync_seconds: float = 5
+
+    # Seconds between config.yaml mtime checks; 0 disables the watch (SIGHUP still works)
+    config_watch_interval: float = 0
+
+    # Sections handed as mappings to the modules that own them
+    database: Dict[str, Any] = {}  # startup-only, see app.database
+    smtp: Optional[Dict[str, Any]] = None
+    outbox: Dict[str, Any] = {}
+    mensagens: Dict[str, Any] = {}
+    reminders: Dict[str, Any] = {}
+    coordination: Dict[str, Any] = {}
+    twilio: Dict[str, Any] = {}
+
+    class Config:
+        frozen = True
+        extra = "allow"
+
+    @model_validator(mode="after")
+    def _shared_revocations(self):
+        # A logout or role change must reach every worker, not only the one that saw it
+        if self.revocation_backend == "memory" and several_workers(self):
+            raise ValueError(
+                'revocation_backend "memory" only revokes tokens in one worker; '
+                'set revocation_backend: database when several workers run'
+            )
+        return self
+
+
+def several_workers(settings: Settings) -> bool:
+    """
+    Whether more than one worker process serves the app: the workers share a
+    coordination backend, or $WEB_CONCURRENCY (uvicorn, gunicorn) asks for
+    more than one.
+    """
+    if settings.coordination.get("backend", "local") != "local":
+        return True
+    try:
+        return int(os.environ.get("WEB_CONCURRENCY", "1")) > 1
+    except ValueError:
+        return False
+
+
+def config_path() -> Path:
+    return Path(os.environ.get("QAPP_CONFIG", DEFAULT_PATH))
+
+
+def load_settings(path: Optional[Path] = None) -> Settings:
+    """Parse and validate a config file (no caching)."""
+    path = path or config_path()
+    if not path.exists() and "QAPP_CONFIG" not in os.environ:
+        logger.warning(f"{path} not found, using default settings")
+        return Settings()
+    with open(path, "r") as f:
+        return Settings(**(yaml.safe_load(f) or {}))
+
+
+class SettingsStore:
+    """
+    Holds the current Settings snapshot and replaces it on reload.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self._path = path
+        self._current: Optional[Settings] = None
+        self._mtime: Optional[int] = None
+        self._listeners: List[Callable[[Settings], None]] = []
+        self.reloads = 0
+
+    @property
+    def path(self) -> Path:
+        return self._path or config_path()
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def current(self) -> Settings:
+        if self._current is None:
+            self._mtime = self._stat()
+            self._current = load_settings(self.path)
+        return self._current
+
+    def subscribe(self, listener: Callable[[Settings], None]):
+        """Call ``listener(new_settings)`` after every successful reload."""
+        self._listeners.append(listener)
+
+    def reload(self) -> bool:
+        """
+        Parse the file again and swap the snapshot in. Returns False (and
+        keeps the current snapshot) when the new file is invalid.
+        """
+        mtime = self._stat()
+        try:
+            settings = load_settings(self.path)
+        except Exception as e:
+            logger.error(f"Config reload failed, keeping current settings: {e}")
+            return False
+        self._current, self._mtime = settings, mtime
+        self.reloads += 1
+        for listener in self._listeners:
+            try:
+                listener(settings)
+            except Exception as e:
+                logger.error(f"Config reload listener {listener!r} failed: {e}")
+        logger.info(f"Reloaded settings from {self.path}")
+        return True
+
+    def install_sighup(self) -> bool:
+        """Reload on SIGHUP (Unix only). Call from inside the running loop."""
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self.reload)
+        except (RuntimeError, ValueError, NotImplementedError) as e:
+            # e.g. the loop runs outside the main thread
+            logger.warning(f"Config reload on SIGHUP unavailable: {e}")
+            return False
+        return True
+
+    async def watch(self, interval: Optional[float] = None):
+        """Reload whenever the file's mtime changes (run as a background task)."""
+        interval = interval or self.current.config_watch_interval
+        while True:
+            await asyncio.sleep(interval)
+            if self._stat() != self._mtime:
+                self.reload()
+
+    def start(self) -> Optional[asyncio.Task]:
+        """SIGHUP handler plus, when configured, the file watch task."""
+        self.install_sighup()
+        if self.current.config_watch_interval > 0:
+            return asyncio.create_task(self.watch())
+        return None
+
+
+# Process-wide settings
+settings_store = SettingsStore()
+
+
+def get_settings() -> Settings:
+    """The current settings snapshot."""
+    return settings_store.current
+
+
+def production() -> bool:
+    return get_settings().environment == "production"
@@ -0,0 +1,412 @@
+# app/coordination.py
+"""
+Cross-worker coordination: ticket events and per-queue counters.
+
+Every worker keeps its own queue index (app.queue_engine) and its own SSE
+subscribers (app.events). The coordinator carries the ticket events of
+each worker to all the others, which apply them to their index and fan
+them out to their lobby screens, and keeps shared counters such as the
+ticket a queue is now serving.
+
+Backends, picked with the ``coordination`` section of config.yaml:
+
+    local   one process (default); nothing leaves the process
+    sqlite  workers on one host share a SQLite file in WAL mode; events
+            are rows polled every ``poll_interval`` seconds
+    redis   workers on any number of hosts share a Redis-compatible
+            server (pub/sub + INCRBY); needs the ``redis`` package
+
+Events and counter updates are delivered to the local process at once
+and written to the backend in batches by a background flusher, so the
+request path never waits on the backend. While the backend is down they
+wait in memory, at most ``MAX_PENDING`` of each; past that the oldest are
+dropped (and counted), so an outage costs other workers some updates
+rather than this one its memory.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiosqlite
+
+from app.events import bus
+
+logger = logging.getLogger("qapp_coordination")
+
+# Identifies this process, so a worker skips its own events coming back
+ORIGIN = uuid.uuid4().hex
+
+# Events, and counter updates, kept for the backend while it cannot be written
+MAX_PENDING = 10_000
+
+# ("incr", key, amount) or ("set", key, value)
+CounterOp = Tuple[str, str, int]
+Deliver = Callable[[List[dict]], None]
+
+
+def now_serving_key(queue_id: int) -> str:
+    return f"now_serving:{queue_id}"
+
+
+def issued_key(queue_id: int) -> str:
+    return f"issued:{queue_id}"
+
+
+def served_key(queue_id: int) -> str:
+    return f"served:{queue_id}"
+
+
+async def _cancel(task: Optional[asyncio.Task]):
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+# -----------------------
+# Backends
+# -----------------------
+class LocalBackend:
+    """Single process: counters in a dict, no event transport."""
+
+    shared = False
+
+    def __init__(self):
+        self._counters: Dict[str, int] = {}
+
+    async def start(self, deliver: Deliver):
+        pass
+
+    async def publish(self, messages: List[dict]):
+        pass
+
+    def apply_now(self, ops: List[CounterOp]):
+        for op, key, value in ops:
+            self._counters[key] = self._counters.get(key, 0) + value if op == "incr" else value
+
+    async def apply(self, ops: List[CounterOp]):
+        self.apply_now(ops)
+
+    async def get(self, keys: List[str]) -> Dict[str, Optional[int]]:
+        return {key: self._counters.get(key) for key in keys}
+
+    async def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """
+    Workers on one host: an append-only event table and a counter table in
+    a shared SQLite file. WAL mode lets every worker poll while one writes.
+    Rows are ordered by their autoincrement id, which is also the global
+    event order.
+    """
+
+    shared = True
+
+    def __init__(self, path: str = "coordination.sqlite3", poll_interval: float = 0.05, retention_seconds: float = 300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._db: Optional[aiosqlite.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+        self._last_id = 0
+
+    async def start(self, deliver: Deliver):
+        # Autocommit: writes take the lock up front (BEGIN IMMEDIATE) in _write,
+        # so a failed write never leaves a transaction open on a stale snapshot
+        self._db = await aiosqlite.connect(self.path, isolation_level=None)
+        await self._db.executescript(
+            "PRAGMA busy_timeout=5000;"
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL,"
+            " payload TEXT NOT NULL, created REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+        )
+        rows = await self._db.execute_fetchall("SELECT COALESCE(MAX(id), 0) FROM events")
+        self._last_id = rows[0][0]
+        self._task = asyncio.create_task(self._poll(deliver))
+
+    async def _write(self, sql: str, rows: List[tuple]):
+        async with self._write_lock:
+            await self._db.execute("BEGIN IMMEDIATE")
+            try:
+                await self._db.executemany(sql, rows)
+            except BaseException:
+                await self._db.execute("ROLLBACK")
+                raise
+            await self._db.execute("COMMIT")
+
+    async def publish(self, messages: List[dict]):
+        created = time.time()
+        await self._write(
+            "INSERT INTO events (origin, payload, created) VALUES (?, ?, ?)",
+            [(message["origin"], json.dumps(message["event"]), created) for message in messages],
+        )
+
+    async def apply(self, ops: List[CounterOp]):
+        # One statement for both ops: "incr" adds to the stored value, "set" replaces it
+        await self._write(
+            "INSERT INTO counters (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET "
+            "value = CASE WHEN ? = 'incr' THEN value + excluded.value ELSE excluded.value END",
+            [(key, value, op) for op, key, value in ops],
+        )
+
+    async def get(self, keys: List[str]) -> Dict[str, Optional[int]]:
+        placeholders = ",".join("?" * len(keys))
+        found = dict(await self._db.execute_fetchall(
+            f"SELECT key, value FROM counters WHERE key IN ({placeholders})", keys
+        ))
+        return {key: found.get(key) for key in keys}
+
+    async def _poll(self, deliver: Deliver):
+        last_prune = time.monotonic()
+        while True:
+            rows = []
+            try:
+                # Read in one call: a SELECT left open across an await would pin an
+                # old snapshot and make the next BEGIN IMMEDIATE fail at once
+                rows = await self._db.execute_fetchall(
+                    "SELECT id, origin, payload FROM events WHERE id > ? ORDER BY id LIMIT 1000", (self._last_id,)
+                )
+                if rows:
+                    self._last_id = rows[-1][0]
+                    deliver([{"origin": origin, "event": json.loads(payload)} for _, origin, payload in rows])
+                if time.monotonic() - last_prune > self.retention_seconds:
+                    await self._write("DELETE FROM events WHERE created < ?", [(time.time() - self.retention_seconds,)])
+                    last_prune = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Coordination poll failed: {e}")
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+
+    async def close(self):
+        await _cancel(self._task)
+        if self._db:
+            await self._db.close()
+
+
+class RedisBackend:
+    """
+    Workers on several hosts: Redis pub/sub for events, INCRBY/SET for
+    counters. ``client`` may be any object with the redis.asyncio API
+    subset used here (publish, pubsub, pipeline, mget, aclose).
+    """
+
+    shared = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", channel: str = "qapp:events",
+                 prefix: str = "qapp:", client: Any = None):
+        self.url = url
+        self.channel = channel
+        self.prefix = prefix
+        self._client = client
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        if self._client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("coordination backend 'redis' needs the redis package (pip install redis)")
+            self._client = redis.from_url(self.url)
+        self._pubsub = self._client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.create_task(self._listen(deliver))
+
+    async def publish(self, messages: List[dict]):
+        # One pub/sub message per flushed batch
+        await self._client.publish(self.channel, json.dumps(messages))
+
+    async def apply(self, ops: List[CounterOp]):
+        pipe = self._client.pipeline(transaction=False)
+        for op, key, value in ops:
+            if op == "incr":
+                pipe.incrby(self.prefix + key, value)
+            else:
+                pipe.set(self.prefix + key, value)
+        await pipe.execute()
+
+    async def get(self, keys: List[str]) -> Dict[str, Optional[int]]:
+        values = await self._client.mget([self.prefix + key for key in keys])
+        return {key: int(value) if value is not None else None for key, value in zip(keys, values)}
+
+    async def _listen(self, deliver: Deliver):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Coordination listen failed: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        await _cancel(self._task)
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def create_backend(config: dict):
+    """Backend for the ``coordination`` section of config.yaml."""
+    options = {key: value for key, value in config.items() if key != "backend"}
+    kind = config.get("backend", "local")
+    if kind == "local":
+        return LocalBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(**options)
+    if kind == "redis":
+        return RedisBackend(**options)
+    raise ValueError(f"Unknown coordination backend: {kind}")
+
+
+# -----------------------
+# Coordinator
+# -----------------------
+class Coordinator:
+    """
+    Front of the backend used by the rest of the app. ``publish``, ``incr``
+    and ``set`` never block: they act locally at once and queue the write
+    for the flusher task.
+    """
+
+    def __init__(self, origin: str = ORIGIN, max_pending: int = MAX_PENDING):
+        self.origin = origin
+        self.max_pending = max_pending
+        self.backend = LocalBackend()
+        self._events: List[dict] = []
+        self._ops: List[CounterOp] = []
+        self._pending = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[dict], None]] = []
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+
+    def on_remote(self, listener: Callable[[dict], None]):
+        """Call ``listener(event)`` for every event published by another worker."""
+        self._listeners.append(listener)
+
+    async def start(self, config: Optional[dict] = None, backend=None):
+        """Connect the backend and start the flusher (call once at startup)."""
+        self.backend = backend or create_backend(config or {})
+        await self.backend.start(self._deliver)
+        self._pending = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info(f"Coordination backend: {type(self.backend).__name__}")
+
+    def publish(self, queue_id: int, event: dict):
+        """Fan a ticket event out to local subscribers now and to other workers soon."""
+        bus.publish(queue_id, event)
+        if self.backend.shared:
+            self._events.append({"origin": self.origin, "event": event})
+            self._trim(self._events)
+            self._pending.set()
+
+    def incr(self, key: str, amount: int = 1):
+        self._counter_op(("incr", key, amount))
+
+    def set(self, key: str, value: int):
+        self._counter_op(("set", key, value))
+
+    def _counter_op(self, op: CounterOp):
+        if not self.backend.shared:
+            self.backend.apply_now([op])
+            return
+        self._ops.append(op)
+        self._trim(self._ops)
+        self._pending.set()
+
+    def _trim(self, buffer: list):
+        """Drop the oldest entries of ``buffer`` beyond ``max_pending``."""
+        excess = len(buffer) - self.max_pending
+        if excess > 0:
+            del buffer[:excess]
+            self.dropped += excess
+
+    async def counters(self, keys: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Current shared values (includes this worker's queued updates once flushed)."""
+        return await self.backend.get(list(keys))
+
+    def _deliver(self, messages: List[dict]):
+        for message in messages:
+            if message["origin"] == self.origin:
+                continue
+            event = message["event"]
+            self.received += 1
+            bus.publish(event["queue_id"], event)
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.error(f"Coordination listener {listener!r} failed: {e}")
+
+    async def flush(self):
+        """Write queued events and counter updates to the backend."""
+        async with self._flush_lock:
+            events, self._events = self._events, []
+            ops, self._ops = self._ops, []
+            try:
+                if events:
+                    await self.backend.publish(events)
+                    self.sent += len(events)
+                    events = []
+                if ops:
+                    await self.backend.apply(ops)
+            except Exception:
+                # Keep what was not written for the next attempt, in order
+                self._events[:0] = events
+                self._ops[:0] = ops
+                self._trim(self._events)
+                self._trim(self._ops)
+                raise
+
+    async def _flush_loop(self):
+        while True:
+            await self._pending.wait()
+            self._pending.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                pending = len(self._events) + len(self._ops)
+                logger.error(f"Coordination flush failed ({pending} pending, {self.dropped} dropped so far): {e}")
+                await asyncio.sleep(1)
+                # Retry what is still queued even if nothing new arrives
+                self._pending.set()
+
+    async def close(self):
+        await _cancel(self._flusher)
+        self._flusher = None
+        await self.flush()
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "origin": self.origin,
+            "sent": self.sent,
+            "received": self.received,
+            "pending": len(self._events) + len(self._ops),
+            "dropped": self.dropped,
+        }
+
+
+# Shared coordinator; local until started with the configured backend
+coordinator = Coordinator()
@@ -1,7 +1,155 @@
-from models import Atendimento, AtendimentoStatus
+import base64
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from tortoise.expressions import Q
+from tortoise.functions import Count
+
+from app.models import Atendimento, AtendimentoStatus
+from app.queue_engine import engine
+from app.coordination import coordinator, issued_key, now_serving_key, served_key
+
+# Waiting tickets shown per queue on the dashboard
+DASHBOARD_TICKETS_PER_QUEUE = 50
 
 async def create_atendimento(queue_id: int, phone: str):
-    return await Atendimento.create(queue_id=queue_id, phone=phone, status=AtendimentoStatus.AGUARDANDO)
+    return await engine.add(queue_id, phone)
 
 async def get_next_atendimento(queue_id: int):
-    return await Atendimento.filter(queue_id=queue_id, status=AtendimentoStatus.AGUARDANDO).first()
+    return engine.peek(queue_id)
+
+async def now_serving(queue_id: int) -> dict:
+    """
+    Shared view of a queue across workers: the ticket being served and the
+    issued/served counters, from the coordination backend. Falls back to
+    the last called ticket in the database when no worker has called one
+    since the counters were created.
+    """
+    keys = (now_serving_key(queue_id), issued_key(queue_id), served_key(queue_id))
+    serving, issued, served = (await coordinator.counters(keys)).values()
+    if serving is None:
+        serving = await Atendimento.filter(
+            queue_id=queue_id, status__in=[AtendimentoStatus.CHAMADO, AtendimentoStatus.ATENDIDO]
+        ).order_by("-updated_at").first().values_list("id", flat=True)
+    return {
+        "queue_id": queue_id,
+        "now_serving": serving,
+        "waiting": engine.depth(queue_id),
+        "issued": issued or 0,
+        "served": served or 0,
+    }
+
+
+async def ticket_position(atendimento_id: int) -> Optional[dict]:
+    """
+    Position and estimated wait of a ticket, for the customer holding it.
+    Waiting tickets are answered by the queue engine; tickets that left
+    the queue come from its recent-tickets cache, and only a ticket that
+    is in neither costs one query (then cached). None if it does not exist.
+    """
+    result = engine.position(atendimento_id)
+    if result is not None:
+        return {"atendimento_id": atendimento_id, "status": AtendimentoStatus.AGUARDANDO.value, **result}
+    left = engine.recent.get(atendimento_id)
+    if left is None:
+        row = await Atendimento.filter(id=atendimento_id).first().values_list("queue_id", "status")
+        if row is None:
+            return None
+        left = (row[0], AtendimentoStatus(row[1]))
+        if left[1] != AtendimentoStatus.AGUARDANDO:
+            engine.recent.set(atendimento_id, left)
+    queue_id, status = left
+    return {
+        "atendimento_id": atendimento_id,
+        "status": status.value,
+        "queue_id": queue_id,
+        "position": None,
+        "ahead": None,
+        "waiting": engine.depth(queue_id),
+        "service_seconds": None,
+        "eta_seconds": None,
+        "estimated_call_at": None,
+    }
+
+
+async def queue_status_counts(queue_id: int):
+    """
+    Number of atendimentos per status in a queue (one GROUP BY query).
+    """
+    rows = await Atendimento.filter(queue_id=queue_id).group_by("status").annotate(
+        count=Count("id")
+    ).values("status", "count")
+    return {getattr(row["status"], "value", row["status"]): row["count"] for row in rows}
+
+
+# -----------------------
+# Keyset-paginated listing
+# -----------------------
+ATENDIMENTO_FIELDS = (
+    "id", "queue_id", "organization_id", "phone", "status", "atendente_id", "created_at", "updated_at"
+)
+
+
+def encode_cursor(created_at: datetime, atendimento_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{atendimento_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, atendimento_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(atendimento_id)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def filter_atendimentos(
+    queue_id: Optional[int] = None,
+    status: Optional[AtendimentoStatus] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    organization_id: Optional[int] = None,
+):
+    query = Atendimento.all()
+    if organization_id is not None:
+        query = query.filter(organization_id=organization_id)
+    if queue_id is not None:
+        query = query.filter(queue_id=queue_id)
+    if status is not None:
+        query = query.filter(status=status)
+    if since is not None:
+        query = query.filter(created_at__gte=since)
+    if until is not None:
+        query = query.filter(created_at__lt=until)
+    return query
+
+
+async def atendimentos_page(query, cursor: Optional[str] = None, limit: int = 100) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of rows ordered by (created_at, id), starting after ``cursor``.
+    Returns the rows and the cursor of the next page (None on the last page).
+    """
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = query.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=last_id))
+    rows = await query.order_by("created_at", "id").limit(limit + 1).values(*ATENDIMENTO_FIELDS)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+
+async def iter_atendimentos(query, chunk_size: int = 1000) -> AsyncIterator[dict]:
+    """
+    Every row of ``query`` in (created_at, id) order, fetched ``chunk_size``
+    rows at a time so memory stays bounded whatever the table size.
+    """
+    cursor = None
+    while True:
+        rows, cursor = await atendimentos_page(query, cursor, chunk_size)
+        for row in rows:
+            yield row
+        if cursor is None:
+            return
@@ -0,0 +1,116 @@
+# app/events.py
+"""
+In-process pub/sub for ticket state changes.
+
+The queue engine publishes one event per add/next/cancel; each open lobby
+screen holds a subscription to its queue and receives the change as a
+Server-Sent Event. Nothing here touches the database, so the number of
+open screens does not change DB load.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Set
+
+from fastapi.responses import StreamingResponse
+
+from app.templating import get_template
+
+logger = logging.getLogger("qapp_events")
+
+# Event types, also used as SSE event names (sse-swap="...")
+ADDED = "added"
+CALLED = "called"
+CANCELLED = "cancelled"
+
+KEEPALIVE_SECONDS = 15
+
+
+class EventBus:
+    """
+    Fan-out of queue events to per-queue subscribers.
+
+    Every subscriber gets a bounded asyncio.Queue; a subscriber that falls
+    ``max_pending`` events behind loses its oldest events rather than
+    holding memory for a dead connection.
+    """
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+
+    def publish(self, queue_id: int, event: dict):
+        """Deliver an event to every subscriber of a queue (never blocks)."""
+        for inbox in self._subscribers.get(queue_id, ()):
+            if inbox.full():
+                inbox.get_nowait()
+            inbox.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, queue_id: int) -> AsyncIterator[asyncio.Queue]:
+        inbox: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        self._subscribers[queue_id].add(inbox)
+        try:
+            yield inbox
+        finally:
+            self._subscribers[queue_id].discard(inbox)
+            if not self._subscribers[queue_id]:
+                del self._subscribers[queue_id]
+
+
+# Shared bus; the queue engine publishes to it
+bus = EventBus()
+
+
+def ticket_event(event_type: str, atendimento) -> dict:
+    """Plain-data event for a ticket state change."""
+    return {
+        "type": event_type,
+        "id": atendimento.id,
+        "queue_id": atendimento.queue_id,
+        "phone": atendimento.phone,
+        "status": getattr(atendimento.status, "value", atendimento.status),
+        "atendente_id": atendimento.atendente_id,
+        "created_at": atendimento.created_at.isoformat() if atendimento.created_at else None,
+    }
+
+
+# -----------------------
+# Server-Sent Events
+# -----------------------
+def _sse(event_type: str, data: str) -> str:
+    lines = "".join(f"data: {line}\n" for line in data.splitlines() or [""])
+    return f"event: {event_type}\n{lines}\n"
+
+
+def render_event(event: dict) -> str:
+    """
+    Render an event as the HTML delta the lobby template swaps in:
+    "added" appends a ticket row, "called" replaces the now-serving banner
+    and drops the row, "cancelled" only drops the row (out-of-band delete).
+    """
+    return get_template("ticket_event.html").render(event=event)
+
+
+async def event_stream(queue_id: int) -> AsyncIterator[str]:
+    async with bus.subscribe(queue_id) as inbox:
+        yield ": connected\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(inbox.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _sse(event["type"], render_event(event))
+            yield _sse("ticket", json.dumps(event))
+
+
+def sse_response(queue_id: int) -> StreamingResponse:
+    """StreamingResponse carrying the event stream of one queue."""
+    return StreamingResponse(
+        event_stream(queue_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,155 @@
+# app/fragments.py
+"""
+Rendered HTML fragments of the HTMX pages, cached by queue state.
+
+A queue's section (queue_section.html: the dashboard block of one queue,
+also served alone as the queue's panel) is rendered once per state of the
+queue. The cache key carries the queue's version from the queue engine,
+which changes whenever a ticket of the queue is added, called or
+cancelled, in this worker or in another one (their events arrive through
+app.coordination). Nothing else invalidates an entry: an old version is
+never asked for again and ages out of the LRU.
+
+Responses carry an ETag computed from the rendered HTML, so every worker
+gives the same content the same tag, and ``Cache-Control: no-cache`` so
+browsers revalidate each refresh. A refresh whose If-None-Match still
+matches costs no rendering and no body: 304.
+
+The queue list itself (names, the set of queues) is read at most every
+``QUEUE_LIST_SECONDS`` per worker, and dropped at once on local changes.
+"""
+import hashlib
+from typing import Callable, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import HTMLResponse
+from markupsafe import Markup
+
+from app.cache import TTLCache
+from app.crud import DASHBOARD_TICKETS_PER_QUEUE
+from app.models import Queue
+from app.queue_engine import engine
+from app.templating import get_template
+
+# How long a worker reuses the queue list before reading it again
+QUEUE_LIST_SECONDS = 5
+# Refresh interval of a polling queue panel
+PANEL_POLL_SECONDS = 5
+
+
+class Fragment(NamedTuple):
+    html: str
+    etag: str
+
+
+def _etag(data: str) -> str:
+    return '"' + hashlib.blake2b(data.encode(), digest_size=12).hexdigest() + '"'
+
+
+class FragmentCache:
+    """
+    LRU of rendered templates by (template, key). Keys must change with
+    anything the fragment shows; entries are never invalidated.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        # Entries are never stale (the key says which state they show), so
+        # the TTL only bounds how long an unused entry holds memory
+        self._cache = TTLCache(maxsize=maxsize, ttl=3600)
+        self.renders = 0
+        self.not_modified = 0
+
+    def get(self, template: str, key: Hashable, context: Callable[[], dict]) -> Fragment:
+        """The fragment for ``key``; ``context`` is only called to render a miss."""
+        cache_key = (template, key)
+        fragment = self._cache.get(cache_key)
+        if fragment is None:
+            html = get_template(template).render(**context())
+            fragment = Fragment(html, _etag(html))
+            self._cache.set(cache_key, fragment)
+            self.renders += 1
+        return fragment
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "renders": self.renders, "not_modified": self.not_modified}
+
+
+fragments = FragmentCache()
+_queue_list = TTLCache(maxsize=1, ttl=QUEUE_LIST_SECONDS)
+
+
+async def queue_list() -> List[Queue]:
+    queues = _queue_list.get("queues")
+    if queues is None:
+        queues = await Queue.all().order_by("id")
+        _queue_list.set("queues", queues)
+    return queues
+
+
+def forget_queue_list():
+    """Call after creating, renaming or deleting a queue."""
+    _queue_list.clear()
+
+
+def queue_section(queue: Queue, live: bool = True) -> Fragment:
+    """A queue's section, rendered once per (queue state, name)."""
+    key = (queue.id, queue.name, engine.version(queue.id), live)
+    return fragments.get("queue_section.html", key, lambda: {
+        "item": {
+            "queue": queue,
+            "atendimentos": engine.waiting(queue.id, limit=DASHBOARD_TICKETS_PER_QUEUE),
+            "total": engine.depth(queue.id),
+        },
+        "live": live,
+        "poll_seconds": PANEL_POLL_SECONDS,
+    })
+
+
+async def dashboard() -> Tuple[Sequence[Fragment], str]:
+    """Sections of every queue and the ETag of the page made of them."""
+    sections = [queue_section(queue) for queue in await queue_list()]
+    return sections, _etag("".join(section.etag for section in sections))
+
+
+async def panel(queue_id: int) -> Optional[Fragment]:
+    """The polling section of one queue; None when there is no such queue."""
+    for queue in await queue_list():
+        if queue.id == queue_id:
+            return queue_section(queue, live=False)
+    return None
+
+
+def render(template: str, **context) -> str:
+    """Render a one-off fragment (compiled once, never cached)."""
+    return get_template(template).render(**context)
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in tags or "*" in tags
+
+
+def fragment_response(request: Request, etag: str, body) -> Response:
+    """
+    304 when the client already has ``etag``, else the HTML. ``body`` is
+    the HTML or a callable producing it, called only when needed.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request, etag):
+        fragments.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(body() if callable(body) else body, headers=headers)
+
+
+async def dashboard_response(request: Request) -> Response:
+    """The dashboard page, assembled from cached sections (or 304)."""
+    sections, etag = await dashboard()
+    return fragment_response(request, etag, lambda: fragments.get(
+        "fila.html", etag, lambda: {"sections": [Markup(section.html) for section in sections]}
+    ).html)
@@ -0,0 +1,97 @@
+# app/hashing.py
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Optional
+
+from fastapi import HTTPException
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+# -----------------------
+# Password hashing setup
+# -----------------------
+_pwd_context: Optional["CryptContext"] = None
+
+def pwd_context() -> "CryptContext":
+    """The bcrypt context, built (and passlib imported) on first use"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+def hash_password(password: str) -> str:
+    """Hash a plain password (blocking, ~100-300 ms)"""
+    return pwd_context().hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash (blocking, ~100-300 ms)"""
+    return pwd_context().verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded worker pool so it never blocks the event loop.
+
+    At most ``max_workers`` hashes run at once; further requests wait for a
+    slot. ``waiting`` is the current queue depth. When ``max_queue`` is set
+    and that many requests are already waiting, new ones are rejected with
+    503 instead of piling up behind a login storm.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: Optional[int] = None, use_processes: bool = False):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self.waiting = 0
+        self.running = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_started(self):
+        # Created lazily, inside the running loop and after any worker fork
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+    async def _run(self, func: Callable, *args):
+        self._ensure_started()
+        if self.max_queue is not None and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many concurrent logins, try again")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._slots = None
@@ -0,0 +1,39 @@
+# app/leases.py
+"""
+Database-backed leases: a named lock with an expiry, used so that a
+periodic job started in every app worker actually runs in only one of them.
+A holder that dies simply lets its lease expire.
+"""
+import os
+import socket
+from datetime import timedelta
+
+from tortoise import timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+
+from app.models import Lease
+
+
+def default_holder() -> str:
+    """Identifies this worker process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def acquire_lease(name: str, holder: str, ttl_seconds: float) -> bool:
+    """
+    Take (or renew) the lease ``name`` for ``ttl_seconds``.
+    Returns False while another holder's lease is still valid.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    taken = await Lease.filter(
+        Q(name=name) & (Q(holder=holder) | Q(expires_at__lt=now))
+    ).update(holder=holder, expires_at=expires_at)
+    if taken:
+        return True
+    try:
+        await Lease.create(name=name, holder=holder, expires_at=expires_at)
+    except IntegrityError:
+        return False
+    return True
@@ -0,0 +1,192 @@
+# app/mailer.py
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+# aiosmtplib and the email package are imported by the first send: web
+# workers only enqueue notifications, the outbox dispatcher sends them
+if TYPE_CHECKING:
+    import aiosmtplib
+
+logger = logging.getLogger("qapp_mailer")
+
+
+class SMTPConfigError(ValueError):
+    """The ``smtp`` section of config.yaml is missing or incomplete."""
+
+
+class _Connection:
+    """An authenticated SMTP session and how many messages it has carried."""
+
+    def __init__(self, client: "aiosmtplib.SMTP"):
+        self.client = client
+        self.sent = 0
+
+
+class SMTPPool:
+    """
+    Bounded pool of authenticated SMTP sessions.
+
+    At most ``max_connections`` sessions are open (and therefore at most that
+    many messages in flight). Idle sessions are reused, so TLS and login are
+    paid once per session instead of once per message. A session is retired
+    after ``max_messages_per_connection`` messages, since many providers cap
+    messages per connection.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: bool = False,
+        ssl: bool = False,
+        from_email: str = "noreply@qapp.com",
+        max_connections: int = 4,
+        max_messages_per_connection: int = 100,
+        timeout: float = 30,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls  # STARTTLS, as in the original smtplib setup
+        self.ssl = ssl  # implicit TLS (port 465)
+        self.from_email = from_email
+        self.max_connections = max_connections
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: List[_Connection] = []
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    @classmethod
+    def from_config(cls, smtp_config: dict) -> "SMTPPool":
+        """Build a pool from the ``smtp`` section of config.yaml."""
+        missing = [key for key in ("host", "port") if not smtp_config.get(key)]
+        if missing:
+            raise SMTPConfigError(f"SMTP is not configured: set smtp.{' and smtp.'.join(missing)} in config.yaml")
+        return cls(
+            host=smtp_config["host"],
+            port=smtp_config["port"],
+            username=smtp_config.get("username"),
+            password=smtp_config.get("password"),
+            use_tls=smtp_config.get("use_tls", False),
+            ssl=smtp_config.get("ssl", False),
+            from_email=smtp_config.get("from_email", "noreply@qapp.com"),
+            max_connections=smtp_config.get("pool_size", 4),
+            max_messages_per_connection=smtp_config.get("max_messages_per_connection", 100),
+            timeout=smtp_config.get("timeout", 30),
+        )
+
+    # -----------------------
+    # Sending
+    # -----------------------
+    async def send(self, to_email: str, subject: str, content: str):
+        """
+        Send one plain-text message, reusing an idle session when possible.
+        A reused session that turns out to be dead is replaced once.
+        """
+        from email.mime.text import MIMEText
+        from aiosmtplib import SMTPServerDisconnected
+
+        msg = MIMEText(content)
+        msg["Subject"] = subject
+        msg["From"] = self.from_email
+        msg["To"] = to_email
+
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                try:
+                    await self._send_on(conn, msg)
+                except SMTPServerDisconnected:
+                    conn = None
+            if conn is None:
+                conn = await self._open()
+                await self._send_on(conn, msg)
+            conn.sent += 1
+            self.messages_sent += 1
+            if conn.sent >= self.max_messages_per_connection:
+                await self._discard(conn)
+            else:
+                self._idle.append(conn)
+
+    async def close(self):
+        """Close every idle session."""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._discard(conn)
+
+    # -----------------------
+    # Internals
+    # -----------------------
+    async def _open(self) -> _Connection:
+        import aiosmtplib
+
+        client = aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            username=self.username or None,
+            password=self.password or None,
+            use_tls=self.ssl,
+            start_tls=bool(self.use_tls),
+            timeout=self.timeout,
+        )
+        await client.connect()
+        self.connections_opened += 1
+        return _Connection(client)
+
+    async def _send_on(self, conn: _Connection, msg):
+        """
+        Send ``msg`` on ``conn``. When it fails the session goes back to the
+        idle list if the server only refused this message (the client has
+        reset the envelope), and is closed on any other error.
+        """
+        from aiosmtplib import SMTPRecipientsRefused, SMTPResponseException
+
+        try:
+            await conn.client.send_message(msg)
+        except (SMTPRecipientsRefused, SMTPResponseException):
+            if conn.client.is_connected:
+                self._idle.append(conn)
+            else:
+                await self._discard(conn)
+            raise
+        except BaseException:
+            await self._discard(conn)
+            raise
+
+    async def _discard(self, conn: _Connection):
+        try:
+            await conn.client.quit()
+        except Exception:
+            conn.client.close()
+
+
+# -----------------------
+# Shared pools, one per SMTP configuration
+# -----------------------
+_pools: Dict[Tuple, SMTPPool] = {}
+
+
+def get_pool(smtp_config: dict) -> SMTPPool:
+    """
+    Return the shared pool for an ``smtp`` config section, creating it on first use.
+    """
+    key = tuple(sorted((k, str(v)) for k, v in smtp_config.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = SMTPPool.from_config(smtp_config)
+    return pool
+
+
+async def close_pools():
+    """Close all shared pools (call at shutdown)."""
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        await pool.close()
@@ -1,53 +1,134 @@
-from fastapi import FastAPI, Request, BackgroundTasks
+# Time the imports below as the first startup phase (see app.startup)
+from app.startup import startup_timer
+startup_timer.begin("imports")
+
+import asyncio
+from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from tortoise.contrib.fastapi import register_tortoise
-import yaml
 
 # Import routers
-from app.routers import queue, atendimentos, users
-from app.utils import send_email
+from routers import queue, atendimentos, users, organizations
+from app.outbox import enqueue_email
+from app.queue_engine import engine
+from app.coordination import coordinator
+from app.fragments import dashboard_response
+from app.migrations import migrate
+from app.analytics import recorder
+from app.tasks import periodic_email_reminder
+from app.messages import message_templates
+from app.templating import compile_templates
+from app.config import get_settings, production, settings_store
+from app.database import tortoise_config
+from app.metrics import MetricsMiddleware, instrument_db, metrics_endpoint
+from app.auth import revocations
 
 app = FastAPI(title="qApp – Queue Management SaaS via Email")
-templates = Jinja2Templates(directory="app/templates")
-
-# Load config
-with open("app/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
+app.add_middleware(MetricsMiddleware)
+app.add_api_route("/metrics", metrics_endpoint, include_in_schema=False)
 
 # Include routers
 app.include_router(queue.router, prefix="/queue", tags=["queue"])
 app.include_router(atendimentos.router, prefix="/atendimentos", tags=["atendimentos"])
 app.include_router(users.router, prefix="/users", tags=["users"])
+app.include_router(organizations.router, prefix="/organizations", tags=["organizations"])
 
 # Dashboard route
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """
-    Render main dashboard with all queues and pending atendimentos.
+    Render main dashboard with all queues and their first pending atendimentos,
+    assembled from per-queue fragments cached by queue state (304 if unchanged).
     """
-    from app.models import Queue, Atendimento, AtendimentoStatus
-    queues = await Queue.all().prefetch_related("atendimentos")
-    queue_data = []
-    for q in queues:
-        pending = await q.atendimentos.filter(status=AtendimentoStatus.AGUARDANDO)
-        queue_data.append({"queue": q, "pending": pending})
-    return templates.TemplateResponse("fila.html", {"request": request, "queues": queue_data})
-
-# Example background email task
+    return await dashboard_response(request)
+
+# Example queued email notification
 @app.post("/notify/{email}")
-async def notify(email: str, message: str, background_tasks: BackgroundTasks):
+async def notify(email: str, message: str):
     """
-    Send a test notification via email in the background.
+    Queue a test notification for the outbox dispatcher.
     """
-    background_tasks.add_task(send_email, to_email=email, subject="qApp Notification", content=message)
+    await enqueue_email(email, "qApp Notification", message)
     return {"status": "email scheduled"}
 
 # Tortoise ORM setup
 register_tortoise(
     app,
-    db_url=config.get("database_url", "sqlite://db.sqlite3"),
-    modules={"models": ["app.models"]},
-    generate_schemas=True,
+    config=tortoise_config(),
+    generate_schemas=False,  # schema is managed by app.migrations
     add_exception_handlers=True
 )
+app.router.lifespan_context = startup_timer.lifespan(app.router.lifespan_context)
+
+# Create missing tables and indexes on new and existing databases (in
+# production only pending migrations: the deploy runs python -m app.migrations)
+@app.on_event("startup")
+async def apply_migrations():
+    startup_timer.begin("migrations")
+    await migrate(generate_schemas=not production())
+
+# Count and time DB queries for /metrics
+@app.on_event("startup")
+async def start_db_metrics():
+    instrument_db()
+
+# Join the other workers (events, shared counters), then rebuild the
+# in-memory queue index once the ORM is up
+@app.on_event("startup")
+async def rebuild_queue_engine():
+    startup_timer.begin("coordination")
+    await coordinator.start(get_settings().coordination)
+    startup_timer.begin("queue_engine")
+    await engine.rebuild()
+
+# Compile the page and notification templates before the first request
+@app.on_event("startup")
+async def warm_templates():
+    startup_timer.begin("templates")
+    compile_templates()
+    message_templates.compile_all()
+
+# Reload config.yaml on SIGHUP (and on change, if config_watch_interval is set)
+@app.on_event("startup")
+async def start_config_reload():
+    startup_timer.begin("background")
+    app.state.config_watch = settings_store.start()
+
+# Fold call statistics into the analytics rollup every few seconds
+@app.on_event("startup")
+async def start_rollup_flush():
+    app.state.rollup_task = asyncio.create_task(recorder.run())
+
+# Keep the in-memory token revocation set in sync with the other workers
+@app.on_event("startup")
+async def start_revocation_sync():
+    await revocations.sync()
+    app.state.revocation_task = asyncio.create_task(revocations.run(get_settings().revocation_sync_seconds))
+
+# Remind waiting tickets; a lease keeps it to one worker per pass
+@app.on_event("startup")
+async def start_reminders():
+    reminders = get_settings().reminders
+    app.state.reminder_task = None
+    if reminders.get("enabled"):
+        app.state.reminder_task = asyncio.create_task(periodic_email_reminder(
+            reminders.get("interval_seconds", 3600), reminders.get("chunk_size", 1000)
+        ))
+
+# Log how long each phase took (also on /metrics)
+@app.on_event("startup")
+async def report_startup():
+    startup_timer.finish()
+
+@app.on_event("shutdown")
+async def flush_rollups():
+    if app.state.config_watch:
+        app.state.config_watch.cancel()
+    if app.state.reminder_task:
+        app.state.reminder_task.cancel()
+    app.state.revocation_task.cancel()
+    app.state.rollup_task.cancel()
+    await recorder.flush()
+    await coordinator.close()
+
+startup_timer.end()
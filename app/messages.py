@@ -0,0 +1,188 @@
+# app/messages.py
+"""
+Notification texts.
+
+Every MessageType has a subject and a body template (Jinja, rendered with
+``atendimento`` in the context). The defaults below can be overridden in
+config.yaml under ``mensagens``, and again per organization under
+``mensagens.organizacoes.<organization>``. A plain string replaces only
+the body:
+
+    mensagens:
+      chamada: "Chegou a sua vez! Dirija-se ao guichê."
+      entrada:
+        subject: "Você entrou na fila"
+        body: "Senha {{ atendimento.id }} registada na fila {{ atendimento.queue_id }}."
+      organizacoes:
+        clinica-centro:
+          chamada: "Senha {{ atendimento.id }}: dirija-se à recepção."
+
+A configuration is compiled as a whole, every message type of every
+organization, before it replaces the current one: when a template does not
+compile, the error is logged and the texts in use stay (the defaults, if
+config.yaml was already wrong at startup), as with an invalid config.yaml
+on reload. The compiled templates are then reused. Jinja itself is only
+imported by the first compile; web workers compile the configured
+templates at startup (``compile_all``).
+"""
+import json
+import logging
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from app.config import get_settings, settings_store
+from app.models import MessageType
+
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+
+logger = logging.getLogger("qapp_messages")
+
+DEFAULT_MESSAGES: Dict[MessageType, Dict[str, str]] = {
+    MessageType.ENTRADA: {
+        "subject": "qApp Queue Notification",
+        "body": "You have been added to the queue: {{ atendimento.id }} in queue {{ atendimento.queue_id }}",
+    },
+    MessageType.CHAMADA: {
+        "subject": "qApp Queue Update",
+        "body": "You are now being served: Atendimento {{ atendimento.id }} in queue {{ atendimento.queue_id }}",
+    },
+    MessageType.CANCELAMENTO: {
+        "subject": "qApp Queue Update",
+        "body": "Atendimento {{ atendimento.id }} in queue {{ atendimento.queue_id }} was cancelled",
+    },
+    MessageType.LEMBRETE: {
+        "subject": "qApp Queue Reminder",
+        "body": "Reminder: You are still in the queue. Atendimento {{ atendimento.id }}",
+    },
+}
+
+# (subject, body)
+Compiled = Tuple["Template", "Template"]
+
+
+class MessageTemplates:
+    """
+    Registry of compiled notification templates.
+    """
+
+    def __init__(self, source: Optional[dict] = None):
+        self._env: Optional["Environment"] = None
+        self._compiled: Dict[Tuple[Optional[str], MessageType], Compiled] = {}
+        self._source: dict = {}
+        self._fingerprint: Optional[str] = json.dumps({})
+        # Configuration given before the first compile, checked by it
+        self._unchecked: Optional[dict] = source or None
+        self.compiles = 0
+
+    def configure(self, source: dict) -> bool:
+        """
+        Use a new ``mensagens`` config section. Its templates are all
+        compiled first; if one fails the current ones are kept. Returns
+        whether the templates changed.
+        """
+        self._unchecked = None
+        fingerprint = json.dumps(source, sort_keys=True, default=str)
+        if fingerprint == self._fingerprint:
+            return False
+        candidate = json.loads(fingerprint)
+        try:
+            compiled = self._compile_set(candidate)
+        except Exception as e:
+            logger.error(f"Invalid notification templates in config, keeping the current ones: {e}")
+            return False
+        self._source, self._fingerprint, self._compiled = candidate, fingerprint, compiled
+        return True
+
+    def invalidate(self, organization: Optional[str] = None):
+        """Forget the compiled templates of one organization (all when None)."""
+        if organization is None:
+            self._compiled.clear()
+            return
+        for key in [key for key in self._compiled if key[0] == organization]:
+            del self._compiled[key]
+
+    def _environment(self) -> "Environment":
+        if self._env is None:
+            from jinja2 import Environment
+            # Plain-text emails: no HTML autoescaping
+            self._env = Environment(autoescape=False, keep_trailing_newline=True)
+        return self._env
+
+    @staticmethod
+    def _spec(source: dict, message_type: MessageType, organization: Optional[str]) -> Dict[str, str]:
+        spec = dict(DEFAULT_MESSAGES[message_type])
+        layers = [source]
+        if organization:
+            layers.append(source.get("organizacoes", {}).get(organization, {}))
+        for layer in layers:
+            value = layer.get(message_type.value)
+            if isinstance(value, str):
+                spec["body"] = value
+            elif isinstance(value, dict):
+                spec.update({part: value[part] for part in ("subject", "body") if part in value})
+        return spec
+
+    def _compile(self, source: dict, message_type: MessageType, organization: Optional[str]) -> Compiled:
+        spec = self._spec(source, message_type, organization)
+        env = self._environment()
+        compiled = (env.from_string(spec["subject"]), env.from_string(spec["body"]))
+        self.compiles += 1
+        return compiled
+
+    def _compile_set(self, source: dict) -> Dict[Tuple[Optional[str], MessageType], Compiled]:
+        """
+        The templates of the shared texts and of every organization with
+        overrides in ``source``; raises if any of them does not compile.
+        """
+        compiled = {}
+        for organization in [None, *source.get("organizacoes", {})]:
+            for message_type in MessageType:
+                try:
+                    compiled[organization, message_type] = self._compile(source, message_type, organization)
+                except Exception as e:
+                    where = f"organizacoes.{organization}.{message_type.value}" if organization else message_type.value
+                    raise ValueError(f"mensagens.{where}: {e}") from e
+        return compiled
+
+    def get(self, message_type: MessageType, organization: Optional[str] = None) -> Compiled:
+        if self._unchecked is not None:
+            self.configure(self._unchecked)
+        key = (organization, message_type)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            # An organization without overrides, or one dropped by invalidate
+            compiled = self._compiled[key] = self._compile(self._source, message_type, organization)
+        return compiled
+
+    def compile_all(self) -> int:
+        """
+        Compile the shared templates and those of every organization with
+        overrides in the configuration; returns the number of pairs.
+        """
+        if self._unchecked is not None:
+            self.configure(self._unchecked)
+        organizations = [None, *self._source.get("organizacoes", {})]
+        for organization in organizations:
+            for message_type in MessageType:
+                self.get(message_type, organization)
+        return len(organizations) * len(MessageType)
+
+    def render(self, message_type: MessageType, context: dict, organization: Optional[str] = None) -> Tuple[str, str]:
+        """Subject and body of one message."""
+        subject, body = self.get(message_type, organization)
+        return subject.render(context), body.render(context)
+
+    def render_many(
+        self, message_type: MessageType, contexts: Iterable[dict], organization: Optional[str] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Subjects and bodies of many messages of the same type, looking the
+        templates up once for the whole batch.
+        """
+        subject, body = self.get(message_type, organization)
+        return [(subject.render(context), body.render(context)) for context in contexts]
+
+
+# Shared registry, configured from config.yaml and refreshed on reload
+message_templates = MessageTemplates(get_settings().mensagens)
+settings_store.subscribe(lambda settings: message_templates.configure(settings.mensagens))
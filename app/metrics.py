@@ -0,0 +1,395 @@
+# app/metrics.py
+"""
+Prometheus metrics.
+
+``MetricsMiddleware`` (pure ASGI) times every request with perf_counter
+and counts the DB queries it ran; ``instrument_db`` wraps the Tortoise
+client's execute methods to do the counting. Queue depth and outbox
+backlog are sampled when ``/metrics`` is scraped, so they cost nothing
+between scrapes.
+
+Metrics are per process: with several workers, scrape each one (or run
+one worker per metrics port).
+"""
+import bisect
+import contextvars
+import functools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from fastapi.responses import PlainTextResponse
+from starlette.routing import Mount, compile_path
+from tortoise import Tortoise, timezone
+from tortoise.backends.base.client import BaseDBAsyncClient, ConnectionWrapper, PoolConnectionWrapper
+from tortoise.functions import Count, Min
+
+from app.database import pool_stats
+from app.fragments import fragments
+from app.models import Outbox, OutboxStatus
+from app.queue_engine import engine
+from app.startup import startup_timer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, labels: tuple = (), value: float = 0):
+        self.values[labels] = value
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [0] * (len(self.buckets) + 2)
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, entry in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), entry):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {entry[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics of this process plus async collectors run at scrape time.
+    """
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], Awaitable[None]]):
+        self.collectors.append(func)
+        return func
+
+    async def render(self) -> str:
+        for collect in self.collectors:
+            await collect()
+        lines = []
+        for metric in self.metrics:
+            lines += metric.header()
+            lines += metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_duration = registry.register(Histogram(
+    "qapp_http_request_duration_seconds", "Request latency by route", ("method", "route"),
+))
+http_responses = registry.register(Counter(
+    "qapp_http_responses_total", "Responses by route and status", ("method", "route", "status"),
+))
+http_in_flight = registry.register(Gauge(
+    "qapp_http_requests_in_flight", "Requests being handled (open streams included)",
+))
+http_db_queries = registry.register(Histogram(
+    "qapp_http_request_db_queries", "DB queries run per request", ("route",), QUERY_COUNT_BUCKETS,
+))
+http_db_seconds = registry.register(Counter(
+    "qapp_http_request_db_seconds_total", "Time spent in DB queries by route", ("route",),
+))
+db_duration = registry.register(Histogram(
+    "qapp_db_query_duration_seconds", "DB query latency", buckets=QUERY_BUCKETS,
+))
+db_pool_wait = registry.register(Histogram(
+    "qapp_db_pool_wait_seconds", "Time spent waiting for a DB connection (SQLite: the connection lock)",
+    buckets=QUERY_BUCKETS,
+))
+db_pool_connections = registry.register(Gauge(
+    "qapp_db_pool_connections", "Open and idle DB pool connections", ("state",),
+))
+queue_depth = registry.register(Gauge(
+    "qapp_queue_depth", "Waiting tickets per queue", ("queue_id",),
+))
+outbox_backlog = registry.register(Gauge(
+    "qapp_outbox_backlog", "Outbox messages not yet delivered", ("status",),
+))
+fragment_cache = registry.register(Counter(
+    "qapp_fragment_cache_total", "HTMX fragment lookups: cache hits, renders, 304 answers", ("result",),
+))
+outbox_oldest = registry.register(Gauge(
+    "qapp_outbox_oldest_due_seconds", "How overdue the oldest pending outbox message is",
+))
+startup_phase = registry.register(Gauge(
+    "qapp_startup_phase_seconds", "Time this worker spent in each startup phase", ("phase",),
+))
+
+
+# -----------------------
+# HTTP
+# -----------------------
+# [queries, seconds] of the request being handled; None outside requests
+_request_db: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("request_db", default=None)
+
+
+def route_templates(routes, prefix: str = "", found: Optional[Dict[int, List[str]]] = None) -> Dict[int, List[str]]:
+    """
+    Full path template of every route, by id of the route object.
+
+    ``scope["route"]`` is the route as declared on its APIRouter: depending
+    on the FastAPI version its ``path`` may lack the include_router prefix
+    (included routers are kept as a branch carrying the prefix instead of
+    copied into app.routes), so the prefixes are collected by walking the
+    tree. A route included under several prefixes gets several templates.
+    """
+    found = {} if found is None else found
+    for route in routes:
+        router = getattr(route, "original_router", None)
+        if router is not None:  # included router branch
+            route_templates(router.routes, prefix + route.include_context.prefix, found)
+        elif isinstance(route, Mount):
+            route_templates(route.routes, prefix + route.path, found)
+        elif getattr(route, "path_format", None) is not None:
+            found.setdefault(id(route), []).append(prefix + route.path_format)
+    return found
+
+
+def _route_label(scope, templates: Dict[int, List[str]]) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "<unmatched>"
+    candidates = templates.get(id(route))
+    if not candidates:
+        return route.path
+    if len(candidates) > 1:
+        for template in candidates:
+            if compile_path(template)[0].match(scope["path"]):
+                return template
+    return candidates[0]
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware task/queue overhead).
+    The route label is the matched path template, router prefix included,
+    so /queue/1 and /queue/2 share one series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._templates: Optional[Dict[int, List[str]]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            _request_db.reset(token)
+            if self._templates is None:
+                # Routes are all declared before the first request
+                self._templates = route_templates(scope["app"].routes)
+            route = _route_label(scope, self._templates)
+            method = scope["method"]
+            http_duration.observe(elapsed, (method, route))
+            http_responses.inc((method, route, status[0]))
+            http_db_queries.observe(db[0], (route,))
+            if db[0]:
+                http_db_seconds.inc((route,), db[1])
+
+
+async def metrics_endpoint() -> PlainTextResponse:
+    """``/metrics`` in Prometheus text format."""
+    return PlainTextResponse(await registry.render(), media_type=CONTENT_TYPE)
+
+
+# -----------------------
+# Database
+# -----------------------
+_EXECUTE_METHODS = (
+    "execute_insert", "execute_many", "execute_query", "execute_query_dict",
+    "execute_query_dict_with_affected", "execute_script",
+)
+# Set while an instrumented call runs, so nested execute_* calls count once
+_in_query: contextvars.ContextVar[bool] = contextvars.ContextVar("in_query", default=False)
+
+
+def _timed(method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        if _in_query.get():
+            return await method(*args, **kwargs)
+        token = _in_query.set(True)
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _in_query.reset(token)
+            db_duration.observe(elapsed)
+            db = _request_db.get()
+            if db is not None:
+                db[0] += 1
+                db[1] += elapsed
+
+    wrapper._qapp_timed = True
+    return wrapper
+
+
+def _timed_acquire(method):
+    @functools.wraps(method)
+    async def wrapper(self):
+        start = time.perf_counter()
+        connection = await method(self)
+        db_pool_wait.observe(time.perf_counter() - start)
+        return connection
+
+    wrapper._qapp_timed = True
+    return wrapper
+
+
+def _subclasses(cls) -> List[type]:
+    found = [cls]
+    for sub in cls.__subclasses__():
+        found += _subclasses(sub)
+    return found
+
+
+def instrument_db(connection_name: str = "default"):
+    """
+    Time every query of the backend behind ``connection_name``: wraps the
+    execute methods of its client class and of subclasses such as the
+    transaction wrapper, and the connection acquire (pool wait). Call
+    after Tortoise.init; safe to call twice.
+    """
+    client_class = type(Tortoise.get_connection(connection_name))
+    root = next(
+        cls for cls in reversed(client_class.__mro__)
+        if issubclass(cls, BaseDBAsyncClient) and cls is not BaseDBAsyncClient
+    )
+    for cls in _subclasses(root):
+        for name in _EXECUTE_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "_qapp_timed", False):
+                setattr(cls, name, _timed(method))
+    for wrapper_class in (ConnectionWrapper, PoolConnectionWrapper):
+        if not getattr(wrapper_class.__aenter__, "_qapp_timed", False):
+            wrapper_class.__aenter__ = _timed_acquire(wrapper_class.__aenter__)
+
+
+# -----------------------
+# Scrape-time gauges
+# -----------------------
+@registry.collector
+async def collect_queue_depth():
+    queue_depth.values = {(queue_id,): depth for queue_id, depth in engine.depths().items()}
+
+
+@registry.collector
+async def collect_db_pool():
+    stats = pool_stats()
+    db_pool_connections.values = {("open",): stats["size"]}
+    if stats["idle"] is not None:
+        db_pool_connections.values[("idle",)] = stats["idle"]
+
+
+@registry.collector
+async def collect_fragment_cache():
+    stats = fragments.stats()
+    fragment_cache.values = {
+        ("hit",): stats["hits"], ("render",): stats["renders"], ("not_modified",): stats["not_modified"],
+    }
+
+
+@registry.collector
+async def collect_startup_phases():
+    startup_phase.values = {(phase,): seconds for phase, seconds in startup_timer.phases.items()}
+
+
+@registry.collector
+async def collect_outbox_backlog():
+    pending = [OutboxStatus.PENDENTE, OutboxStatus.ENVIANDO, OutboxStatus.FALHOU]
+    rows = await Outbox.filter(status__in=pending).group_by("status").annotate(
+        count=Count("id"), oldest=Min("next_attempt_at")
+    ).values("status", "count", "oldest")
+    outbox_backlog.values = {(status.value,): 0 for status in pending}
+    oldest = None
+    for row in rows:
+        status = getattr(row["status"], "value", row["status"])
+        outbox_backlog.values[(status,)] = row["count"]
+        if status == OutboxStatus.PENDENTE.value and row["oldest"] is not None:
+            oldest = row["oldest"]
+    outbox_oldest.set(value=max(0.0, (timezone.now() - oldest).total_seconds()) if oldest else 0)
@@ -1,12 +1,12 @@
 # app/middleware.py
-from fastapi import Request, Response
+from fastapi import HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import time
 import logging
-import jwt
 from typing import Optional
-from app.config import config  # Assuming you have config.py
+from app.config import get_settings
+from app.auth import request_claims
 
 logger = logging.getLogger("qapp_middleware")
 logger.setLevel(logging.INFO)
@@ -14,14 +14,27 @@ logger.setLevel(logging.INFO)
 # -----------------------
 # CORS Middleware Setup
 # -----------------------
+class ReloadableCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware that checks origins against the current settings, so a
+    config reload changes the allowed origins without a restart.
+    """
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        origins = get_settings().cors_origins
+        return "*" in origins or origin in origins
+
+
 def add_cors_middleware(app):
     """
     Add CORS middleware to allow requests from frontend origins.
     """
-    origins = config.get("cors_origins", ["*"])
+    origins = get_settings().cors_origins
     app.add_middleware(
-        CORSMiddleware,
-        allow_origins=origins,
+        ReloadableCORSMiddleware,
+        # Origins are looked up per request (is_allowed_origin); matching
+        # origins are echoed back, which credentials require anyway
+        allow_origins=[],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
@@ -34,35 +47,41 @@ def add_cors_middleware(app):
 # -----------------------
 async def log_requests(request: Request, call_next):
     """
-    Logs incoming HTTP requests and response times.
+    Logs incoming HTTP requests and response times at DEBUG level.
+    Aggregated latencies are on /metrics (app.metrics.MetricsMiddleware).
     """
-    start_time = time.time()
+    if not logger.isEnabledFor(logging.DEBUG):
+        return await call_next(request)
+    start_time = time.perf_counter()
     response: Response = await call_next(request)
-    process_time = time.time() - start_time
-    logger.info(f"{request.method} {request.url.path} - status: {response.status_code} - time: {process_time:.3f}s")
+    process_time = time.perf_counter() - start_time
+    logger.debug("%s %s - status: %s - time: %.3fs", request.method, request.url.path, response.status_code, process_time)
     return response
 
 
 # -----------------------
 # Simple JWT Authentication Middleware
 # -----------------------
+# Under protected prefixes but reachable without a token
+PUBLIC_PATHS = {"/users/login"}
+
 async def jwt_auth_middleware(request: Request, call_next):
     """
     Optional JWT authentication for protected routes.
     Add 'Authorization: Bearer <token>' header.
     """
-    if request.url.path.startswith("/users") or request.url.path.startswith("/admin"):
+    path = request.url.path
+    if (path.startswith("/users") or path.startswith("/admin")) and path not in PUBLIC_PATHS:
         auth_header: Optional[str] = request.headers.get("Authorization")
         if not auth_header or not auth_header.startswith("Bearer "):
             return JSONResponse({"detail": "Missing Authorization header"}, status_code=401)
         token = auth_header.split(" ")[1]
         try:
-            payload = jwt.decode(token, config.get("jwt_secret", "secret"), algorithms=["HS256"])
-            request.state.user = payload  # Make user info available in endpoints
-        except jwt.ExpiredSignatureError:
-            return JSONResponse({"detail": "Token expired"}, status_code=401)
-        except jwt.InvalidTokenError:
-            return JSONResponse({"detail": "Invalid token"}, status_code=401)
+            # Verified once here; endpoint dependencies reuse request.state
+            payload = request_claims(request, token)
+        except HTTPException as e:
+            return JSONResponse({"detail": e.detail}, status_code=e.status_code)
+        request.state.user = payload  # Make user info available in endpoints
     return await call_next(request)
 
 
@@ -0,0 +1,170 @@
+# app/migrations.py
+"""
+Minimal forward-only schema migrations.
+
+Fresh databases get their tables (and the indexes declared on the models)
+from Tortoise's safe schema generation. Existing databases were created
+before some of those indexes existed, so every later schema change is also
+listed here as plain SQL and applied once, in order, with the names of the
+applied migrations stored in the ``schema_migrations`` table.
+
+Statements must be idempotent (``IF NOT EXISTS``) because on a fresh
+database the schema generator has usually created the objects already.
+New columns are listed as ``AddColumn`` steps, which check for the column
+first (SQLite has no ``ADD COLUMN IF NOT EXISTS``). An index on a new
+column of an existing table belongs in the migration only, not in the
+model's ``Meta.indexes``: the generator runs before the migrations, and
+would index a column that does not exist yet (SQLite then reads the
+quoted name as a string and indexes a constant; Postgres fails).
+
+Production workers (``environment: production``) skip the schema
+generation, which checks every model's table and index, unless the
+database was never migrated: the deploy runs
+
+    python -m app.migrations
+
+once, and workers starting afterwards find nothing pending. That command
+always runs the safe schema generation, so a new model's table is created
+there (and by any development worker) without being listed here; only
+changes to tables that already exist, such as new columns or indexes,
+need a migration.
+"""
+import asyncio
+import logging
+from typing import List, NamedTuple, Optional, Set, Tuple, Union
+
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+
+logger = logging.getLogger("qapp_migrations")
+
+
+class AddColumn(NamedTuple):
+    table: str
+    column: str
+    definition: str  # type and constraints, as in CREATE TABLE
+
+
+# Column referencing an organization, nullable: existing rows belong to none
+_ORGANIZATION_FK = 'INT REFERENCES "organization" ("id") ON DELETE CASCADE'
+
+# (name, statements), in the order they must be applied
+MIGRATIONS: List[Tuple[str, List[Union[str, AddColumn]]]] = [
+    ("0001_hot_query_indexes", [
+        'CREATE INDEX IF NOT EXISTS "idx_atendimento_queue_status_created" '
+        'ON "atendimento" ("queue_id", "status", "created_at")',
+        'CREATE INDEX IF NOT EXISTS "idx_atendimento_status_created" '
+        'ON "atendimento" ("status", "created_at")',
+        'CREATE INDEX IF NOT EXISTS "idx_messagelog_atendimento_sent" '
+        'ON "messagelog" ("atendimento_id", "sent_at")',
+    ]),
+    ("0002_outbox_atendimento_index", [
+        'CREATE INDEX IF NOT EXISTS "idx_outbox_atendimento_type" '
+        'ON "outbox" ("atendimento_id", "message_type", "created_at")',
+    ]),
+    ("0003_organizations", [
+        AddColumn("queue", "organization_id", _ORGANIZATION_FK),
+        AddColumn("atendimento", "organization_id", _ORGANIZATION_FK),
+        AddColumn("messagelog", "organization_id", _ORGANIZATION_FK),
+        AddColumn("atendimentoarchive", "organization_id", "INT"),
+        AddColumn("messagelogarchive", "organization_id", "INT"),
+        'CREATE INDEX IF NOT EXISTS "idx_atendimento_organization_created" '
+        'ON "atendimento" ("organization_id", "created_at")',
+        'CREATE INDEX IF NOT EXISTS "idx_messagelog_organization_sent" '
+        'ON "messagelog" ("organization_id", "sent_at")',
+        'CREATE INDEX IF NOT EXISTS "idx_atendimentoarchive_organization_created" '
+        'ON "atendimentoarchive" ("organization_id", "created_at")',
+    ]),
+    # The models used to declare the 0003 indexes, so on databases upgraded
+    # then they were generated before their column existed (on a constant)
+    ("0004_rebuild_organization_indexes", [
+        'DROP INDEX IF EXISTS "idx_atendimento_organization_created"',
+        'CREATE INDEX "idx_atendimento_organization_created" '
+        'ON "atendimento" ("organization_id", "created_at")',
+        'DROP INDEX IF EXISTS "idx_messagelog_organization_sent"',
+        'CREATE INDEX "idx_messagelog_organization_sent" '
+        'ON "messagelog" ("organization_id", "sent_at")',
+        'DROP INDEX IF EXISTS "idx_atendimentoarchive_organization_created"',
+        'CREATE INDEX "idx_atendimentoarchive_organization_created" '
+        'ON "atendimentoarchive" ("organization_id", "created_at")',
+    ]),
+]
+
+
+async def _has_column(conn, table: str, column: str) -> bool:
+    if conn.capabilities.dialect == "sqlite":
+        _, rows = await conn.execute_query(f'PRAGMA table_info("{table}")')
+    else:
+        _, rows = await conn.execute_query(
+            "SELECT column_name AS name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = $1",
+            [table],
+        )
+    return any(row["name"] == column for row in rows)
+
+
+async def _applied(db) -> Optional[Set[str]]:
+    """Names of the applied migrations; None if the database was never migrated."""
+    try:
+        _, rows = await db.execute_query('SELECT "name" FROM "schema_migrations"')
+    except OperationalError:
+        return None
+    return {row["name"] for row in rows}
+
+
+async def migrate(connection_name: str = "default", generate_schemas: bool = True) -> List[str]:
+    """
+    Create missing tables and apply pending migrations.
+    Returns the names of the migrations applied by this call.
+
+    With ``generate_schemas=False`` tables are only generated on a database
+    that has no ``schema_migrations`` table yet.
+    """
+    db = Tortoise.get_connection(connection_name)
+    done = None if generate_schemas else await _applied(db)
+    if done is None:
+        await Tortoise.generate_schemas(safe=True)
+        await db.execute_script(
+            'CREATE TABLE IF NOT EXISTS "schema_migrations" ('
+            '"name" VARCHAR(100) NOT NULL PRIMARY KEY, '
+            '"applied_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)'
+        )
+        done = await _applied(db)
+
+    placeholder = "$1" if db.capabilities.dialect == "postgres" else "?"
+    applied = []
+    for name, statements in MIGRATIONS:
+        if name in done:
+            continue
+        async with in_transaction(connection_name) as conn:
+            for statement in statements:
+                if isinstance(statement, AddColumn):
+                    if await _has_column(conn, statement.table, statement.column):
+                        continue
+                    statement = (
+                        f'ALTER TABLE "{statement.table}" ADD COLUMN "{statement.column}" {statement.definition}'
+                    )
+                await conn.execute_script(statement)
+            await conn.execute_query(
+                f'INSERT INTO "schema_migrations" ("name") VALUES ({placeholder})', [name]
+            )
+        applied.append(name)
+        logger.info(f"Applied migration {name}")
+    return applied
+
+
+async def _main():
+    from app.database import tortoise_config
+
+    await Tortoise.init(config=tortoise_config())
+    try:
+        applied = await migrate()
+    finally:
+        await Tortoise.close_connections()
+    logger.info(f"Schema up to date ({len(applied)} migrations applied)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
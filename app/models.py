@@ -1,5 +1,6 @@
 from tortoise.models import Model
 from tortoise import fields
+from tortoise.indexes import Index
 from enum import Enum
 
 # Enum definitions
@@ -18,6 +19,23 @@ class MessageType(str, Enum):
     ENTRADA = "entrada"
     CHAMADA = "chamada"
     CANCELAMENTO = "cancelamento"
+    LEMBRETE = "lembrete"
+
+class OutboxStatus(str, Enum):
+    PENDENTE = "pendente"
+    ENVIANDO = "enviando"
+    ENVIADO = "enviado"
+    FALHOU = "falhou"  # dead letter: gave up after max attempts
+
+# Organization (tenant): a bank, clinic or office with its own queues.
+# The slug keys per-organization settings, e.g. mensagens.organizacoes.<slug>
+class Organization(Model):
+    id = fields.IntField(pk=True)
+    slug = fields.CharField(max_length=50, unique=True)
+    name = fields.CharField(max_length=100)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    queues = fields.ReverseRelation["Queue"]
 
 # User model
 class User(Model):
@@ -36,6 +54,8 @@ class Queue(Model):
     id = fields.IntField(pk=True)
     name = fields.CharField(max_length=100)
     created_by = fields.ForeignKeyField('models.User', related_name='queues_created')
+    # Fixed at creation; None for queues that belong to no organization
+    organization = fields.ForeignKeyField('models.Organization', null=True, related_name='queues')
     active = fields.BooleanField(default=True)
     created_at = fields.DatetimeField(auto_now_add=True)
 
@@ -48,15 +68,115 @@ class Atendimento(Model):
     phone = fields.CharField(max_length=20)
     status = fields.CharEnumField(enum_type=AtendimentoStatus, default=AtendimentoStatus.AGUARDANDO)
     atendente = fields.ForeignKeyField('models.User', null=True, related_name='atendimentos')
+    # Copy of the queue's organization, so per-organization reads need no join
+    organization = fields.ForeignKeyField('models.Organization', null=True, related_name='atendimentos')
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
     logs = fields.ReverseRelation["MessageLog"]
 
+    class Meta:
+        # Index names are fixed so app.migrations can create them on existing databases.
+        # Indexes on organization_id are created by migration 0003 only: the schema
+        # generator would create them before that migration adds the column.
+        indexes = [
+            # "next waiting ticket of a queue", FIFO by created_at
+            Index(fields=("queue_id", "status", "created_at"), name="idx_atendimento_queue_status_created"),
+            # cleanup sweep over old tickets of a given status
+            Index(fields=("status", "created_at"), name="idx_atendimento_status_created"),
+        ]
+
 # Message log for notifications
 class MessageLog(Model):
     id = fields.IntField(pk=True)
     atendimento = fields.ForeignKeyField('models.Atendimento', related_name='logs')
+    organization = fields.ForeignKeyField('models.Organization', null=True, related_name='message_logs')
     message_type = fields.CharEnumField(enum_type=MessageType)
     content = fields.TextField()
     sent_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            Index(fields=("atendimento_id", "sent_at"), name="idx_messagelog_atendimento_sent"),
+        ]
+
+# Outbound notification queue, drained by the dispatcher (python -m app.outbox)
+class Outbox(Model):
+    id = fields.IntField(pk=True)
+    atendimento = fields.ForeignKeyField('models.Atendimento', null=True, related_name='outbox')
+    message_type = fields.CharEnumField(enum_type=MessageType, null=True)
+    to_email = fields.CharField(max_length=255)
+    subject = fields.CharField(max_length=255)
+    content = fields.TextField()
+    provider = fields.CharField(max_length=50, default="default")
+    status = fields.CharEnumField(enum_type=OutboxStatus, default=OutboxStatus.PENDENTE)
+    attempts = fields.IntField(default=0)
+    next_attempt_at = fields.DatetimeField()
+    lease_token = fields.CharField(max_length=32, null=True)
+    last_error = fields.TextField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # dispatcher poll: due messages in order
+            Index(fields=("status", "next_attempt_at"), name="idx_outbox_status_next"),
+            # reminder de-duplication: messages already queued for a ticket
+            Index(fields=("atendimento_id", "message_type", "created_at"), name="idx_outbox_atendimento_type"),
+        ]
+
+# Hourly call statistics, maintained incrementally by app.analytics
+class QueueRollup(Model):
+    id = fields.IntField(pk=True)
+    queue = fields.ForeignKeyField('models.Queue', related_name='rollups')
+    atendente = fields.ForeignKeyField('models.User', null=True, related_name='rollups')
+    bucket = fields.DatetimeField()  # start of the hour, UTC
+    wait_le = fields.IntField()  # wait histogram bucket: upper bound in seconds
+    served = fields.IntField(default=0)
+    wait_total = fields.FloatField(default=0)  # seconds
+
+    class Meta:
+        unique_together = (("queue", "atendente", "bucket", "wait_le"),)
+        indexes = [
+            Index(fields=("queue_id", "bucket"), name="idx_queuerollup_queue_bucket"),
+        ]
+
+# Archive of closed tickets and their messages, filled by app.tasks.archive_closed_atendimentos.
+# Plain copies (no foreign keys) keeping the original ids.
+class AtendimentoArchive(Model):
+    id = fields.IntField(pk=True, generated=False)
+    queue_id = fields.IntField(index=True)
+    phone = fields.CharField(max_length=20)
+    status = fields.CharEnumField(enum_type=AtendimentoStatus)
+    atendente_id = fields.IntField(null=True)
+    organization_id = fields.IntField(null=True)
+    created_at = fields.DatetimeField(index=True)
+    updated_at = fields.DatetimeField()
+    archived_at = fields.DatetimeField(auto_now_add=True)
+
+class MessageLogArchive(Model):
+    id = fields.IntField(pk=True, generated=False)
+    atendimento_id = fields.IntField(index=True)
+    organization_id = fields.IntField(null=True)
+    message_type = fields.CharEnumField(enum_type=MessageType)
+    content = fields.TextField()
+    sent_at = fields.DatetimeField()
+
+# Named lease so that only one worker runs a periodic job at a time (see app.leases)
+class Lease(Model):
+    name = fields.CharField(max_length=100, pk=True)
+    holder = fields.CharField(max_length=255)
+    expires_at = fields.DatetimeField()
+
+# Revoked access tokens (logout) and per-user cutoffs (role change, "log out everywhere"),
+# mirrored in memory by app.revocation
+class RevokedToken(Model):
+    jti = fields.CharField(max_length=64, pk=True)
+    user_id = fields.IntField()
+    expires_at = fields.DatetimeField(index=True)
+    created_at = fields.DatetimeField(auto_now_add=True, index=True)
+
+class TokenCutoff(Model):
+    user_id = fields.IntField(pk=True, generated=False)
+    not_before = fields.FloatField()  # tokens issued (iat) before this Unix time are invalid
+    updated_at = fields.DatetimeField(auto_now=True, index=True)
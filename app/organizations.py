@@ -0,0 +1,60 @@
+# app/organizations.py
+"""
+Organization (tenant) lookups for the write paths.
+
+Tickets and message logs carry their queue's organization_id, so reads of
+one organization (listings, exports, archives) filter on an indexed column
+of their own table and never scan other tenants' rows or join queues.
+
+A queue's organization is set when the queue is created and never changes,
+and neither does an organization's slug, so both lookups are cached per
+process without expiry: after the first ticket of a queue, stamping the
+organization costs no query.
+"""
+from typing import Dict, Iterable, Optional
+
+from app.models import Organization, Queue
+
+
+class OrganizationDirectory:
+    """
+    queue_id -> organization_id and organization_id -> slug, cached.
+    """
+
+    def __init__(self):
+        self._queues: Dict[int, Optional[int]] = {}
+        self._slugs: Dict[int, str] = {}
+
+    def remember(self, queue: Queue):
+        """Cache the organization of a queue just created or loaded."""
+        self._queues[queue.id] = queue.organization_id
+
+    async def of_queues(self, queue_ids: Iterable[int]) -> Dict[int, Optional[int]]:
+        """Organization of each queue (None for queues of no organization)."""
+        queue_ids = set(queue_ids)
+        missing = [queue_id for queue_id in queue_ids if queue_id not in self._queues]
+        if missing:
+            rows = await Queue.filter(id__in=missing).values_list("id", "organization_id")
+            self._queues.update(rows)
+        return {queue_id: self._queues.get(queue_id) for queue_id in queue_ids}
+
+    async def of_queue(self, queue_id: int) -> Optional[int]:
+        if queue_id in self._queues:
+            return self._queues[queue_id]
+        return (await self.of_queues([queue_id]))[queue_id]
+
+    async def slugs(self, organization_ids: Iterable[Optional[int]]) -> Dict[int, str]:
+        """Slugs of the given organizations (None ids are skipped)."""
+        organization_ids = {i for i in organization_ids if i is not None}
+        missing = [i for i in organization_ids if i not in self._slugs]
+        if missing:
+            self._slugs.update(await Organization.filter(id__in=missing).values_list("id", "slug"))
+        return {i: self._slugs[i] for i in organization_ids if i in self._slugs}
+
+    def clear(self):
+        self._queues.clear()
+        self._slugs.clear()
+
+
+# Shared directory used by the queue engine, notifications and the outbox
+organizations = OrganizationDirectory()
@@ -0,0 +1,261 @@
+# app/outbox.py
+"""
+Durable outbound notification queue.
+
+Request handlers call ``enqueue_email`` (one INSERT). A separate dispatcher
+process drains the ``Outbox`` table in batches:
+
+    python -m app.outbox
+
+Failed sends are retried with exponential backoff; after ``max_attempts``
+the message is parked as FALHOU (dead letter). Each provider has its own
+rate limit. Messages linked to an Atendimento are recorded in MessageLog
+once delivered.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from tortoise import Tortoise, timezone
+from tortoise.expressions import Q
+
+from app.config import Settings, get_settings, settings_store
+from app.database import tortoise_config
+from app.mailer import close_pools, get_pool
+from app.models import Atendimento, MessageLog, MessageType, Outbox, OutboxStatus
+
+logger = logging.getLogger("qapp_outbox")
+
+# Longest pause between retries while batches keep failing (seconds)
+MAX_ERROR_PAUSE = 60
+
+
+# -----------------------
+# Producer side
+# -----------------------
+async def enqueue_email(
+    to_email: str,
+    subject: str,
+    content: str,
+    atendimento_id: Optional[int] = None,
+    message_type: Optional[MessageType] = None,
+    provider: str = "default",
+) -> Outbox:
+    """
+    Queue an email for the dispatcher.
+    """
+    return await Outbox.create(
+        atendimento_id=atendimento_id,
+        message_type=message_type,
+        to_email=to_email,
+        subject=subject,
+        content=content,
+        provider=provider,
+        next_attempt_at=timezone.now(),
+    )
+
+
+async def enqueue_many(messages: List[dict]):
+    """
+    Queue several emails with one bulk INSERT.
+    Each dict takes the keyword arguments of ``enqueue_email``.
+    """
+    now = timezone.now()
+    await Outbox.bulk_create([
+        Outbox(next_attempt_at=now, **{"provider": "default", **message})
+        for message in messages
+    ])
+
+
+# -----------------------
+# Dispatcher side
+# -----------------------
+class RateLimiter:
+    """
+    Token bucket: at most ``rate`` acquisitions per second, bursts up to ``burst``.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Dispatcher:
+    """
+    Drains due Outbox rows in batches.
+
+    Rows are claimed with a conditional UPDATE that stamps a lease token, so
+    several dispatchers can run side by side. A claim is also a lease: rows
+    stuck in ENVIANDO (dispatcher died mid-batch) become due again once
+    ``lease_seconds`` have passed.
+    """
+
+    def __init__(self, settings: Settings):
+        self._limiters: Dict[str, RateLimiter] = {}
+        self.configure(settings)
+
+    def configure(self, settings: Settings):
+        """Apply (re)loaded settings; takes effect from the next batch."""
+        outbox_config = settings.outbox
+        self.smtp_config = settings.smtp or {}
+        self.batch_size = outbox_config.get("batch_size", 100)
+        self.poll_interval = outbox_config.get("poll_interval", 1.0)
+        self.max_attempts = outbox_config.get("max_attempts", 8)
+        self.backoff_base = outbox_config.get("backoff_base", 30)
+        self.backoff_max = outbox_config.get("backoff_max", 3600)
+        self.lease_seconds = outbox_config.get("lease_seconds", 300)
+        self.providers: Dict[str, dict] = outbox_config.get("providers", {})
+        self._limiters.clear()
+
+    def _limiter(self, provider: str) -> Optional[RateLimiter]:
+        rate = self.providers.get(provider, {}).get("rate_per_second")
+        if not rate:
+            return None
+        if provider not in self._limiters:
+            self._limiters[provider] = RateLimiter(rate, self.providers[provider].get("burst"))
+        return self._limiters[provider]
+
+    def _smtp_config(self, provider: str) -> dict:
+        return self.providers.get(provider, {}).get("smtp", self.smtp_config)
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds to wait before retry number ``attempts`` (with jitter)."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def claim_batch(self) -> List[Outbox]:
+        now = timezone.now()
+        due = Q(status=OutboxStatus.PENDENTE) | Q(status=OutboxStatus.ENVIANDO)
+        ids = await Outbox.filter(due, next_attempt_at__lte=now).order_by(
+            "next_attempt_at", "id"
+        ).limit(self.batch_size).values_list("id", flat=True)
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        await Outbox.filter(due, id__in=ids, next_attempt_at__lte=now).update(
+            status=OutboxStatus.ENVIANDO,
+            lease_token=token,
+            next_attempt_at=now + timedelta(seconds=self.lease_seconds),
+            updated_at=now,
+        )
+        return await Outbox.filter(lease_token=token, status=OutboxStatus.ENVIANDO).order_by("id")
+
+    async def _deliver(self, message: Outbox) -> Optional[str]:
+        """Send one message; return the error text on failure."""
+        limiter = self._limiter(message.provider)
+        if limiter:
+            await limiter.acquire()
+        try:
+            await get_pool(self._smtp_config(message.provider)).send(
+                message.to_email, message.subject, message.content
+            )
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+        return None
+
+    async def run_once(self) -> int:
+        """
+        Claim and send one batch. Returns the number of messages handled.
+        """
+        batch = await self.claim_batch()
+        if not batch:
+            return 0
+        errors = await asyncio.gather(*(self._deliver(m) for m in batch))
+
+        now = timezone.now()
+        sent, logs = [], []
+        for message, error in zip(batch, errors):
+            if error is None:
+                sent.append(message.id)
+                if message.atendimento_id and message.message_type:
+                    logs.append(MessageLog(
+                        atendimento_id=message.atendimento_id,
+                        message_type=message.message_type,
+                        content=message.content,
+                    ))
+                continue
+            attempts = message.attempts + 1
+            if attempts >= self.max_attempts:
+                status, next_attempt = OutboxStatus.FALHOU, now
+                logger.error(f"Outbox {message.id} dead after {attempts} attempts: {error}")
+            else:
+                status, next_attempt = OutboxStatus.PENDENTE, now + timedelta(seconds=self.backoff(attempts))
+                logger.warning(f"Outbox {message.id} attempt {attempts} failed: {error}")
+            await Outbox.filter(id=message.id, lease_token=message.lease_token).update(
+                status=status, attempts=attempts, next_attempt_at=next_attempt,
+                last_error=error, lease_token=None, updated_at=now,
+            )
+        if sent:
+            # Only rows still under this batch's lease: if it expired, another
+            # dispatcher owns them now
+            await Outbox.filter(id__in=sent, lease_token=batch[0].lease_token).update(
+                status=OutboxStatus.ENVIADO, lease_token=None, updated_at=now
+            )
+        if logs:
+            tenants = dict(await Atendimento.filter(
+                id__in={log.atendimento_id for log in logs}
+            ).values_list("id", "organization_id"))
+            for log in logs:
+                log.organization_id = tenants.get(log.atendimento_id)
+            await MessageLog.bulk_create(logs)
+        logger.info(f"Outbox batch: {len(sent)} sent, {len(batch) - len(sent)} failed")
+        return len(batch)
+
+    async def run_forever(self):
+        """
+        Run batches until cancelled. A failing batch (e.g. "database is
+        locked") is logged and retried after a growing pause, up to
+        ``MAX_ERROR_PAUSE`` seconds; claimed rows it left in ENVIANDO become
+        due again when their lease runs out.
+        """
+        failures = 0
+        while True:
+            try:
+                handled = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                failures += 1
+                pause = min(MAX_ERROR_PAUSE, self.poll_interval * 2 ** failures)
+                logger.exception(f"Outbox batch failed ({failures} in a row), retrying in {pause:.1f}s")
+                await asyncio.sleep(pause)
+                continue
+            failures = 0
+            if handled < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+
+async def _main():
+    await Tortoise.init(config=tortoise_config())
+    dispatcher = Dispatcher(get_settings())
+    settings_store.subscribe(dispatcher.configure)
+    watch = settings_store.start()
+    try:
+        await dispatcher.run_forever()
+    finally:
+        if watch:
+            watch.cancel()
+        await close_pools()
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,160 @@
+# app/positions.py
+"""
+Ticket positions and estimated waits, answered from memory.
+
+``QueueRank`` keeps one Fenwick (binary indexed) tree per queue over the
+order in which tickets joined: every waiting ticket holds a slot with a
+1, a ticket that leaves has its slot set to 0, and a ticket's position
+is the prefix sum up to its slot. Adding, removing and looking up are
+O(log n), so a lookup never counts rows in the database.
+
+``ServiceTimes`` estimates how fast a queue moves. Tickets have no
+"finished" transition, so the service time of an attendant is the gap
+between two consecutive calls of theirs on the same queue, smoothed with
+an exponentially weighted moving average. Gaps longer than
+``BREAK_SECONDS`` are breaks and gaps shorter than ``MIN_GAP_SECONDS``
+(a repeated click, a burst of calls to skip absent customers) are not
+service; neither is counted. The queue's rate is the sum of the rates of
+the attendants seen calling recently.
+"""
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+# Weight of the newest gap in the moving average
+EWMA_ALPHA = 0.2
+# Longer gaps between two calls of one attendant are breaks, not service
+BREAK_SECONDS = 30 * 60
+# Shorter gaps are repeated or skipped calls, not service
+MIN_GAP_SECONDS = 1.0
+# An attendant counts towards the queue's rate for this long after a call
+ACTIVE_SECONDS = 30 * 60
+
+
+class QueueRank:
+    """
+    Positions of the waiting tickets of one queue (Fenwick tree over slots).
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._slots: Dict[int, int] = {}  # ticket id -> slot (1-based)
+        self._next = 1
+        self._tree: List[int] = [0] * (capacity + 1)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, ticket_id: int) -> bool:
+        return ticket_id in self._slots
+
+    def _update(self, slot: int, delta: int):
+        tree = self._tree
+        while slot < len(tree):
+            tree[slot] += delta
+            slot += slot & -slot
+
+    def _prefix(self, slot: int) -> int:
+        tree, total = self._tree, 0
+        while slot:
+            total += tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def append(self, ticket_id: int):
+        """Add a ticket behind every ticket already ranked."""
+        if ticket_id in self._slots:
+            return
+        if self._next >= len(self._tree):
+            self.reset(self.ordered(), capacity=max(64, 2 * (len(self._slots) + 1)))
+        self._slots[ticket_id] = self._next
+        self._update(self._next, 1)
+        self._next += 1
+
+    def remove(self, ticket_id: int):
+        slot = self._slots.pop(ticket_id, None)
+        if slot is not None:
+            self._update(slot, -1)
+
+    def position(self, ticket_id: int) -> Optional[int]:
+        """1 for the next ticket to be called; None when not ranked."""
+        slot = self._slots.get(ticket_id)
+        return None if slot is None else self._prefix(slot)
+
+    def ordered(self) -> List[int]:
+        return sorted(self._slots, key=self._slots.__getitem__)
+
+    def reset(self, ticket_ids: Iterable[int], capacity: Optional[int] = None):
+        """
+        Re-rank from scratch with ``ticket_ids`` in call order, packing the
+        slots (also used to compact once the slots run out). O(n).
+        """
+        ticket_ids = list(ticket_ids)
+        size = max(capacity or 0, 2 * len(ticket_ids), 64)
+        tree = [0] * (size + 1)
+        for slot in range(1, len(ticket_ids) + 1):
+            tree[slot] = 1
+        # Push each node's sum into its parent; empty slots pass sums upwards too
+        for slot in range(1, size + 1):
+            parent = slot + (slot & -slot)
+            if parent <= size:
+                tree[parent] += tree[slot]
+        self._tree = tree
+        self._slots = {ticket_id: slot for slot, ticket_id in enumerate(ticket_ids, 1)}
+        self._next = len(ticket_ids) + 1
+
+
+class ServiceTimes:
+    """
+    Moving average of service time per (queue, attendant).
+    """
+
+    def __init__(self, alpha: float = EWMA_ALPHA, break_seconds: float = BREAK_SECONDS,
+                 active_seconds: float = ACTIVE_SECONDS, min_gap_seconds: float = MIN_GAP_SECONDS):
+        self.alpha = alpha
+        self.break_seconds = break_seconds
+        self.min_gap_seconds = min_gap_seconds
+        self.active_seconds = active_seconds
+        # queue_id -> {atendente_id: [last call (Unix time), average seconds or None]}
+        self._attendants: Dict[int, Dict[Optional[int], list]] = defaultdict(dict)
+        # queue_id -> [last call, average seconds between any two calls or None]
+        self._queues: Dict[int, list] = {}
+
+    def _observe(self, entry: list, now: float):
+        gap = now - entry[0]
+        entry[0] = now
+        if self.min_gap_seconds <= gap <= self.break_seconds:
+            entry[1] = gap if entry[1] is None else entry[1] + self.alpha * (gap - entry[1])
+
+    def record_call(self, queue_id: int, atendente_id: Optional[int], at: Optional[float] = None):
+        """Account one call (cheap, no I/O)."""
+        now = at or time.time()
+        for table, key in ((self._attendants[queue_id], atendente_id), (self._queues, queue_id)):
+            entry = table.get(key)
+            if entry is None:
+                table[key] = [now, None]
+            else:
+                self._observe(entry, now)
+
+    def service_seconds(self, queue_id: int, atendente_id: Optional[int]) -> Optional[float]:
+        entry = self._attendants.get(queue_id, {}).get(atendente_id)
+        return entry[1] if entry else None
+
+    def rate(self, queue_id: int, now: Optional[float] = None) -> Optional[float]:
+        """
+        Tickets called per second: the attendants active on the queue added
+        up, else the queue's own call rate. None until there is a measure.
+        """
+        now = now or time.time()
+        rate = 0.0
+        for last, average in self._attendants.get(queue_id, {}).values():
+            if average and now - last <= self.active_seconds:
+                rate += 1 / average
+        if rate:
+            return rate
+        entry = self._queues.get(queue_id)
+        if entry and entry[1] and now - entry[0] <= self.active_seconds:
+            return 1 / entry[1]
+        return None
+
+    def attendants(self, queue_id: int) -> Dict[Optional[int], Optional[float]]:
+        return {atendente_id: average for atendente_id, (_, average) in self._attendants.get(queue_id, {}).items()}
@@ -0,0 +1,399 @@
+# app/queue_engine.py
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from app.models import Atendimento, AtendimentoStatus
+from app.events import ticket_event, ADDED, CALLED, CANCELLED
+from app.analytics import recorder
+from app.coordination import coordinator, issued_key, now_serving_key, served_key
+from app.cache import TTLCache
+from app.organizations import organizations
+from app.positions import QueueRank, ServiceTimes
+
+logger = logging.getLogger("qapp_queue_engine")
+
+
+class QueueEngine:
+    """
+    In-memory index of waiting tickets, one FIFO per queue.
+
+    Each worker has its own index. Ticket events of the other workers
+    arrive through app.coordination and are applied with ``apply_event``,
+    so every index (and every lobby screen) sees the adds, calls and
+    cancels made anywhere.
+
+    Reads ("who is next?", "who is waiting?") are answered from memory;
+    every state change is written through to the Atendimento table so the
+    database stays the source of truth and the index can be rebuilt from it.
+
+    Claims are made with conditional UPDATEs, never by read-then-save, so
+    several attendants (or several workers, each with its own index) can
+    call "next" on the same queue without handing out a ticket twice.
+
+    Alongside the FIFOs the engine keeps a position rank per queue and the
+    service time averages (app.positions), so "where am I and how long
+    until I am called?" is answered without a query.
+
+    Every change to a queue's tickets, local or applied from another
+    worker, bumps the queue's ``version``; rendered fragments of the queue
+    are cached under it (app.fragments).
+    """
+
+    def __init__(self):
+        # queue_id -> {atendimento_id: Atendimento}, insertion ordered (FIFO)
+        self._waiting: Dict[int, "OrderedDict[int, Atendimento]"] = defaultdict(OrderedDict)
+        # atendimento_id -> queue_id, so cancel can find a ticket in O(1)
+        self._index: Dict[int, int] = {}
+        self._ranks: Dict[int, QueueRank] = defaultdict(QueueRank)
+        self.service_times = ServiceTimes()
+        # atendimento_id -> (queue_id, status) of tickets that left the queue lately
+        self.recent = TTLCache(maxsize=50_000, ttl=3600)
+        # queue_id -> state version, bumped on every ticket change of the queue
+        self._versions: Dict[int, int] = defaultdict(int)
+
+    # -----------------------
+    # Startup
+    # -----------------------
+    async def rebuild(self):
+        """
+        Rebuild the index from the Atendimento table (call once at startup).
+        """
+        for queue_id in list(self._waiting):
+            self._versions[queue_id] += 1
+        self._waiting.clear()
+        self._index.clear()
+        self._ranks.clear()
+        pending = await Atendimento.filter(status=AtendimentoStatus.AGUARDANDO).order_by("created_at", "id")
+        for atendimento in pending:
+            self._push(atendimento)
+        logger.info(f"Queue engine rebuilt with {len(self._index)} waiting atendimentos")
+
+    # -----------------------
+    # Reads
+    # -----------------------
+    def waiting(self, queue_id: int, limit: Optional[int] = None) -> List[Atendimento]:
+        """Waiting tickets of a queue, in call order (the first ``limit`` only)."""
+        return list(islice(self._waiting.get(queue_id, {}).values(), limit))
+
+    def depth(self, queue_id: int) -> int:
+        """Number of waiting tickets in a queue."""
+        return len(self._waiting.get(queue_id, ()))
+
+    def depths(self) -> Dict[int, int]:
+        """Waiting tickets of every queue that has any."""
+        return {queue_id: len(tickets) for queue_id, tickets in self._waiting.items() if tickets}
+
+    def version(self, queue_id: int) -> int:
+        """State version of a queue: changes whenever one of its tickets does."""
+        return self._versions.get(queue_id, 0)
+
+    def position(self, atendimento_id: int) -> Optional[dict]:
+        """
+        Position (1 = next) and estimated wait of a waiting ticket; None
+        when the ticket is not waiting. O(log n), no I/O.
+        """
+        queue_id = self._index.get(atendimento_id)
+        if queue_id is None:
+            return None
+        position = self._ranks[queue_id].position(atendimento_id)
+        now = time.time()
+        rate = self.service_times.rate(queue_id, now)
+        eta = position / rate if rate else None
+        return {
+            "queue_id": queue_id,
+            "position": position,
+            "ahead": position - 1,
+            "waiting": self.depth(queue_id),
+            "service_seconds": round(1 / rate, 1) if rate else None,
+            "eta_seconds": round(eta) if eta is not None else None,
+            "estimated_call_at": datetime.fromtimestamp(now + eta, dt_timezone.utc).isoformat()
+            if eta is not None else None,
+        }
+
+    def peek(self, queue_id: int) -> Optional[Atendimento]:
+        """Next ticket to be called, without claiming it."""
+        tickets = self._waiting.get(queue_id)
+        if not tickets:
+            return None
+        return next(iter(tickets.values()))
+
+    # -----------------------
+    # Writes (write-through)
+    # -----------------------
+    async def add(self, queue_id: int, phone: str) -> Atendimento:
+        """
+        Create a waiting ticket and append it to its queue.
+        """
+        atendimento = await Atendimento.create(
+            queue_id=queue_id,
+            organization_id=await organizations.of_queue(queue_id),
+            phone=phone,
+            status=AtendimentoStatus.AGUARDANDO
+        )
+        self._push(atendimento)
+        self._added(atendimento)
+        return atendimento
+
+    async def add_many(self, tickets: List[Tuple[int, str]]) -> List[Atendimento]:
+        """
+        Create many waiting tickets, given as (queue_id, phone) pairs, with one
+        bulk INSERT in one transaction. Returns them in the given order.
+        """
+        tenants = await organizations.of_queues(queue_id for queue_id, _ in tickets)
+        async with in_transaction() as conn:
+            atendimentos = await bulk_insert(conn, tickets, tenants)
+        for atendimento in atendimentos:
+            self._push(atendimento)
+            self._added(atendimento)
+        return atendimentos
+
+    async def next(self, queue_id: int, atendente_id: int) -> Optional[Atendimento]:
+        """
+        Claim the oldest waiting ticket of a queue for an attendant.
+
+        Candidates are popped from the index (no await between check and pop,
+        so no lock is needed) and claimed with
+        ``UPDATE ... WHERE id = ? AND status = 'aguardando'``. A candidate that
+        another worker already claimed or cancelled is dropped and the next one
+        is tried. When the index runs dry the claim falls back to the database,
+        which also sees tickets added by other workers.
+        """
+        tickets = self._waiting.get(queue_id)
+        while tickets:
+            _, candidate = tickets.popitem(last=False)
+            self._index.pop(candidate.id, None)
+            self._ranks[queue_id].remove(candidate.id)
+            self._versions[queue_id] += 1
+            now = timezone.now()
+            claimed = await Atendimento.filter(
+                id=candidate.id,
+                status=AtendimentoStatus.AGUARDANDO
+            ).update(status=AtendimentoStatus.CHAMADO, atendente_id=atendente_id, updated_at=now)
+            if claimed:
+                candidate.status = AtendimentoStatus.CHAMADO
+                candidate.atendente_id = atendente_id
+                candidate.updated_at = now
+                self._called(candidate)
+                return candidate
+        atendimento = await claim_next(queue_id, atendente_id)
+        if atendimento:
+            self._called(atendimento)
+        return atendimento
+
+    async def cancel(self, atendimento: Atendimento, atendente_id: Optional[int] = None) -> Optional[Atendimento]:
+        """
+        Cancel a ticket and drop it from its queue. With ``atendente_id``
+        only a ticket that attendant has called can be cancelled (a
+        no-show); without, any ticket still waiting or called.
+
+        Like ``next``, the change is a conditional
+        ``UPDATE ... WHERE id = ? AND status IN (...)``: a ticket that has
+        meanwhile been served, cancelled or (for an attendant) not called by
+        them is left alone and None is returned.
+        """
+        now = timezone.now()
+        if atendente_id is None:
+            allowed = Atendimento.filter(
+                id=atendimento.id,
+                status__in=[AtendimentoStatus.AGUARDANDO, AtendimentoStatus.CHAMADO]
+            )
+        else:
+            allowed = Atendimento.filter(
+                id=atendimento.id,
+                status=AtendimentoStatus.CHAMADO,
+                atendente_id=atendente_id
+            )
+        cancelled = await allowed.update(status=AtendimentoStatus.CANCELADO, updated_at=now)
+        if not cancelled:
+            return None
+        self._discard(atendimento.id)
+        atendimento.status = AtendimentoStatus.CANCELADO
+        atendimento.updated_at = now
+        self._left(atendimento.id, atendimento.queue_id, AtendimentoStatus.CANCELADO)
+        coordinator.publish(atendimento.queue_id, ticket_event(CANCELLED, atendimento))
+        return atendimento
+
+    def expire(self, atendimento_ids: List[int]):
+        """
+        Drop tickets that were cancelled in bulk directly in the database
+        (e.g. by the cleanup sweep) and announce them as cancelled.
+        """
+        for atendimento_id in atendimento_ids:
+            atendimento = self._discard(atendimento_id)
+            if atendimento is not None:
+                atendimento.status = AtendimentoStatus.CANCELADO
+                self._left(atendimento.id, atendimento.queue_id, AtendimentoStatus.CANCELADO)
+                coordinator.publish(atendimento.queue_id, ticket_event(CANCELLED, atendimento))
+
+    def apply_event(self, event: dict):
+        """
+        Apply a ticket event published by another worker to this index.
+        The database already holds the change; only the index follows.
+        """
+        if event["type"] == ADDED:
+            if event["id"] in self._index:
+                return
+            created_at = event.get("created_at")
+            self._push_ordered(Atendimento(
+                id=event["id"],
+                queue_id=event["queue_id"],
+                phone=event["phone"],
+                status=AtendimentoStatus.AGUARDANDO,
+                created_at=datetime.fromisoformat(created_at) if created_at else timezone.now(),
+            ))
+        else:
+            self._discard(event["id"])
+            self._left(event["id"], event["queue_id"], AtendimentoStatus(event["status"]))
+            if event["type"] == CALLED:
+                self.service_times.record_call(event["queue_id"], event.get("atendente_id"))
+
+    # -----------------------
+    # Internals
+    # -----------------------
+    def _push(self, atendimento: Atendimento):
+        self._waiting[atendimento.queue_id][atendimento.id] = atendimento
+        self._index[atendimento.id] = atendimento.queue_id
+        self._ranks[atendimento.queue_id].append(atendimento.id)
+        self._versions[atendimento.queue_id] += 1
+
+    def _push_ordered(self, atendimento: Atendimento):
+        """
+        Push a ticket that may be older than the newest one indexed (an add
+        made by another worker, delivered late), keeping FIFO order.
+        """
+        tickets = self._waiting[atendimento.queue_id]
+        self._push(atendimento)
+        if len(tickets) > 1:
+            last = next(reversed(tickets.values()))
+            before = list(tickets.values())[-2]
+            if (before.created_at, before.id) > (last.created_at, last.id):
+                ordered = sorted(tickets.values(), key=lambda a: (a.created_at, a.id))
+                tickets.clear()
+                tickets.update((a.id, a) for a in ordered)
+                self._ranks[atendimento.queue_id].reset(tickets.keys())
+
+    def _added(self, atendimento: Atendimento):
+        coordinator.incr(issued_key(atendimento.queue_id))
+        coordinator.publish(atendimento.queue_id, ticket_event(ADDED, atendimento))
+
+    def _called(self, atendimento: Atendimento):
+        recorder.record_call(atendimento, atendimento.updated_at)
+        self.service_times.record_call(atendimento.queue_id, atendimento.atendente_id)
+        self._left(atendimento.id, atendimento.queue_id, AtendimentoStatus.CHAMADO)
+        coordinator.incr(served_key(atendimento.queue_id))
+        coordinator.set(now_serving_key(atendimento.queue_id), atendimento.id)
+        coordinator.publish(atendimento.queue_id, ticket_event(CALLED, atendimento))
+
+    def _discard(self, atendimento_id: int) -> Optional[Atendimento]:
+        queue_id = self._index.pop(atendimento_id, None)
+        if queue_id is None:
+            return None
+        self._ranks[queue_id].remove(atendimento_id)
+        self._versions[queue_id] += 1
+        return self._waiting[queue_id].pop(atendimento_id, None)
+
+    def _left(self, atendimento_id: int, queue_id: int, status: AtendimentoStatus):
+        self.recent.set(atendimento_id, (queue_id, status))
+
+
+# -----------------------
+# Database-side claim
+# -----------------------
+_CLAIM_SQL = {
+    # Row locks let concurrent claimers skip each other instead of queueing
+    "postgres": (
+        'UPDATE "atendimento" SET "status" = $1, "atendente_id" = $2, "updated_at" = $3 '
+        'WHERE "id" = (SELECT "id" FROM "atendimento" WHERE "queue_id" = $4 AND "status" = $5 '
+        'ORDER BY "created_at", "id" LIMIT 1 FOR UPDATE SKIP LOCKED) '
+        'RETURNING "id"'
+    ),
+    # SQLite runs one writer at a time, so a single UPDATE with the pick in a
+    # subquery is atomic; the repeated status check guards the row itself
+    "sqlite": (
+        'UPDATE "atendimento" SET "status" = ?, "atendente_id" = ?, "updated_at" = ? '
+        'WHERE "id" = (SELECT "id" FROM "atendimento" WHERE "queue_id" = ? AND "status" = ? '
+        'ORDER BY "created_at", "id" LIMIT 1) AND "status" = ? '
+        'RETURNING "id"'
+    ),
+}
+
+
+async def claim_next(queue_id: int, atendente_id: int) -> Optional[Atendimento]:
+    """
+    Atomically claim the oldest waiting ticket of a queue in the database.
+    """
+    db = Atendimento._meta.db
+    dialect = db.capabilities.dialect
+    if dialect not in _CLAIM_SQL:
+        raise NotImplementedError(f"Atomic claim not supported for {dialect}")
+    values = [
+        AtendimentoStatus.CHAMADO.value,
+        atendente_id,
+        timezone.now(),
+        queue_id,
+        AtendimentoStatus.AGUARDANDO.value,
+    ]
+    if dialect == "sqlite":
+        values.append(AtendimentoStatus.AGUARDANDO.value)
+    _, rows = await db.execute_query(_CLAIM_SQL[dialect], values)
+    if not rows:
+        return None
+    return await Atendimento.get(id=rows[0]["id"])
+
+
+# -----------------------
+# Bulk insert with ids
+# -----------------------
+async def bulk_insert(
+    conn, tickets: List[Tuple[int, str]], organizations: Optional[Dict[int, Optional[int]]] = None
+) -> List[Atendimento]:
+    """
+    bulk_create waiting tickets inside the transaction ``conn`` and fill in
+    their ids, which bulk_create itself does not report. ``organizations``
+    maps queue ids to the organization stamped on their tickets.
+
+    Postgres: ids are drawn from the sequence up front and inserted explicitly.
+    SQLite: the transaction holds the write lock after the INSERT, so the
+    newest ``len(tickets)`` ids are ours, assigned in insertion order.
+    """
+    dialect = conn.capabilities.dialect
+    status = AtendimentoStatus.AGUARDANDO
+    organizations = organizations or {}
+    if dialect == "postgres":
+        _, rows = await conn.execute_query(
+            "SELECT nextval(pg_get_serial_sequence('atendimento', 'id')) AS id FROM generate_series(1, $1)",
+            [len(tickets)],
+        )
+        atendimentos = [
+            Atendimento(
+                id=row["id"], queue_id=queue_id, organization_id=organizations.get(queue_id), phone=phone, status=status
+            )
+            for row, (queue_id, phone) in zip(rows, tickets)
+        ]
+        await Atendimento.bulk_create(atendimentos, using_db=conn)
+    elif dialect == "sqlite":
+        atendimentos = [
+            Atendimento(queue_id=queue_id, organization_id=organizations.get(queue_id), phone=phone, status=status)
+            for queue_id, phone in tickets
+        ]
+        await Atendimento.bulk_create(atendimentos, using_db=conn)
+        _, rows = await conn.execute_query(
+            'SELECT "id" FROM "atendimento" ORDER BY "id" DESC LIMIT ?', [len(tickets)]
+        )
+        for atendimento, row in zip(atendimentos, reversed(rows)):
+            atendimento.id = row["id"]
+    else:
+        raise NotImplementedError(f"Bulk insert not supported for {dialect}")
+    return atendimentos
+
+
+# Shared engine instance used by the routers and the HTMX backend
+engine = QueueEngine()
+coordinator.on_remote(engine.apply_event)
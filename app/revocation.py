@@ -0,0 +1,121 @@
+# app/revocation.py
+"""
+Access token revocation.
+
+A token is rejected when its ``jti`` was revoked (logout) or when it was
+issued before its user's cutoff (role change, deletion, "log out
+everywhere"). Both checks are dict lookups on data held in memory, so
+verifying a request never queries the database.
+
+With ``revocation_backend: database`` every revocation is also written to
+the RevokedToken / TokenCutoff tables, and each worker pulls the rows
+written by the others every ``revocation_sync_seconds``; a revocation
+therefore reaches all workers within that interval. With ``memory`` the
+set lives in this process only (single worker, tests); app.config rejects
+it when several workers run.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Optional
+
+from tortoise import timezone
+
+from app.models import RevokedToken, TokenCutoff
+
+logger = logging.getLogger("qapp_revocation")
+
+# Re-read rows this much older than the last sync, so rows committed late
+# (or stamped by a worker whose clock lags) are not missed
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class RevocationList:
+    def __init__(self, backend: str = "memory"):
+        if backend not in ("memory", "database"):
+            raise ValueError(f"Unknown revocation backend: {backend}")
+        self.backend = backend
+        self._jtis: Dict[str, float] = {}  # jti -> token expiry (Unix time)
+        self._cutoffs: Dict[int, float] = {}  # user_id -> not_before (Unix time)
+        self._synced_at: Optional[datetime] = None
+
+    def is_revoked(self, claims: dict) -> bool:
+        """O(1): revoked jti, or issued before the user's cutoff."""
+        jti = claims.get("jti")
+        if jti is not None and jti in self._jtis:
+            return True
+        if not self._cutoffs:
+            return False
+        try:
+            cutoff = self._cutoffs.get(int(claims.get("sub")))
+        except (TypeError, ValueError):
+            return False
+        return cutoff is not None and claims.get("iat", 0) < cutoff
+
+    async def revoke_token(self, claims: dict):
+        """Revoke one token until it would have expired anyway."""
+        jti = claims.get("jti")
+        if jti is None:
+            # Tokens from before jti existed can only be revoked per user
+            await self.revoke_user(int(claims["sub"]))
+            return
+        expires = float(claims.get("exp", time.time()))
+        self._jtis[jti] = expires
+        if self.backend == "database":
+            await RevokedToken.update_or_create(
+                jti=jti,
+                defaults={
+                    "user_id": int(claims["sub"]),
+                    "expires_at": datetime.fromtimestamp(expires, dt_timezone.utc),
+                },
+            )
+
+    async def revoke_user(self, user_id: int, not_before: Optional[float] = None):
+        """Invalidate every token of a user issued before ``not_before`` (now)."""
+        not_before = not_before or time.time()
+        self._cutoffs[user_id] = max(not_before, self._cutoffs.get(user_id, 0))
+        if self.backend == "database":
+            await TokenCutoff.update_or_create(user_id=user_id, defaults={"not_before": self._cutoffs[user_id]})
+
+    async def sync(self) -> int:
+        """Pull revocations written by other workers. Returns rows read."""
+        if self.backend != "database":
+            return 0
+        now = timezone.now()
+        tokens = RevokedToken.filter(expires_at__gt=now)
+        cutoffs = TokenCutoff.all()
+        if self._synced_at is not None:
+            tokens = tokens.filter(created_at__gte=self._synced_at - SYNC_OVERLAP)
+            cutoffs = cutoffs.filter(updated_at__gte=self._synced_at - SYNC_OVERLAP)
+        token_rows = await tokens.values_list("jti", "expires_at")
+        cutoff_rows = await cutoffs.values_list("user_id", "not_before")
+        for jti, expires_at in token_rows:
+            self._jtis[jti] = expires_at.timestamp()
+        for user_id, not_before in cutoff_rows:
+            self._cutoffs[user_id] = max(not_before, self._cutoffs.get(user_id, 0))
+        self._synced_at = now
+        return len(token_rows) + len(cutoff_rows)
+
+    async def prune(self):
+        """Drop revoked tokens that have expired on their own."""
+        now = time.time()
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        if self.backend == "database":
+            await RevokedToken.filter(expires_at__lte=timezone.now()).delete()
+
+    async def run(self, sync_seconds: float = 5, prune_seconds: float = 3600):
+        """Sync and prune periodically (run as a background task)."""
+        last_prune = time.monotonic()
+        while True:
+            try:
+                await self.sync()
+                if time.monotonic() - last_prune >= prune_seconds:
+                    await self.prune()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                logger.error(f"Revocation sync failed: {e}")
+            await asyncio.sleep(sync_seconds)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, "tokens": len(self._jtis), "users": len(self._cutoffs)}
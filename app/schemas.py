@@ -1,16 +1,84 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime
+
+class UserCreate(BaseModel):
+    name: str
+    phone: str
+    password: str
+    role: str = "atendente"
+
+class UserRead(BaseModel):
+    id: int
+    name: str
+    phone: str
+    role: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True  # pydantic v1
+        from_attributes = True  # pydantic v2
+
+class OrganizationRead(BaseModel):
+    id: int
+    slug: str
+    name: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True  # pydantic v1
+        from_attributes = True  # pydantic v2
+
+class QueueCreate(BaseModel):
+    name: str
+    organization_id: Optional[int] = None
+
+class QueueRead(BaseModel):
+    id: int
+    name: str
+    active: bool
+    created_by_id: int
+    organization_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True  # pydantic v1
+        from_attributes = True  # pydantic v2
 
 class AtendimentoCreate(BaseModel):
     queue_id: int
     phone: str
 
+class AtendimentoBulkCreate(BaseModel):
+    items: List[AtendimentoCreate]
+
+class AtendimentoBulkResult(BaseModel):
+    ids: List[int]
+
 class AtendimentoRead(BaseModel):
     id: int
     queue_id: int
+    organization_id: Optional[int] = None
     phone: str
     status: str
     atendente_id: Optional[int]
+    created_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True
+        orm_mode = True  # pydantic v1
+        from_attributes = True  # pydantic v2
+
+class AtendimentoPosition(BaseModel):
+    atendimento_id: int
+    queue_id: int
+    status: str
+    position: Optional[int] = None
+    ahead: Optional[int] = None
+    waiting: int
+    service_seconds: Optional[float] = None
+    eta_seconds: Optional[int] = None
+    estimated_call_at: Optional[datetime] = None
+
+class AtendimentoPage(BaseModel):
+    items: List[AtendimentoRead]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,74 @@
+# app/startup.py
+"""
+Worker startup: phases and how long each took.
+
+The app modules mark where each phase begins (``startup_timer.begin``):
+
+    imports        importing the app module and everything it pulls in
+    database       opening the ORM connections (Tortoise's lifespan)
+    migrations     schema check and pending migrations
+    coordination   joining the other workers (events, shared counters)
+    queue_engine   rebuilding the in-memory queue index
+    templates      compiling the HTML and notification templates
+    background     config reload, rollups, revocation sync, reminders
+
+``finish`` logs the breakdown once the worker is ready to serve, and
+/metrics exports it as ``qapp_startup_phase_seconds{phase}``.
+
+Only the standard library is imported here, so an app module can import
+this first and time all of its other imports.
+"""
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("qapp_startup")
+
+
+class StartupTimer:
+    """
+    Consecutive startup phases of this process and their durations (seconds).
+    Time outside any phase (between the end of the imports and the start of
+    the lifespan, e.g. the server's own setup) is not counted.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._phase: Optional[str] = None
+        self._started = 0.0
+
+    def begin(self, phase: str):
+        """Close the running phase, if any, and start ``phase``."""
+        self.end()
+        self._phase, self._started = phase, time.perf_counter()
+
+    def end(self):
+        if self._phase is not None:
+            elapsed = time.perf_counter() - self._started
+            self.phases[self._phase] = self.phases.get(self._phase, 0.0) + elapsed
+            self._phase = None
+
+    def finish(self) -> float:
+        """Close the last phase and log the breakdown; returns the total."""
+        self.end()
+        total = sum(self.phases.values())
+        breakdown = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases.items())
+        logger.info(f"Started in {total * 1000:.0f} ms: {breakdown}")
+        return total
+
+    def lifespan(self, lifespan: Callable) -> Callable:
+        """
+        Wrap an app's lifespan so that the "database" phase covers the
+        context entered before the startup handlers (Tortoise's init).
+        """
+        @asynccontextmanager
+        async def timed(app):
+            self.begin("database")
+            async with lifespan(app) as state:
+                yield state
+        return timed
+
+
+# Process-wide timer (one app per worker process)
+startup_timer = StartupTimer()
@@ -1,63 +1,336 @@
 # app/tasks.py
 from fastapi import BackgroundTasks
-from app.utils import send_email, logger
-from app.models import Atendimento, AtendimentoStatus
-from tortoise.expressions import Q
-from datetime import datetime, timedelta
+from app.utils import logger
+from app.models import (
+    Atendimento, AtendimentoStatus, MessageType, MessageLog, AtendimentoArchive, MessageLogArchive, Outbox
+)
+from app.outbox import enqueue_email, enqueue_many
+from app.queue_engine import engine
+from app.crud import atendimentos_page
+from app.leases import acquire_lease, default_holder
+from app.messages import message_templates
+from app.organizations import organizations
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+from datetime import timedelta
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
 import asyncio
+import gzip
+import json
+import os
+import shutil
+import time
 
-async def notify_new_entry(atendimento_id: int, background_tasks: BackgroundTasks):
+# Tickets that will not change state anymore and can be archived
+CLOSED_STATUSES = [AtendimentoStatus.CHAMADO, AtendimentoStatus.CANCELADO, AtendimentoStatus.ATENDIDO]
+
+# Most ticket ids bound in one statement (``id IN (...)``): SQLite builds
+# before 3.32 accept at most 999 variables, a few go to the other filters
+MAX_BATCH_IDS = 900
+
+# Subdirectory of an archive path holding the batch being moved
+ARCHIVE_STAGING = ".pending"
+
+def _email(message_type: MessageType, atendimento, subject: str, content: str) -> dict:
+    return {
+        "to_email": atendimento.phone,  # Replace with actual email field if available
+        "subject": subject,
+        "content": content,
+        "atendimento_id": atendimento.id,
+        "message_type": message_type,
+    }
+
+
+async def _emails(message_type: MessageType, atendimentos: list) -> List[dict]:
     """
-    Send an email notification when a new Atendimento is added to the queue.
+    Notification emails for many tickets, rendered as one batch per
+    organization (with that organization's texts, see app.messages).
     """
-    from app.models import Atendimento
-    atendimento = await Atendimento.get(id=atendimento_id)
-    email = atendimento.phone  # Replace with actual email field if available
+    slugs = await organizations.slugs(a.organization_id for a in atendimentos)
+    batches: Dict[Optional[str], List[int]] = defaultdict(list)
+    for i, atendimento in enumerate(atendimentos):
+        batches[slugs.get(atendimento.organization_id)].append(i)
+    emails: List[dict] = [None] * len(atendimentos)
+    for slug, indexes in batches.items():
+        rendered = message_templates.render_many(
+            message_type, ({"atendimento": atendimentos[i]} for i in indexes), slug
+        )
+        for i, (subject, content) in zip(indexes, rendered):
+            emails[i] = _email(message_type, atendimentos[i], subject, content)
+    return emails
+
 
-    subject = "qApp Queue Notification"
-    content = f"You have been added to the queue: {atendimento.id} in queue {atendimento.queue_id}"
-    background_tasks.add_task(send_email, to_email=email, subject=subject, content=content)
-    logger.info(f"Scheduled new entry email for Atendimento {atendimento_id}")
+async def notify_new_entry(atendimento: Atendimento):
+    """
+    Queue an email notification when a new Atendimento is added to the queue.
+    """
+    await enqueue_email(**(await _emails(MessageType.ENTRADA, [atendimento]))[0])
+    logger.info(f"Queued new entry email for Atendimento {atendimento.id}")
 
 
-async def notify_called(atendimento_id: int, background_tasks: BackgroundTasks):
+async def notify_new_entries(atendimentos: List[Atendimento]):
     """
-    Send an email notification when an Atendimento is called.
+    Queue new-entry notifications for many Atendimentos with one insert.
     """
-    atendimento = await Atendimento.get(id=atendimento_id)
-    email = atendimento.phone  # Replace with actual email field if available
+    await enqueue_many(await _emails(MessageType.ENTRADA, atendimentos))
+    logger.info(f"Queued {len(atendimentos)} new entry emails")
+
 
-    subject = "qApp Queue Update"
-    content = f"You are now being served: Atendimento {atendimento.id} in queue {atendimento.queue_id}"
-    background_tasks.add_task(send_email, to_email=email, subject=subject, content=content)
-    logger.info(f"Scheduled called email for Atendimento {atendimento_id}")
+async def notify_called(atendimento: Atendimento):
+    """
+    Queue an email notification when an Atendimento is called.
+    """
+    await enqueue_email(**(await _emails(MessageType.CHAMADA, [atendimento]))[0])
+    logger.info(f"Queued called email for Atendimento {atendimento.id}")
 
 
-async def cleanup_old_atendimentos(days: int = 7):
+async def _cancel_waiting(ids: List[int]) -> List[int]:
     """
-    Periodically clean up Atendimento entries older than `days` and mark them as cancelled if still pending.
+    Cancel those of ``ids`` still waiting; returns the ids actually cancelled
+    (UPDATE ... RETURNING, as the claim in app.queue_engine). Tickets called
+    or cancelled since they were selected are left out.
     """
-    threshold = datetime.utcnow() - timedelta(days=days)
-    old_atendimentos = await Atendimento.filter(
-        Q(status=AtendimentoStatus.AGUARDANDO) & Q(created_at__lt=threshold)
+    db = Atendimento._meta.db
+    if db.capabilities.dialect == "postgres":
+        marks = [f"${i}" for i in range(1, len(ids) + 4)]
+    else:
+        marks = ["?"] * (len(ids) + 3)
+    _, rows = await db.execute_query(
+        f'UPDATE "atendimento" SET "status" = {marks[0]}, "updated_at" = {marks[1]} '
+        f'WHERE "status" = {marks[2]} AND "id" IN ({", ".join(marks[3:])}) RETURNING "id"',
+        [AtendimentoStatus.CANCELADO.value, timezone.now(), AtendimentoStatus.AGUARDANDO.value, *ids],
     )
-    for atendimento in old_atendimentos:
-        atendimento.status = AtendimentoStatus.CANCELADO
-        await atendimento.save()
-        logger.info(f"Cancelled old Atendimento {atendimento.id}")
+    return [row["id"] for row in rows]
+
+
+async def cleanup_old_atendimentos(days: int = 7, batch_size: int = 1000) -> dict:
+    """
+    Cancel Atendimento entries still pending after `days`.
+    Runs set-based UPDATEs over at most `batch_size` rows at a time (capped
+    at MAX_BATCH_IDS), so no single statement holds the table for long, and
+    returns a progress report.
+    """
+    batch_size = min(batch_size, MAX_BATCH_IDS)
+    threshold = timezone.now() - timedelta(days=days)
+    report = {"cancelled": 0, "batches": 0}
+    start = time.perf_counter()
+    while True:
+        ids = await Atendimento.filter(
+            status=AtendimentoStatus.AGUARDANDO, created_at__lt=threshold
+        ).order_by("created_at").limit(batch_size).values_list("id", flat=True)
+        if not ids:
+            break
+        cancelled = await _cancel_waiting(ids)
+        report["cancelled"] += len(cancelled)
+        report["batches"] += 1
+        engine.expire(cancelled)
+        logger.info(f"Cleanup batch {report['batches']}: {report['cancelled']} old Atendimentos cancelled so far")
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(f"Cleanup finished: {report}")
+    return report
+
+
+def _archive_row(row: dict) -> dict:
+    return {
+        key: value.isoformat() if hasattr(value, "isoformat") else getattr(value, "value", value)
+        for key, value in row.items()
+    }
+
+
+def _archive_partition(path: str, slug: Optional[str], created_at) -> str:
+    """Archive file of one organization's tickets created in one month."""
+    return os.path.join(path, slug or "_shared", f"atendimentos-{created_at:%Y-%m}.ndjson.gz")
+
+
+def _stage_archive(path: str, ids: List[int], lines: Dict[str, List[str]]):
+    """
+    Write one batch's lines, a gzip member per archive file, under
+    `<path>/.pending`, with a manifest of the batch's ticket ids and the
+    size of each archive file before it. The manifest is written last: a
+    staging directory without one is an incomplete batch.
+    """
+    staging = os.path.join(path, ARCHIVE_STAGING)
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    parts = []
+    for n, (partition, partition_lines) in enumerate(sorted(lines.items())):
+        staged = f"{n}.gz"
+        with open(os.path.join(staging, staged), "wb") as f:
+            f.write(gzip.compress("".join(partition_lines).encode("utf-8")))
+        size = os.path.getsize(partition) if os.path.exists(partition) else 0
+        parts.append({"partition": partition, "size": size, "staged": staged})
+    manifest = os.path.join(staging, "manifest.json")
+    with open(manifest + ".tmp", "w") as f:
+        json.dump({"ids": ids, "parts": parts}, f)
+    os.replace(manifest + ".tmp", manifest)
+
+
+def _apply_archive(path: str) -> List[str]:
+    """
+    Append the staged batch to its archive files and drop the staging
+    directory; returns the files written. Safe to repeat after a crash:
+    each file is first cut back to its size before the batch.
+    """
+    staging = os.path.join(path, ARCHIVE_STAGING)
+    with open(os.path.join(staging, "manifest.json")) as f:
+        manifest = json.load(f)
+    for part in manifest["parts"]:
+        os.makedirs(os.path.dirname(part["partition"]), exist_ok=True)
+        with open(os.path.join(staging, part["staged"]), "rb") as staged, open(part["partition"], "ab") as archive:
+            archive.truncate(part["size"])
+            archive.write(staged.read())
+    shutil.rmtree(staging)
+    return [part["partition"] for part in manifest["parts"]]
+
+
+async def _recover_archive(path: str) -> List[str]:
+    """
+    Finish a batch left staged by an interrupted run: append it if its
+    delete committed (its tickets are gone), else drop it, since the
+    tickets are still in the table and will be archived again.
+    """
+    staging = os.path.join(path, ARCHIVE_STAGING)
+    manifest = os.path.join(staging, "manifest.json")
+    if not os.path.exists(manifest):
+        shutil.rmtree(staging, ignore_errors=True)
+        return []
+    with open(manifest) as f:
+        ids = json.load(f)["ids"]
+    if await Atendimento.filter(id__in=ids).exists():
+        shutil.rmtree(staging)
+        return []
+    logger.info(f"Archive: appending the batch of {len(ids)} Atendimentos left by an interrupted run")
+    return _apply_archive(path)
+
+
+async def archive_closed_atendimentos(days: int = 90, batch_size: int = 1000, path: Optional[str] = None) -> dict:
+    """
+    Move closed Atendimento entries older than `days`, with their MessageLog
+    rows, out of the hot tables.
+
+    By default rows are copied into AtendimentoArchive / MessageLogArchive.
+    With `path`, they are appended to gzip-compressed NDJSON files instead
+    (one JSON object per line, tagged with its table), partitioned by
+    organization and month: `<path>/<organization slug>/atendimentos-YYYY-MM.ndjson.gz`,
+    `_shared` for tickets of no organization. A message goes to its ticket's
+    file.
+
+    Each batch (at most MAX_BATCH_IDS tickets) is copied and deleted in one
+    transaction. Files cannot join it, so a batch is staged next to them
+    first and appended only once its delete has committed; a batch left
+    staged by an interrupted run is finished (or dropped) by the next one.
+    Either way no row is written to the files twice.
+    """
+    batch_size = min(batch_size, MAX_BATCH_IDS)
+    threshold = timezone.now() - timedelta(days=days)
+    report = {"atendimentos": 0, "messages": 0, "batches": 0}
+    archive_files = set()
+    start = time.perf_counter()
+    if path:
+        archive_files.update(await _recover_archive(path))
+    while True:
+        rows = await Atendimento.filter(
+            status__in=CLOSED_STATUSES, created_at__lt=threshold
+        ).order_by("id").limit(batch_size).values(
+            "id", "queue_id", "phone", "status", "atendente_id", "organization_id", "created_at", "updated_at"
+        )
+        if not rows:
+            break
+        ids = [row["id"] for row in rows]
+        logs = await MessageLog.filter(atendimento_id__in=ids).values(
+            "id", "atendimento_id", "organization_id", "message_type", "content", "sent_at"
+        )
+
+        if path:
+            slugs = await organizations.slugs(row["organization_id"] for row in rows)
+            partitions = {
+                row["id"]: _archive_partition(path, slugs.get(row["organization_id"]), row["created_at"])
+                for row in rows
+            }
+            lines: Dict[str, List[str]] = defaultdict(list)
+            for table, items, key in (("atendimento", rows, "id"), ("messagelog", logs, "atendimento_id")):
+                for item in items:
+                    lines[partitions[item[key]]].append(json.dumps({"table": table, **_archive_row(item)}) + "\n")
+            _stage_archive(path, ids, lines)
+
+        async with in_transaction() as conn:
+            if not path:
+                await AtendimentoArchive.bulk_create(
+                    [AtendimentoArchive(**row) for row in rows], using_db=conn
+                )
+                if logs:
+                    await MessageLogArchive.bulk_create(
+                        [MessageLogArchive(**log) for log in logs], using_db=conn
+                    )
+            await MessageLog.filter(atendimento_id__in=ids).using_db(conn).delete()
+            await Atendimento.filter(id__in=ids).using_db(conn).delete()
+        if path:
+            archive_files.update(_apply_archive(path))
+
+        report["atendimentos"] += len(rows)
+        report["messages"] += len(logs)
+        report["batches"] += 1
+        logger.info(f"Archive batch {report['batches']}: {report['atendimentos']} Atendimentos archived so far")
+    if path:
+        report["files"] = sorted(archive_files)
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(f"Archive finished: {report}")
+    return report
+
+
+async def send_reminders(remind_every_seconds: int = 3600, chunk_size: int = 1000) -> dict:
+    """
+    Queue a reminder for every pending Atendimento that has waited at least
+    `remind_every_seconds` and has had no reminder within that window.
+
+    Pending tickets are streamed in keyset chunks (at most MAX_BATCH_IDS);
+    per chunk one query on MessageLog (sent reminders) and one on Outbox
+    (reminders still queued) find the tickets to skip, and the rest are
+    queued with one bulk insert.
+    """
+    chunk_size = min(chunk_size, MAX_BATCH_IDS)
+    cutoff = timezone.now() - timedelta(seconds=remind_every_seconds)
+    query = Atendimento.filter(status=AtendimentoStatus.AGUARDANDO, created_at__lt=cutoff)
+    report = {"checked": 0, "queued": 0}
+    start = time.perf_counter()
+    cursor = None
+    while True:
+        rows, cursor = await atendimentos_page(query, cursor, chunk_size)
+        if not rows:
+            break
+        ids = [row["id"] for row in rows]
+        recent = set(await MessageLog.filter(
+            atendimento_id__in=ids, message_type=MessageType.LEMBRETE, sent_at__gte=cutoff
+        ).values_list("atendimento_id", flat=True))
+        recent.update(await Outbox.filter(
+            atendimento_id__in=ids, message_type=MessageType.LEMBRETE, created_at__gte=cutoff
+        ).values_list("atendimento_id", flat=True))
+        due = await _emails(MessageType.LEMBRETE, [SimpleNamespace(**row) for row in rows if row["id"] not in recent])
+        if due:
+            await enqueue_many(due)
+        report["checked"] += len(rows)
+        report["queued"] += len(due)
+        if cursor is None:
+            break
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(f"Reminder pass: {report}")
+    return report
 
 
-async def periodic_email_reminder(interval_seconds: int = 3600):
+async def periodic_email_reminder(interval_seconds: int = 3600, chunk_size: int = 1000):
     """
-    Periodically send reminders for pending atendimentos.
+    Periodically queue reminders for pending atendimentos.
+    Safe to start in every worker: a lease makes only one of them run each pass.
     """
+    holder = default_holder()
     while True:
-        pending_atendimentos = await Atendimento.filter(status=AtendimentoStatus.AGUARDANDO)
-        for atendimento in pending_atendimentos:
-            email = atendimento.phone  # Replace with actual email
-            subject = "qApp Queue Reminder"
-            content = f"Reminder: You are still in the queue. Atendimento {atendimento.id}"
-            await send_email(email, subject, content)
+        try:
+            if await acquire_lease("periodic_email_reminder", holder, ttl_seconds=interval_seconds):
+                await send_reminders(interval_seconds, chunk_size)
+        except Exception as e:
+            logger.error(f"Reminder pass failed: {e}")
         await asyncio.sleep(interval_seconds)
 
 
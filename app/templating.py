@@ -0,0 +1,45 @@
+# app/templating.py
+"""
+The HTML templates (templates/) of the pages, the cached fragments and the
+SSE deltas, in one Jinja environment per process.
+
+Jinja is imported and the environment built on first use, so processes
+that render nothing (the outbox dispatcher, migrations) never load it.
+Web workers call ``compile_templates`` at startup: every template is
+parsed and compiled before the first request instead of by it. In
+production the compiled templates are kept for the life of the process;
+in development each use still checks the file and picks up edits.
+"""
+from typing import TYPE_CHECKING, Optional
+
+from app.config import production
+
+if TYPE_CHECKING:
+    from fastapi.templating import Jinja2Templates
+    from jinja2 import Template
+
+TEMPLATES_DIR = "templates"
+
+_templates: Optional["Jinja2Templates"] = None
+
+
+def templates() -> "Jinja2Templates":
+    global _templates
+    if _templates is None:
+        from fastapi.templating import Jinja2Templates
+        _templates = Jinja2Templates(directory=TEMPLATES_DIR)
+        _templates.env.auto_reload = not production()
+    return _templates
+
+
+def get_template(name: str) -> "Template":
+    return templates().get_template(name)
+
+
+def compile_templates() -> int:
+    """Compile every template now; returns how many there are."""
+    env = templates().env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
@@ -1,48 +1,13 @@
 # app/utils.py
-import smtplib
-from email.mime.text import MIMEText
 from typing import Optional
-import yaml
 import logging
 import re
 
-# Load config
-with open("app/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("qapp_utils")
 
 
-def send_email(to_email: str, subject: str, content: str):
-    """
-    Send an email using SMTP configuration from config.yaml
-    """
-    smtp_config = config.get("smtp")
-    if not smtp_config:
-        logger.error("SMTP configuration missing in config.yaml")
-        return
-
-    msg = MIMEText(content)
-    msg["Subject"] = subject
-    msg["From"] = smtp_config.get("from_email", "noreply@qapp.com")
-    msg["To"] = to_email
-
-    try:
-        with smtplib.SMTP(smtp_config["host"], smtp_config["port"]) as server:
-            if smtp_config.get("use_tls", False):
-                server.starttls()
-            username = smtp_config.get("username")
-            password = smtp_config.get("password")
-            if username and password:
-                server.login(username, password)
-            server.send_message(msg)
-        logger.info(f"Email sent to {to_email}")
-    except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {e}")
-
-
 def format_phone(phone: str) -> str:
     """
     Standardize phone numbers: remove spaces, parentheses, dashes.
@@ -51,17 +16,14 @@ def format_phone(phone: str) -> str:
     return phone_clean
 
 
-def queue_statistics(atendimentos: list) -> dict:
+def queue_statistics(status_counts: dict) -> dict:
     """
-    Generate simple queue statistics from a list of Atendimento objects/dicts.
+    Generate simple queue statistics from per-status counts
+    (as returned by app.crud.queue_status_counts).
     """
-    stats = {
-        "total": len(atendimentos),
-        "aguardando": sum(1 for a in atendimentos if a.status == "aguardando"),
-        "chamado": sum(1 for a in atendimentos if a.status == "chamado"),
-        "cancelado": sum(1 for a in atendimentos if a.status == "cancelado"),
-        "atendido": sum(1 for a in atendimentos if a.status == "atendido"),
-    }
+    stats = {"total": sum(status_counts.values())}
+    for status in ("aguardando", "chamado", "cancelado", "atendido"):
+        stats[status] = status_counts.get(status, 0)
     return stats
 
 
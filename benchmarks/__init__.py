@@ -0,0 +1,3 @@
+# benchmarks/__init__.py
+
+# Standalone benchmark and stress scripts, run as `python -m benchmarks.<name>`.
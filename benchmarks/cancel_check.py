@@ -0,0 +1,100 @@
+# benchmarks/cancel_check.py
+"""
+Check of who may cancel which ticket, through POST /atendimentos/cancel/{id}
+of app.main (run in-process with httpx's ASGI transport, temporary SQLite
+database).
+
+    attendant   a ticket they called            200
+                the same ticket again           409
+                a waiting ticket                403
+                a ticket another attendant called 403
+    admin       a waiting ticket                200, leaves the queue
+                a called ticket                 200
+                a cancelled ticket              409
+
+Exits with status 1 and lists the mismatches if any case differs.
+
+    python -m benchmarks.cancel_check
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import yaml
+
+
+async def run() -> list:
+    import httpx
+    from app.auth import create_access_token
+    from app.main import app
+    from app.models import Atendimento, AtendimentoStatus, Queue, User, UserRole
+
+    async with app.router.lifespan_context(app):
+        admin = await User.create(name="admin", phone="c-admin", password_hash="x", role=UserRole.ADMIN)
+        ana = await User.create(name="ana", phone="c-ana", password_hash="x")
+        rui = await User.create(name="rui", phone="c-rui", password_hash="x")
+        queue = await Queue.create(name="cancel", created_by=admin)
+        tokens = {user: create_access_token(user.id, user.role) for user in (admin, ana, rui)}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            async def add() -> int:
+                response = await client.post(
+                    "/atendimentos/", data={"queue_id": queue.id, "phone": "+258000000000"},
+                    headers={"Authorization": f"Bearer {tokens[admin]}"},
+                )
+                return response.json()["id"]
+
+            async def call(user: User) -> int:
+                response = await client.post("/atendimentos/next", data={"queue_id": queue.id, "atendente_id": user.id})
+                return response.json()["id"]
+
+            async def cancel(user: User, atendimento_id: int) -> int:
+                response = await client.post(
+                    f"/atendimentos/cancel/{atendimento_id}", headers={"Authorization": f"Bearer {tokens[user]}"}
+                )
+                return response.status_code
+
+            # Called in order: ana gets the first, rui the second; the rest wait
+            ids = [await add() for _ in range(5)]
+            called_by_ana, called_by_rui = await call(ana), await call(rui)
+            waiting, other_waiting, admin_called = ids[2], ids[3], ids[4]
+
+            results = [
+                ("attendant cancels a ticket they called", 200, await cancel(ana, called_by_ana)),
+                ("attendant cancels it again", 409, await cancel(ana, called_by_ana)),
+                ("attendant cancels a waiting ticket", 403, await cancel(ana, waiting)),
+                ("attendant cancels another attendant's ticket", 403, await cancel(ana, called_by_rui)),
+                ("admin cancels a waiting ticket", 200, await cancel(admin, waiting)),
+                ("admin cancels a called ticket", 200, await cancel(admin, called_by_rui)),
+                ("admin cancels a cancelled ticket", 409, await cancel(admin, waiting)),
+            ]
+            # The waiting ticket left the queue: the next call skips it
+            results.append(("next call after the admin's cancel", other_waiting, await call(ana)))
+            results.append(("last waiting ticket", admin_called, await call(rui)))
+            status = await Atendimento.get(id=called_by_ana).values_list("status", flat=True)
+            results.append(("status in the database", AtendimentoStatus.CANCELADO, status))
+    return results
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="qapp-cancel-")
+    config_file = os.path.join(tmp, "config.yaml")
+    with open(config_file, "w") as f:
+        yaml.safe_dump({
+            "database_url": f"sqlite://{os.path.join(tmp, 'cancel.sqlite3')}",
+            "jwt_secret": "check-secret-" + "x" * 32,
+        }, f)
+    os.environ["QAPP_CONFIG"] = config_file
+
+    failed = 0
+    for case, expected, got in asyncio.run(run()):
+        ok = expected == got
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {case}: expected {expected}, got {got}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
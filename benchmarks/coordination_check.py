@@ -0,0 +1,269 @@
+# benchmarks/coordination_check.py
+"""
+Multi-worker check of app.coordination, with no external service.
+
+sqlite: ``--workers`` processes share one app database and one
+coordination file, as ``uvicorn --workers N`` would. They add tickets to
+the same queue concurrently, then all call "next" until the queue is
+empty. Checked: every ticket is called exactly once, every worker's
+index and lobby stream saw every add/call, and the shared counters
+(issued, served, now serving) match. Event fan-out latency is reported.
+
+redis: two coordinators in one process talk through an in-memory
+stand-in for the Redis client (pub/sub, INCRBY, SET, MGET), which
+exercises RedisBackend without a server.
+
+    python -m benchmarks.coordination_check --workers 4 --tickets 200
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+
+# -----------------------
+# sqlite: one process per worker
+# -----------------------
+async def worker_main(index: int, db_path: str, coord_path: str, tickets: int, barrier, result_queue):
+    from tortoise import Tortoise
+
+    from app.coordination import coordinator, now_serving_key, issued_key, served_key
+    from app.events import bus, ADDED, CALLED
+    from app.queue_engine import engine
+
+    await Tortoise.init(db_url=f"sqlite://{db_path}", modules={"models": ["app.models"]})
+    try:
+        await coordinator.start({"backend": "sqlite", "path": coord_path, "poll_interval": 0.01})
+        await engine.rebuild()
+        seen = defaultdict(set)
+        latencies = []
+
+        async def listen(inbox):
+            while True:
+                event = await inbox.get()
+                seen[event["type"]].add(event["id"])
+                if event["type"] == ADDED and event["phone"].startswith("t"):
+                    latencies.append(time.time() - float(event["phone"].split(":")[1]))
+
+        # Room for every event: measure delivery, not the bus's slow-subscriber drop
+        bus.max_pending = 2 * tickets * barrier.parties
+        async with bus.subscribe(1) as inbox:
+            listener = asyncio.create_task(listen(inbox))
+            await asyncio.to_thread(barrier.wait, 120)
+            for i in range(tickets):
+                await engine.add(1, f"t{index}:{time.time():.6f}"[:20])
+                await asyncio.sleep(0)
+            await coordinator.flush()
+            await asyncio.to_thread(barrier.wait, 120)
+            await asyncio.sleep(0.3)  # let the last adds arrive everywhere
+            depth_before = engine.depth(1)
+            called = []
+            while True:
+                atendimento = await engine.next(1, atendente_id=index + 1)
+                if atendimento is None:
+                    break
+                called.append(atendimento.id)
+            await coordinator.flush()
+            await asyncio.to_thread(barrier.wait, 120)
+            await asyncio.sleep(0.3)
+            listener.cancel()
+        counters = await coordinator.counters([issued_key(1), served_key(1), now_serving_key(1)])
+        result_queue.put({
+            "worker": index,
+            "depth_before_calls": depth_before,
+            "depth_after": engine.depth(1),
+            "called": called,
+            "seen_added": len(seen[ADDED]),
+            "seen_called": len(seen[CALLED]),
+            "latencies": latencies,
+            "counters": counters,
+            "stats": coordinator.stats(),
+        })
+    finally:
+        await coordinator.close()
+        await Tortoise.close_connections()
+
+
+def run_worker(index, *args):
+    try:
+        asyncio.run(worker_main(index, *args))
+    except BaseException as e:
+        args[-1].put({"worker": index, "error": repr(e)})
+        raise
+
+
+async def create_schema(db_path: str, workers: int):
+    from tortoise import Tortoise
+    from app.models import Queue, User
+
+    await Tortoise.init(db_url=f"sqlite://{db_path}", modules={"models": ["app.models"]})
+    try:
+        await Tortoise.generate_schemas()
+        db = Tortoise.get_connection("default")
+        await db.execute_script("PRAGMA journal_mode=WAL;")
+        # One attendant per worker (user ids 1..workers)
+        users = [await User.create(name=f"bench {i}", phone=f"bench{i}", password_hash="x") for i in range(workers)]
+        await Queue.create(name="shared", created_by=users[0])
+    finally:
+        await Tortoise.close_connections()
+
+
+def check_sqlite(workers: int, tickets: int) -> dict:
+    tmp = tempfile.mkdtemp()
+    db_path, coord_path = os.path.join(tmp, "app.sqlite3"), os.path.join(tmp, "coordination.sqlite3")
+    asyncio.run(create_schema(db_path, workers))
+
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    processes = [
+        ctx.Process(target=run_worker, args=(i, db_path, coord_path, tickets, barrier, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get(timeout=300) for _ in processes]
+    for process in processes:
+        process.join()
+    errors = [report for report in reports if "error" in report]
+    if errors:
+        raise RuntimeError(f"workers failed: {errors}")
+
+    total = workers * tickets
+    called = [ticket for report in reports for ticket in report["called"]]
+    latencies = [lat * 1000 for report in reports for lat in report["latencies"]]
+    counters = reports[0]["counters"]
+    return {
+        "workers": workers,
+        "tickets": total,
+        "every_ticket_called_once": len(called) == total and len(set(called)) == total,
+        "calls_per_worker": [len(report["called"]) for report in reports],
+        "every_index_saw_every_add": all(report["depth_before_calls"] == total for report in reports),
+        "indexes_empty_after": all(report["depth_after"] == 0 for report in reports),
+        "every_stream_saw_every_add": all(report["seen_added"] == total for report in reports),
+        "every_stream_saw_every_call": all(report["seen_called"] == total for report in reports),
+        "counters": counters,
+        "counters_match": counters["issued:1"] == total and counters["served:1"] == total
+        and counters["now_serving:1"] in called,
+        "fanout_ms": {
+            "p50": round(statistics.median(latencies), 2),
+            "p99": round(sorted(latencies)[int(len(latencies) * 0.99) - 1], 2),
+        },
+    }
+
+
+# -----------------------
+# redis: in-memory stand-in
+# -----------------------
+class FakeRedisServer:
+    def __init__(self):
+        self.data = {}
+        self.channels = defaultdict(list)
+
+
+class FakePubSub:
+    def __init__(self, server: FakeRedisServer):
+        self.server = server
+        self.inbox: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.server.channels[channel].append(self.inbox)
+
+    async def unsubscribe(self, channel):
+        self.server.channels[channel].remove(self.inbox)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+        try:
+            return await asyncio.wait_for(self.inbox.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client, self.calls = client, []
+
+    def incrby(self, key, amount):
+        self.calls.append(lambda: self.client._incrby(key, amount))
+
+    def set(self, key, value):
+        self.calls.append(lambda: self.client.data.__setitem__(key, str(value).encode()))
+
+    async def execute(self):
+        return [call() for call in self.calls]
+
+
+class FakeRedis:
+    """The part of the redis.asyncio client API that RedisBackend uses."""
+
+    def __init__(self, server: FakeRedisServer):
+        self.server, self.data = server, server.data
+
+    def _incrby(self, key, amount):
+        value = int(self.data.get(key, b"0")) + amount
+        self.data[key] = str(value).encode()
+        return value
+
+    async def publish(self, channel, data):
+        for inbox in self.server.channels[channel]:
+            inbox.put_nowait({"type": "message", "channel": channel, "data": data})
+        return len(self.server.channels[channel])
+
+    def pubsub(self):
+        return FakePubSub(self.server)
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def aclose(self):
+        pass
+
+
+async def check_redis(events: int) -> dict:
+    from app.coordination import Coordinator, RedisBackend
+
+    server = FakeRedisServer()
+    a, b = Coordinator(origin="a"), Coordinator(origin="b")
+    received = []
+    b.on_remote(received.append)
+    await a.start(backend=RedisBackend(client=FakeRedis(server)))
+    await b.start(backend=RedisBackend(client=FakeRedis(server)))
+    try:
+        for i in range(events):
+            a.publish(1, {"type": "added", "id": i, "queue_id": 1, "phone": "x"})
+            a.incr("issued:1")
+        b.set("now_serving:1", 7)
+        await asyncio.sleep(0.1)
+        counters = await b.counters(["issued:1", "now_serving:1"])
+        return {
+            "events": events,
+            "delivered_in_order": [event["id"] for event in received] == list(range(events)),
+            "own_events_skipped": a.received == 0,
+            "counters": counters,
+            "counters_match": counters == {"issued:1": events, "now_serving:1": 7},
+        }
+    finally:
+        await a.close()
+        await b.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-worker coordination check")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tickets", type=int, default=200, help="tickets added per worker")
+    args = parser.parse_args()
+    print(json.dumps({
+        "sqlite": check_sqlite(args.workers, args.tickets),
+        "redis_stand_in": asyncio.run(check_redis(args.tickets)),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# benchmarks/dashboard.py
+"""
+Dashboard render time as the number of queues and the size of the ticket
+history grow: the old prefetch + one-query-per-queue build, rendering every
+section on every request, against the page the app serves
+(app.fragments.dashboard_response), measured
+
+    cold      right after every queue changed (no section cached)
+    cached    nothing changed since the last request (sections cached)
+    304       a refresh whose If-None-Match still matches
+
+    python -m benchmarks.dashboard --queues 10 50 200 --history 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from starlette.requests import Request
+from tortoise import Tortoise, timezone
+
+
+async def seed(queues: int, history: int, waiting_per_queue: int):
+    from app.models import AtendimentoStatus
+
+    db = Tortoise.get_connection("default")
+    now = timezone.now()
+    await db.execute_query(
+        'INSERT INTO "user" ("name", "phone", "role", "password_hash", "created_at") VALUES (?, ?, ?, ?, ?)',
+        ["bench", "bench", "admin", "x", now],
+    )
+    await db.execute_many(
+        'INSERT INTO "queue" ("name", "created_by_id", "active", "created_at") VALUES (?, 1, 1, ?)',
+        [[f"queue {q}", now] for q in range(queues)],
+    )
+    rng = random.Random(7)
+    closed = [AtendimentoStatus.ATENDIDO.value, AtendimentoStatus.CANCELADO.value]
+    rows = [
+        [rng.randint(1, queues), f"+258{i:09d}", rng.choice(closed), now - timedelta(minutes=history - i)]
+        for i in range(history)
+    ]
+    rows += [
+        [q, f"+259{q:04d}{i:05d}", AtendimentoStatus.AGUARDANDO.value, now]
+        for q in range(1, queues + 1) for i in range(waiting_per_queue)
+    ]
+    await db.execute_many(
+        'INSERT INTO "atendimento" ("queue_id", "phone", "status", "created_at", "updated_at") '
+        'VALUES (?, ?, ?, ?, ?)',
+        [row + [row[3]] for row in rows],
+    )
+
+
+async def old_dashboard() -> str:
+    from markupsafe import Markup
+    from app.models import Queue, AtendimentoStatus
+    from app.templating import get_template
+
+    queues = await Queue.all().prefetch_related("atendimentos")
+    sections = []
+    for q in queues:
+        pending = await q.atendimentos.filter(status=AtendimentoStatus.AGUARDANDO).order_by("created_at", "id")
+        item = {"queue": q, "atendimentos": pending, "total": len(pending)}
+        sections.append(Markup(get_template("queue_section.html").render(item=item, live=True)))
+    return get_template("fila.html").render(sections=sections)
+
+
+def request(etag: str = None) -> Request:
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+async def measure(build, repeat: int, before=None) -> dict:
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        await build()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 2), "max_ms": round(max(samples), 2)}
+
+
+async def scenario(queues: int, history: int, waiting: int, repeat: int) -> dict:
+    from app.fragments import dashboard_response, fragments
+    from app.queue_engine import engine
+
+    path = os.path.join(tempfile.mkdtemp(), "dashboard.sqlite3")
+    await Tortoise.init(db_url=f"sqlite://{path}", modules={"models": ["app.models"]})
+    try:
+        await Tortoise.generate_schemas(safe=True)
+        await seed(queues, history, waiting)
+        await engine.rebuild()
+        page = await dashboard_response(request())
+        etag = page.headers["etag"]
+        return {
+            "queues": queues,
+            "history": history,
+            "old": await measure(old_dashboard, repeat),
+            "cold": await measure(lambda: dashboard_response(request()), repeat, before=fragments.clear),
+            "cached": await measure(lambda: dashboard_response(request()), repeat),
+            "304": await measure(lambda: dashboard_response(request(etag)), repeat),
+        }
+    finally:
+        await Tortoise.close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard render time vs queues and history")
+    parser.add_argument("--queues", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--history", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--waiting", type=int, default=20, help="waiting tickets per queue")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(scenario(q, h, args.waiting, args.repeat))
+        for q in args.queues for h in args.history
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
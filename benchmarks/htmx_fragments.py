@@ -0,0 +1,123 @@
+# benchmarks/htmx_fragments.py
+"""
+Dashboard and queue panel refreshes through the fragment cache.
+
+Queues are filled with waiting tickets through the engine, then the HTMX
+backend (app.backend, in-process ASGI, no network) is refreshed the way
+lobby screens and attendant panels do:
+
+    cold       caches dropped before each request: query and render
+               everything, as every refresh did before the cache
+    cached     sections already rendered for the current queue state
+    304        client sends the ETag it got (If-None-Match)
+    churn      one ticket added to a random queue every ``--churn``
+               refreshes: only that queue's section (and the page
+               around the sections) is rendered again
+
+Also checked: a change in one queue changes the dashboard's ETag and that
+queue's panel ETag, and leaves the other panels' ETags alone.
+
+    python -m benchmarks.htmx_fragments --queues 20 --tickets 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+from tortoise import Tortoise
+
+
+def summary(samples, seconds: float) -> dict:
+    samples = sorted(samples)
+    return {
+        "requests_per_second": round(len(samples) / seconds),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[max(0, int(len(samples) * 0.99) - 1)], 3),
+    }
+
+
+async def timed(client, path: str, requests: int, before=None, etag=None, expect=200) -> dict:
+    headers = {"If-None-Match": etag} if etag else {}
+    samples = []
+    start = time.perf_counter()
+    for i in range(requests):
+        if before:
+            await before(i)
+        t = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append((time.perf_counter() - t) * 1000)
+        assert response.status_code == expect, (path, response.status_code)
+    return summary(samples, time.perf_counter() - start)
+
+
+async def run(args) -> dict:
+    from app.backend import app
+    from app.fragments import forget_queue_list, fragments
+    from app.models import Queue, User
+    from app.queue_engine import engine
+
+    path = os.path.join(tempfile.mkdtemp(), "htmx_fragments.sqlite3")
+    await Tortoise.init(db_url=f"sqlite://{path}", modules={"models": ["app.models"]})
+    try:
+        await Tortoise.generate_schemas()
+        user = await User.create(name="bench", phone="bench", password_hash="x")
+        for q in range(args.queues):
+            await Queue.create(name=f"queue {q}", created_by=user)
+        rng = random.Random(42)
+        tickets = [(q, f"+258{i:09d}") for q in range(1, args.queues + 1) for i in range(args.tickets)]
+        for start in range(0, len(tickets), 1000):
+            await engine.add_many(tickets[start:start + 1000])
+
+        async def cold(_):
+            fragments.clear()
+            forget_queue_list()
+
+        async def churn(i):
+            if i % args.churn == 0:
+                await engine.add(rng.randint(1, args.queues), "+258999999999")
+
+        result = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, path in (("dashboard", "/"), ("panel", "/queue/1/panel")):
+                etag = (await client.get(path)).headers["etag"]
+                result[name] = {
+                    "cold": await timed(client, path, args.requests // 10, before=cold),
+                    "cached": await timed(client, path, args.requests),
+                    "304": await timed(client, path, args.requests, etag=etag, expect=304),
+                }
+            renders = fragments.renders
+            result["dashboard"]["churn"] = await timed(client, "/", args.requests, before=churn)
+            result["dashboard"]["churn"]["fragments_rendered"] = fragments.renders - renders
+
+            before = {path: (await client.get(path)).headers["etag"] for path in ("/", "/queue/1/panel", "/queue/2/panel")}
+            await engine.add(1, "+258888888888")
+            after = {path: (await client.get(path)).headers["etag"] for path in before}
+            result["invalidation"] = {
+                "dashboard_changed": before["/"] != after["/"],
+                "changed_queue_panel_changed": before["/queue/1/panel"] != after["/queue/1/panel"],
+                "other_queue_panel_unchanged": before["/queue/2/panel"] == after["/queue/2/panel"],
+            }
+        result["cache"] = fragments.stats()
+    finally:
+        await Tortoise.close_connections()
+    return {"queues": args.queues, "tickets_per_queue": args.tickets, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTMX fragment cache: cold vs cached vs 304")
+    parser.add_argument("--queues", type=int, default=20)
+    parser.add_argument("--tickets", type=int, default=200, help="waiting tickets per queue")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--churn", type=int, default=10, help="refreshes per ticket added")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# benchmarks/import_time.py
+"""
+Cold start of a worker: import time and startup phases.
+
+Import time is measured with ``python -X importtime`` in a fresh
+interpreter per run, for each module a process starts from:
+
+    app.main      API workers (uvicorn app.main:app)
+    app.backend   HTMX backend workers
+    app.outbox    notification dispatcher (python -m app.outbox)
+
+The reported time is the sum of the self times of every module the import
+loaded, less what a bare interpreter loads (``-c pass``); ``packages``
+groups it by top-level package, so a heavy dependency pulled in at import
+time (passlib, aiosmtplib, jinja2, ...) shows up by name. ``deferred``
+lists which of those the import did not load at all.
+
+Startup runs app.main's lifespan (database, migrations, queue rebuild,
+template compilation, ...) in a fresh interpreter against a database that
+is already migrated, as a restarted or scaled-out worker finds it, once
+with ``environment: development`` and once with ``environment:
+production``, and reports the per-phase breakdown the app logs.
+
+Results are JSON. ``--save`` writes them to a file; ``--baseline`` compares
+with a saved run and exits with status 1 when an import got slower by more
+than ``--max-regression`` percent.
+
+    python -m benchmarks.import_time --repeat 10
+    python -m benchmarks.import_time --save import_baseline.json
+    python -m benchmarks.import_time --baseline import_baseline.json --max-regression 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["app.main", "app.backend", "app.outbox"]
+# Dependencies no worker needs before its first request
+DEFERRABLE = ["passlib", "bcrypt", "aiosmtplib", "smtplib", "jinja2"]
+
+# Imports the app and runs its lifespan once; prints the timings as JSON
+STARTUP = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def boot():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(boot())
+try:
+    from app.startup import startup_timer
+    phases = startup_timer.phases
+except ImportError:
+    phases = {}
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "phases_ms": {name: seconds * 1000 for name, seconds in phases.items()},
+}))
+"""
+
+
+def _env(**extra) -> dict:
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="")
+    env.update(extra)
+    return env
+
+
+def importtime(statement: str) -> Dict[str, int]:
+    """Self time (us) of every module loaded by ``statement`` in a fresh interpreter."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, env=_env(), capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f"{statement!r} failed:\n{completed.stderr[-2000:]}")
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = int(self_us)
+    return modules
+
+
+def measure_import(module: str, repeat: int, top: int) -> dict:
+    bare = set(importtime("pass"))
+    totals, packages = [], defaultdict(list)
+    loaded: Dict[str, int] = {}
+    for _ in range(repeat):
+        loaded = {name: us for name, us in importtime(f"import {module}").items() if name not in bare}
+        totals.append(sum(loaded.values()) / 1000)
+        grouped = defaultdict(int)
+        for name, us in loaded.items():
+            grouped[name.split(".")[0]] += us
+        for package, us in grouped.items():
+            packages[package].append(us / 1000)
+    heaviest = sorted(packages.items(), key=lambda item: -statistics.median(item[1]))[:top]
+    return {
+        "import_ms": round(statistics.median(totals), 1),
+        "modules": len(loaded),
+        "packages": {package: round(statistics.median(ms), 1) for package, ms in heaviest},
+        "deferred": [package for package in DEFERRABLE if package not in loaded],
+    }
+
+
+def write_config(tmp: str, environment: str, database_url: str) -> str:
+    path = os.path.join(tmp, f"{environment}.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump({
+            "database_url": database_url,
+            "environment": environment,
+            "jwt_secret": "bench-secret-" + "x" * 32,  # PyJWT warns about short HMAC keys
+        }, f)
+    return path
+
+
+def boot(config_file: str) -> dict:
+    """Import app.main and run its startup in a fresh interpreter."""
+    completed = subprocess.run(
+        [sys.executable, "-c", STARTUP], cwd=ROOT, env=_env(QAPP_CONFIG=config_file),
+        capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f"startup with {config_file} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure_startup(config_file: str, repeat: int) -> dict:
+    runs = [boot(config_file) for _ in range(repeat)]
+    return {
+        "import_ms": round(statistics.median(run["import_ms"] for run in runs), 1),
+        "startup_ms": round(statistics.median(run["startup_ms"] for run in runs), 1),
+        "phases_ms": {
+            name: round(statistics.median(run["phases_ms"].get(name, 0) for run in runs), 1)
+            for name in runs[0]["phases_ms"]
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> dict:
+    """Percent change of each module's import time; slower than the limit is a regression."""
+    imports, regressions = {}, []
+    for module, current in result["imports"].items():
+        previous = baseline.get("imports", {}).get(module)
+        if not previous:
+            continue
+        change = round((current["import_ms"] - previous["import_ms"]) / previous["import_ms"] * 100, 1)
+        imports[module] = {"import_pct": change, "regressed": change > max_regression}
+        if change > max_regression:
+            regressions.append(module)
+    return {"max_regression_pct": max_regression, "imports": imports, "regressions": regressions}
+
+
+def run(args) -> dict:
+    result = {"imports": {module: measure_import(module, args.repeat, args.top) for module in args.modules}}
+    if not args.skip_startup:
+        tmp = tempfile.mkdtemp(prefix="qapp-startup-")
+        database_url = f"sqlite://{os.path.join(tmp, 'startup.sqlite3')}"
+        configs = {environment: write_config(tmp, environment, database_url) for environment in ("development", "production")}
+        # Create and migrate the database first, as a deploy would
+        boot(configs["development"])
+        result["startup"] = {environment: measure_startup(path, args.repeat) for environment, path in configs.items()}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time (python -X importtime) and startup phases")
+    parser.add_argument("--modules", default=",".join(MODULES), help="comma-separated")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=12, help="heaviest packages to list")
+    parser.add_argument("--skip-startup", action="store_true", help="only measure imports")
+    parser.add_argument("--save", help="write the result to this file")
+    parser.add_argument("--baseline", help="compare with a result saved by --save")
+    parser.add_argument("--max-regression", type=float, default=20, help="percent")
+    args = parser.parse_args()
+    args.modules = [module.strip() for module in args.modules.split(",") if module.strip()]
+
+    result = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["comparison"] = compare(result, json.load(f), args.max_regression)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    if result.get("comparison", {}).get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
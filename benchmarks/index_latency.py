@@ -0,0 +1,135 @@
+# benchmarks/index_latency.py
+"""
+Hot-query latency on a large Atendimento table, before and after the
+indexes added by app.migrations.
+
+The table is seeded without the indexes (as on a database created by an
+older release), the hot queries are timed, then ``migrate()`` is run and
+the same queries are timed again.
+
+    python -m benchmarks.index_latency --tickets 1000000 --queues 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from tortoise import Tortoise, timezone
+
+INDEXES = (
+    "idx_atendimento_queue_status_created",
+    "idx_atendimento_status_created",
+    "idx_messagelog_atendimento_sent",
+)
+
+
+async def seed(tickets: int, queues: int, waiting_ratio: float, chunk: int = 50_000):
+    from app.models import AtendimentoStatus
+
+    db = Tortoise.get_connection("default")
+    for name in INDEXES:
+        await db.execute_script(f'DROP INDEX IF EXISTS "{name}"')
+
+    await db.execute_query(
+        'INSERT INTO "user" ("name", "phone", "role", "password_hash", "created_at") VALUES (?, ?, ?, ?, ?)',
+        ["bench", "bench", "admin", "x", timezone.now()],
+    )
+    await db.execute_many(
+        'INSERT INTO "queue" ("name", "created_by_id", "active", "created_at") VALUES (?, 1, 1, ?)',
+        [[f"queue {q}", timezone.now()] for q in range(queues)],
+    )
+
+    rng = random.Random(42)
+    now = timezone.now()
+    closed = [AtendimentoStatus.ATENDIDO.value, AtendimentoStatus.CANCELADO.value, AtendimentoStatus.CHAMADO.value]
+    sql = (
+        'INSERT INTO "atendimento" ("queue_id", "phone", "status", "created_at", "updated_at") '
+        'VALUES (?, ?, ?, ?, ?)'
+    )
+    for start in range(0, tickets, chunk):
+        rows = []
+        for i in range(start, min(start + chunk, tickets)):
+            created = now - timedelta(minutes=(tickets - i) * 0.25)
+            if rng.random() < waiting_ratio:
+                status = AtendimentoStatus.AGUARDANDO.value
+            else:
+                status = rng.choice(closed)
+            rows.append([rng.randint(1, queues), f"+258{i:09d}", status, created, created])
+        await db.execute_many(sql, rows)
+
+
+async def time_queries(queues: int, repeat: int) -> dict:
+    from app.models import Atendimento, AtendimentoStatus
+
+    threshold = timezone.now() - timedelta(days=7)
+    queries = {
+        "next_waiting": lambda q: Atendimento.filter(
+            queue_id=q, status=AtendimentoStatus.AGUARDANDO
+        ).order_by("created_at", "id").first(),
+        "count_waiting": lambda q: Atendimento.filter(
+            queue_id=q, status=AtendimentoStatus.AGUARDANDO
+        ).count(),
+        "cleanup_sweep": lambda q: Atendimento.filter(
+            status=AtendimentoStatus.AGUARDANDO, created_at__lt=threshold
+        ).limit(1000).values_list("id", flat=True),
+    }
+    results = {}
+    for name, query in queries.items():
+        samples = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            await query(i % queues + 1)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            "p50_ms": round(statistics.median(samples), 3),
+            "max_ms": round(max(samples), 3),
+        }
+    return results
+
+
+async def run(args) -> dict:
+    from app.migrations import migrate
+
+    path = os.path.join(tempfile.mkdtemp(), "index_latency.sqlite3")
+    await Tortoise.init(db_url=f"sqlite://{path}", modules={"models": ["app.models"]})
+    try:
+        await Tortoise.generate_schemas(safe=True)
+        start = time.perf_counter()
+        await seed(args.tickets, args.queues, args.waiting_ratio)
+        seeded = time.perf_counter() - start
+
+        before = await time_queries(args.queues, args.repeat)
+        start = time.perf_counter()
+        applied = await migrate()
+        migrated = time.perf_counter() - start
+        after = await time_queries(args.queues, args.repeat)
+    finally:
+        await Tortoise.close_connections()
+    return {
+        "tickets": args.tickets,
+        "queues": args.queues,
+        "seed_seconds": round(seeded, 2),
+        "migrations": applied,
+        "migrate_seconds": round(migrated, 2),
+        "before": before,
+        "after": after,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-query latency before/after indexes")
+    parser.add_argument("--tickets", type=int, default=1_000_000)
+    parser.add_argument("--queues", type=int, default=50)
+    parser.add_argument("--waiting-ratio", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/login_storm.py
+"""
+Event-loop latency during a login storm: bcrypt verified inline in the
+handler (old behaviour) against app.hashing.PasswordHasher.
+
+A ticker coroutine sleeps for 10 ms in a loop and records how late it
+wakes up; that lateness is what every other request on the worker sees.
+
+    python -m benchmarks.login_storm --logins 40 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+TICK = 0.010
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def storm(verify, logins: int, hashed: str) -> dict:
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(TICK * 3)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(verify("secret-password", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await tick
+    lags.sort()
+    return {
+        "seconds": round(elapsed, 2),
+        "logins_per_second": round(logins / elapsed, 1),
+        "loop_lag_p50_ms": round(statistics.median(lags), 1),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1], 1),
+        "loop_lag_max_ms": round(lags[-1], 1),
+    }
+
+
+async def run(logins: int, workers: int) -> dict:
+    from app.hashing import PasswordHasher, hash_password, verify_password
+
+    hashed = hash_password("secret-password")
+
+    async def inline(plain, hashed_password):
+        return verify_password(plain, hashed_password)
+
+    hasher = PasswordHasher(max_workers=workers)
+    try:
+        return {
+            "logins": logins,
+            "inline": await storm(inline, logins, hashed),
+            "pooled": await storm(hasher.verify, logins, hashed),
+        }
+    finally:
+        hasher.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-loop lag during a login storm")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.logins, args.workers)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
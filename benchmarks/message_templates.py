@@ -0,0 +1,79 @@
+# benchmarks/message_templates.py
+"""
+Notification render throughput: a Jinja template compiled for every
+message against app.messages.MessageTemplates (compiled once per
+organization and message type, rendered in batch).
+
+    python -m benchmarks.message_templates --messages 10000 --organizations 1 50
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from jinja2 import Environment
+
+from app.messages import DEFAULT_MESSAGES, MessageTemplates
+from app.models import MessageType
+
+
+def source(organizations: int) -> dict:
+    return {
+        "chamada": "Chegou a sua vez! Senha {{ atendimento.id }}, fila {{ atendimento.queue_id }}.",
+        "organizacoes": {
+            f"org-{o}": {"chamada": {"subject": f"org {o}", "body": f"[{o}] Senha {{{{ atendimento.id }}}}"}}
+            for o in range(organizations)
+        },
+    }
+
+
+def tickets(count: int) -> list:
+    return [SimpleNamespace(id=i, queue_id=i % 20, phone=f"+258{i:09d}") for i in range(count)]
+
+
+def uncached(messages: list, organizations: int, config: dict) -> float:
+    start = time.perf_counter()
+    for i, atendimento in enumerate(messages):
+        spec = dict(DEFAULT_MESSAGES[MessageType.CHAMADA])
+        override = config["organizacoes"][f"org-{i % organizations}"]["chamada"]
+        spec.update(override)
+        env = Environment(autoescape=False)
+        env.from_string(spec["subject"]).render(atendimento=atendimento)
+        env.from_string(spec["body"]).render(atendimento=atendimento)
+    return time.perf_counter() - start
+
+
+def registry(messages: list, organizations: int, config: dict) -> float:
+    templates = MessageTemplates(config)
+    by_org = {}
+    for i, atendimento in enumerate(messages):
+        by_org.setdefault(f"org-{i % organizations}", []).append({"atendimento": atendimento})
+    start = time.perf_counter()
+    for organization, contexts in by_org.items():
+        templates.render_many(MessageType.CHAMADA, contexts, organization)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification render throughput")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--organizations", type=int, nargs="+", default=[1, 50])
+    args = parser.parse_args()
+
+    messages = tickets(args.messages)
+    results = []
+    for organizations in args.organizations:
+        config = source(organizations)
+        old = uncached(messages, organizations, config)
+        new = registry(messages, organizations, config)
+        results.append({
+            "messages": args.messages,
+            "organizations": organizations,
+            "compile_per_message_per_second": round(args.messages / old),
+            "registry_per_second": round(args.messages / new),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/metrics_overhead.py
+"""
+Per-request cost of app.metrics.MetricsMiddleware on a hello-world route,
+next to the old time.time() + f-string log line middleware.
+
+Requests are driven straight through the ASGI interface (no HTTP client or
+server), so the numbers are the framework's own cost and the overhead
+percentage is the strictest one available.
+
+Also checked: requests to routes of routers included with a prefix are
+labelled with the full path template (``/users/login``, ``/queue/``,
+``/queue/{queue_id}``), not the path declared on the router.
+
+    python -m benchmarks.metrics_overhead --requests 20000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+from fastapi import APIRouter, FastAPI, Request
+
+
+def hello_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/hello/{name}")
+    async def hello(name: str):
+        return {"hello": name}
+
+    return app
+
+
+def with_metrics() -> FastAPI:
+    from app.metrics import MetricsMiddleware
+
+    app = hello_app()
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+
+def with_log_line() -> FastAPI:
+    logger = logging.getLogger("bench_log_requests")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    app = hello_app()
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.info(f"{request.method} {request.url.path} - status: {response.status_code} - time: {process_time:.3f}s")
+        return response
+
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    """Microseconds per request."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(requests):
+        path = f"/hello/{i % 100}"
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def route_labels() -> dict:
+    """Whether each request through a prefixed router got the expected route label."""
+    import httpx
+    from app.metrics import MetricsMiddleware, http_responses
+
+    router = APIRouter()
+
+    @router.post("/")
+    async def create():
+        return {}
+
+    @router.get("/{queue_id}")
+    async def read(queue_id: int):
+        return {}
+
+    users = APIRouter()
+
+    @users.post("/login")
+    async def login():
+        return {}
+
+    app = hello_app()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router, prefix="/queue")
+    app.include_router(router, prefix="/atendimentos")  # same routes, second prefix
+    app.include_router(users, prefix="/users")
+    expected = {
+        ("POST", "/queue/"): "/queue/",
+        ("GET", "/queue/7"): "/queue/{queue_id}",
+        ("POST", "/atendimentos/"): "/atendimentos/",
+        ("POST", "/users/login"): "/users/login",
+        ("GET", "/hello/x"): "/hello/{name}",
+    }
+    result = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for (method, path), label in expected.items():
+            await client.request(method, path)
+            result[f"{method} {path} -> {label}"] = (method, label, 200) in http_responses.values
+    return result
+
+
+async def scenario(requests: int, repeat: int) -> dict:
+    apps = {"bare": hello_app(), "metrics": with_metrics(), "log_line": with_log_line()}
+    for app in apps.values():
+        await drive(app, 500)  # warm up routing and response classes
+    samples = {name: [] for name in apps}
+    for _ in range(repeat):
+        # Interleave so drift (CPU boost, GC) hits every variant alike
+        for name, app in apps.items():
+            samples[name].append(await drive(app, requests))
+    result = {name: round(statistics.median(values), 2) for name, values in samples.items()}
+    for name in ("metrics", "log_line"):
+        result[f"{name}_overhead_pct"] = round((result[name] / result["bare"] - 1) * 100, 2)
+    return {"requests": requests, "repeat": repeat, "us_per_request": result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics middleware overhead on a hello-world route")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    labels = asyncio.run(route_labels())
+    result = {**asyncio.run(scenario(args.requests, args.repeat)), "route_labels": labels}
+    print(json.dumps(result, indent=2))
+    if not all(labels.values()):
+        raise SystemExit("wrong route labels")
+
+
+if __name__ == "__main__":
+    main()
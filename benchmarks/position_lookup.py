@@ -0,0 +1,142 @@
+# benchmarks/position_lookup.py
+"""
+Customer position lookups: a COUNT over the waiting rows (what a lookup
+built on Atendimento.filter would run) against the queue engine's rank.
+
+Tickets are added through the engine, some are called or cancelled, a
+call history is recorded for the service time averages, then random
+waiting tickets are looked
+up, first with the COUNT query and then through the position endpoint
+of app.backend (in-process ASGI, no network). Positions from both paths
+are compared for a sample of tickets.
+
+    python -m benchmarks.position_lookup --tickets 20000 --queues 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+from tortoise import Tortoise
+
+
+def summary(samples, seconds: float) -> dict:
+    samples = sorted(samples)
+    return {
+        "lookups_per_second": round(len(samples) / seconds),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 3),
+    }
+
+
+async def count_position(atendimento) -> int:
+    from app.models import Atendimento, AtendimentoStatus
+    from tortoise.expressions import Q
+
+    ahead = await Atendimento.filter(
+        Q(created_at__lt=atendimento.created_at)
+        | Q(created_at=atendimento.created_at, id__lt=atendimento.id),
+        queue_id=atendimento.queue_id,
+        status=AtendimentoStatus.AGUARDANDO,
+    ).count()
+    return ahead + 1
+
+
+async def run(args) -> dict:
+    from app.backend import app
+    from app.models import Queue, User
+    from app.queue_engine import engine
+
+    path = os.path.join(tempfile.mkdtemp(), "position_lookup.sqlite3")
+    await Tortoise.init(db_url=f"sqlite://{path}", modules={"models": ["app.models"]})
+    try:
+        await Tortoise.generate_schemas()
+        user = await User.create(name="bench", phone="bench", password_hash="x")
+        for q in range(args.queues):
+            await Queue.create(name=f"queue {q}", created_by=user)
+        rng = random.Random(42)
+        tickets = []
+        for start in range(0, args.tickets, 1000):
+            batch = [(rng.randint(1, args.queues), f"+258{i:09d}") for i in range(start, min(start + 1000, args.tickets))]
+            tickets += await engine.add_many(batch)
+        # Some calls and cancels, so tickets leave from the head and the middle
+        for queue_id in range(1, args.queues + 1):
+            called = await engine.next(queue_id, atendente_id=1)
+            if called is not None:
+                tickets.remove(called)
+        for atendimento in rng.sample(tickets, len(tickets) // 100):
+            await engine.cancel(atendimento)
+            tickets.remove(atendimento)
+        # Call history of the last 10 minutes: two attendants per queue, 90 s each
+        for queue_id in range(1, args.queues + 1):
+            clock = time.time() - 600
+            for _ in range(6):
+                for atendente_id in (1, 2):
+                    engine.service_times.record_call(queue_id, atendente_id, at=clock)
+                    clock += 45
+
+        sample = [rng.choice(tickets) for _ in range(args.lookups)]
+
+        samples = []
+        start = time.perf_counter()
+        for atendimento in sample[: args.lookups // 10]:
+            t = time.perf_counter()
+            await count_position(atendimento)
+            samples.append((time.perf_counter() - t) * 1000)
+        count_query = summary(samples, time.perf_counter() - start)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            samples = []
+            start = time.perf_counter()
+            for atendimento in sample:
+                t = time.perf_counter()
+                response = await client.get(f"/atendimentos/{atendimento.id}/position")
+                samples.append((time.perf_counter() - t) * 1000)
+                assert response.status_code == 200, response.text
+            endpoint = summary(samples, time.perf_counter() - start)
+            last = response.json()
+
+            mismatches = 0
+            for atendimento in sample[:200]:
+                response = await client.get(f"/atendimentos/{atendimento.id}/position")
+                if response.json()["position"] != await count_position(atendimento):
+                    mismatches += 1
+
+        samples = []
+        start = time.perf_counter()
+        for atendimento in sample:
+            t = time.perf_counter()
+            engine.position(atendimento.id)
+            samples.append((time.perf_counter() - t) * 1000)
+        in_memory = summary(samples, time.perf_counter() - start)
+    finally:
+        await Tortoise.close_connections()
+    return {
+        "waiting_tickets": len(tickets),
+        "queues": args.queues,
+        "count_query": count_query,
+        "endpoint": endpoint,
+        "engine_position": in_memory,
+        "positions_checked": 200,
+        "position_mismatches": mismatches,
+        "example": last,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Position lookup: COUNT query vs in-memory rank")
+    parser.add_argument("--tickets", type=int, default=20_000)
+    parser.add_argument("--queues", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=5_000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/smtp_pool.py
+"""
+Send a burst of emails through SMTPPool against a local aiosmtpd server
+and compare with one connection per message (the old smtplib behaviour).
+Requires `pip install aiosmtpd`.
+
+    python -m benchmarks.smtp_pool --messages 500 --pool-size 4
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiosmtpd.controller import Controller
+
+
+class _Sink:
+    """aiosmtpd handler that counts delivered messages."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+async def burst(smtp_config: dict, messages: int, pool_per_message: bool) -> dict:
+    from app.mailer import SMTPPool
+
+    pool = SMTPPool.from_config(smtp_config)
+    if pool_per_message:
+        pool.max_messages_per_connection = 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        pool.send(f"client{i}@example.com", "qApp benchmark", f"message {i}")
+        for i in range(messages)
+    ))
+    elapsed = time.perf_counter() - start
+    await pool.close()
+    return {
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(messages / elapsed, 1),
+        "connections_opened": pool.connections_opened,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SMTP pool burst against a local aiosmtpd")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    sink = _Sink()
+    controller = Controller(sink, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        smtp_config = {"host": "127.0.0.1", "port": args.port, "pool_size": args.pool_size}
+        report = {
+            "messages": args.messages,
+            "pooled": asyncio.run(burst(smtp_config, args.messages, pool_per_message=False)),
+            "connection_per_message": asyncio.run(burst(smtp_config, args.messages, pool_per_message=True)),
+            "received": sink.received,
+        }
+    finally:
+        controller.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# benchmarks/stress_call_next.py
+"""
+Stress "call next" with hundreds of concurrent attendants and check that no
+ticket is handed out twice.
+
+By default every call goes through the real endpoint, POST
+/atendimentos/next of app.main (routing, form parsing, the claim's
+transaction and connections, the notification it queues), driven through
+httpx's ASGI transport with all calls in flight at once. With
+``--processes N`` each of N processes runs its own copy of the app against
+the shared database, as ``uvicorn --workers N`` would, coordinating through
+app.coordination.
+
+The ids of the claimed tickets are collected from the responses. The run
+fails if one was returned twice, if fewer tickets were claimed than were
+available, if a call failed, or if the database disagrees (tickets marked
+called != claims).
+
+``--mode engine`` is the check one layer down: several QueueEngine
+instances in one process (one per simulated worker) call ``next`` directly.
+
+    python -m benchmarks.stress_call_next --tickets 500 --calls 800 --processes 4
+    python -m benchmarks.stress_call_next --mode engine --workers 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import yaml
+from tortoise import Tortoise
+
+
+def check(claimed, tickets: int, calls: int, elapsed: float, label: str, errors: int = 0, called=None) -> int:
+    duplicates = [i for i, count in Counter(claimed).items() if count > 1]
+    print(f"{calls} calls from {label} in {elapsed:.3f}s "
+          f"({calls / elapsed:.0f} calls/s): {len(claimed)} claimed, {len(duplicates)} duplicated, {errors} failed")
+    if duplicates:
+        print(f"FAIL: tickets handed out more than once: {duplicates[:20]}")
+        return 1
+    if errors:
+        print(f"FAIL: {errors} calls failed")
+        return 1
+    if len(claimed) != min(tickets, calls):
+        print(f"FAIL: expected {min(tickets, calls)} claims, got {len(claimed)}")
+        return 1
+    if called is not None and called != len(claimed):
+        print(f"FAIL: {called} tickets marked called in the database, {len(claimed)} claims answered")
+        return 1
+    print("OK")
+    return 0
+
+
+async def seed(db_url: str, tickets: int) -> dict:
+    from app.migrations import migrate
+    from app.models import User, Queue, Atendimento
+
+    await Tortoise.init(db_url=db_url, modules={"models": ["app.models"]})
+    try:
+        await migrate()
+        admin = await User.create(name="stress", phone=f"s{time.time_ns() % 10**12}", password_hash="x")
+        queue = await Queue.create(name="stress", created_by=admin)
+        await Atendimento.bulk_create([
+            Atendimento(queue_id=queue.id, phone=f"+258{i:09d}") for i in range(tickets)
+        ])
+        return {"queue_id": queue.id, "atendente_id": admin.id}
+    finally:
+        await Tortoise.close_connections()
+
+
+async def called_in_db(db_url: str, queue_id: int) -> int:
+    from app.models import Atendimento, AtendimentoStatus
+
+    await Tortoise.init(db_url=db_url, modules={"models": ["app.models"]})
+    try:
+        return await Atendimento.filter(queue_id=queue_id, status=AtendimentoStatus.CHAMADO).count()
+    finally:
+        await Tortoise.close_connections()
+
+
+# -----------------------
+# Through the endpoint
+# -----------------------
+async def drive(calls: int, target: dict, barrier) -> dict:
+    import httpx
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://stress", timeout=120) as client:
+            # Start calling only once every process is up
+            await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+            responses = await asyncio.gather(*(
+                client.post("/atendimentos/next", data=target) for _ in range(calls)
+            ))
+    claimed = [r.json()["id"] for r in responses if r.status_code == 200]
+    empty = sum(1 for r in responses if r.status_code == 404)
+    return {"claimed": claimed, "errors": len(responses) - len(claimed) - empty}
+
+
+def run_process(calls: int, target: dict, barrier, results):
+    try:
+        results.put(asyncio.run(drive(calls, target, barrier)))
+    except Exception as e:
+        results.put({"error": repr(e)})
+
+
+def endpoint_mode(args, db_url: str, tmp: str) -> int:
+    target = asyncio.run(seed(db_url, args.tickets))
+    config = {
+        "database_url": db_url,
+        "jwt_secret": "stress-secret-" + "x" * 32,
+        "coordination": {"backend": "sqlite", "path": os.path.join(tmp, "coordination.sqlite3")}
+        if args.processes > 1 else {},
+        "revocation_backend": "database" if args.processes > 1 else "memory",
+    }
+    config_file = os.path.join(tmp, "config.yaml")
+    with open(config_file, "w") as f:
+        yaml.safe_dump(config, f)
+    os.environ["QAPP_CONFIG"] = config_file  # inherited by the spawned processes
+
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(args.processes + 1), ctx.Queue()
+    shares = [args.calls // args.processes + (i < args.calls % args.processes) for i in range(args.processes)]
+    processes = [ctx.Process(target=run_process, args=(share, target, barrier, results)) for share in shares]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    reports = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    failed = [report["error"] for report in reports if "error" in report]
+    if failed:
+        print(f"FAIL: processes failed: {failed}")
+        return 1
+
+    claimed = [i for report in reports for i in report["claimed"]]
+    errors = sum(report["errors"] for report in reports)
+    called = asyncio.run(called_in_db(db_url, target["queue_id"]))
+    label = f"{args.processes} app process(es) via POST /atendimentos/next"
+    return check(claimed, args.tickets, args.calls, elapsed, label, errors, called)
+
+
+# -----------------------
+# Engine only
+# -----------------------
+async def engine_mode(args, db_url: str) -> int:
+    from app.models import Atendimento
+    from app.queue_engine import QueueEngine
+
+    target = await seed(db_url, args.tickets)
+    await Tortoise.init(db_url=db_url, modules={"models": ["app.models"]})
+    try:
+        engines = [QueueEngine() for _ in range(args.workers)]
+        for engine in engines:
+            await engine.rebuild()
+
+        async def attendant(n: int):
+            engine = engines[n % args.workers]
+            return await engine.next(target["queue_id"], target["atendente_id"])
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(attendant(n) for n in range(args.calls)))
+        elapsed = time.perf_counter() - start
+        claimed = [a.id for a in results if a is not None]
+        called = await Atendimento.filter(queue_id=target["queue_id"], status="chamado").count()
+    finally:
+        await Tortoise.close_connections()
+    return check(claimed, args.tickets, args.calls, elapsed, f"{args.workers} engines", called=called)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=("endpoint", "engine"), default="endpoint")
+    parser.add_argument("--db-url", help="empty database to use (default: temporary SQLite file)")
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--calls", type=int, default=800)
+    parser.add_argument("--processes", type=int, default=2, help="app copies (endpoint mode)")
+    parser.add_argument("--workers", type=int, default=4, help="engine instances (engine mode)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="qapp-stress-")
+    db_url = args.db_url or f"sqlite://{os.path.join(tmp, 'stress.sqlite3')}"
+    if args.mode == "engine":
+        sys.exit(asyncio.run(engine_mode(args, db_url)))
+    sys.exit(endpoint_mode(args, db_url, tmp))
+
+
+if __name__ == "__main__":
+    main()
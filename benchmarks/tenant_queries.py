@@ -0,0 +1,150 @@
+# benchmarks/tenant_queries.py
+"""
+Per-organization reads next to one large organization.
+
+One large organization holds most of the ticket history (``--large`` rows
+over 30 days) and ``--tenants`` small ones hold ``--small`` rows each, all
+in the same Atendimento table. For a small and for the large organization
+the benchmark runs the reads behind the listing and export endpoints:
+
+    recent_page   first page (100 rows) of the last day, by (created_at, id)
+    export_day    every row of the last day, in keyset chunks of 1000
+
+once filtered by the organization's queues (``queue_id IN (...)``, the only
+way to scope a tenant before tickets carried an organization) and once by
+``organization_id`` (its index leads with the organization, so only that
+organization's recent rows are read).
+
+    python -m benchmarks.tenant_queries --large 500000 --tenants 20 --small 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from tortoise import Tortoise
+
+
+def summary(samples) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[max(0, int(len(samples) * 0.99) - 1)], 3),
+    }
+
+
+async def seed(args) -> dict:
+    """Organizations 1..tenants+1 (1 is the large one), `queues` queues each."""
+    from tortoise import timezone
+    from benchmarks.lifecycle import _insert_sql
+    from app.models import AtendimentoStatus
+
+    db = Tortoise.get_connection("default")
+    dialect = db.capabilities.dialect
+    rng = random.Random(42)
+    now = timezone.now()
+    organizations = args.tenants + 1
+    await db.execute_many(
+        _insert_sql(dialect, "user", ("name", "phone", "role", "password_hash", "created_at")),
+        [["bench", "+258800000000", "admin", "x", now]],
+    )
+    await db.execute_many(
+        _insert_sql(dialect, "organization", ("slug", "name", "created_at")),
+        [[f"org-{o}", f"organization {o}", now] for o in range(1, organizations + 1)],
+    )
+    await db.execute_many(
+        _insert_sql(dialect, "queue", ("name", "created_by_id", "organization_id", "active", "created_at")),
+        [[f"queue {o}.{q}", 1, o, True, now] for o in range(1, organizations + 1) for q in range(args.queues)],
+    )
+    sql = _insert_sql(dialect, "atendimento", ("queue_id", "organization_id", "phone", "status", "created_at", "updated_at"))
+    statuses = [status.value for status in AtendimentoStatus]
+    span = timedelta(days=30)
+    start = time.perf_counter()
+    sizes = [(1, args.large)] + [(o, args.small) for o in range(2, organizations + 1)]
+    # Interleave the organizations in time, as real traffic would be
+    rows = []
+    for organization, count in sizes:
+        for i in range(count):
+            created = now - span + span * rng.random()
+            queue_id = (organization - 1) * args.queues + rng.randint(1, args.queues)
+            rows.append([queue_id, organization, f"+2588{rng.randrange(10**8):08d}", rng.choice(statuses), created, created])
+    rows.sort(key=lambda row: row[4])
+    for offset in range(0, len(rows), 10_000):
+        await db.execute_many(sql, rows[offset:offset + 10_000])
+    return {"rows": len(rows), "seconds": round(time.perf_counter() - start, 2)}
+
+
+async def measure(args, organization_id: int) -> dict:
+    from tortoise import timezone
+    from app.crud import atendimentos_page, filter_atendimentos, iter_atendimentos
+    from app.models import Atendimento, Queue
+
+    queue_ids = await Queue.filter(organization_id=organization_id).values_list("id", flat=True)
+    since = timezone.now() - timedelta(days=1)
+    queries = {
+        "by_queues": lambda: Atendimento.filter(queue_id__in=queue_ids, created_at__gte=since),
+        "by_organization": lambda: filter_atendimentos(since=since, organization_id=organization_id),
+    }
+    result = {}
+    for name, query in queries.items():
+        samples = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            rows, _ = await atendimentos_page(query(), limit=100)
+            samples.append((time.perf_counter() - t) * 1000)
+        page = summary(samples)
+
+        samples, exported = [], 0
+        for _ in range(max(1, args.repeat // 10)):
+            t = time.perf_counter()
+            exported = 0
+            async for _ in iter_atendimentos(query()):
+                exported += 1
+            samples.append((time.perf_counter() - t) * 1000)
+        result[name] = {"recent_page": page, "export_day": {**summary(samples), "rows": exported}}
+    result["speedup_recent_page"] = round(result["by_queues"]["recent_page"]["p50_ms"] / result["by_organization"]["recent_page"]["p50_ms"], 1)
+    result["speedup_export_day"] = round(result["by_queues"]["export_day"]["p50_ms"] / result["by_organization"]["export_day"]["p50_ms"], 1)
+    return result
+
+
+async def run(args) -> dict:
+    from app.migrations import migrate
+
+    url = args.database_url or f"sqlite://{os.path.join(tempfile.mkdtemp(), 'tenant_queries.sqlite3')}"
+    await Tortoise.init(db_url=url, modules={"models": ["app.models"]})
+    try:
+        await migrate()
+        seeded = await seed(args)
+        db = Tortoise.get_connection("default")
+        if db.capabilities.dialect == "postgres":
+            await db.execute_script('ANALYZE "atendimento"')
+        else:
+            await db.execute_script("ANALYZE")
+        return {
+            "seed": seeded,
+            "small_organization": await measure(args, organization_id=2),
+            "large_organization": await measure(args, organization_id=1),
+        }
+    finally:
+        await Tortoise.close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-organization reads: queue_id IN (...) vs organization_id")
+    parser.add_argument("--database-url", help="empty scratch database (default: a temporary SQLite file)")
+    parser.add_argument("--large", type=int, default=500_000, help="tickets of the large organization")
+    parser.add_argument("--tenants", type=int, default=20, help="small organizations")
+    parser.add_argument("--small", type=int, default=5_000, help="tickets per small organization")
+    parser.add_argument("--queues", type=int, default=5, help="queues per organization")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
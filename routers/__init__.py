@@ -5,8 +5,10 @@
 from . import users
 from . import queue
 from . import atendimentos
+from . import organizations
 
 # Optional: expose routers for easier import in main.py
 users_router = users.router
 queue_router = queue.router
 atendimentos_router = atendimentos.router
+organizations_router = organizations.router
@@ -1,14 +1,30 @@
 # app/routers/atendimentos.py
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Form
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Form, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from datetime import datetime
+import csv
+import io
+import json
 from app.models import Atendimento, Queue, AtendimentoStatus, User
-from app.schemas import AtendimentoRead, AtendimentoCreate
-from app.auth import get_current_user
-from app.tasks import notify_new_entry, notify_called
-from app.utils import logger
+from app.schemas import (
+    AtendimentoRead, AtendimentoPage, AtendimentoBulkCreate, AtendimentoBulkResult,
+    AtendimentoPosition
+)
+from app.auth import get_current_user, require_role
+from app.tasks import notify_new_entry, notify_new_entries, notify_called
+from app.utils import queue_statistics
+from app.crud import (
+    queue_status_counts, filter_atendimentos, atendimentos_page, iter_atendimentos, ticket_position, ATENDIMENTO_FIELDS
+)
+from app.analytics import queue_analytics
+from app.queue_engine import engine
 
 router = APIRouter()
 
+# Largest batch accepted by the bulk intake endpoint
+BULK_MAX_ITEMS = 1000
+
 # -----------------------
 # Add new atendimento (queue ticket)
 # -----------------------
@@ -16,8 +32,7 @@ router = APIRouter()
 async def add_atendimento(
     queue_id: int = Form(...),
     phone: str = Form(...),
-    current_user: User = Depends(get_current_user),
-    background_tasks: BackgroundTasks = None
+    current_user: User = Depends(get_current_user)
 ):
     """
     Add a new Atendimento to a queue.
@@ -26,29 +41,122 @@ async def add_atendimento(
     if not queue:
         raise HTTPException(status_code=404, detail="Queue not found")
     
-    atendimento = await Atendimento.create(
-        queue_id=queue.id,
-        phone=phone,
-        status=AtendimentoStatus.AGUARDANDO
-    )
+    atendimento = await engine.add(queue.id, phone)
 
-    # Schedule email notification
-    if background_tasks:
-        background_tasks.add_task(notify_new_entry, atendimento.id, background_tasks)
+    # Queue email notification
+    await notify_new_entry(atendimento)
 
     return AtendimentoRead.from_orm(atendimento)
 
 
 # -----------------------
-# Get all atendimentos
+# Bulk intake (kiosks, integrations)
+# -----------------------
+@router.post("/bulk", response_model=AtendimentoBulkResult)
+async def add_atendimentos_bulk(
+    payload: AtendimentoBulkCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Add many Atendimentos, across queues, in one request and one transaction.
+    Returns the new ids in the order of the submitted items.
+    """
+    if not payload.items:
+        return AtendimentoBulkResult(ids=[])
+    if len(payload.items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per request")
+
+    queue_ids = {item.queue_id for item in payload.items}
+    found = set(await Queue.filter(id__in=queue_ids).values_list("id", flat=True))
+    missing = sorted(queue_ids - found)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Queues not found: {missing}")
+
+    atendimentos = await engine.add_many([(item.queue_id, item.phone) for item in payload.items])
+
+    # Queue email notifications
+    await notify_new_entries(atendimentos)
+
+    return AtendimentoBulkResult(ids=[a.id for a in atendimentos])
+
+
+# -----------------------
+# List atendimentos (keyset pagination)
+# -----------------------
+@router.get("/", response_model=AtendimentoPage)
+async def list_atendimentos(
+    queue_id: Optional[int] = None,
+    status: Optional[AtendimentoStatus] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    organization_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Return one page of atendimentos ordered by (created_at, id).
+    Pass the returned `next_cursor` back as `cursor` to get the next page.
+    """
+    query = filter_atendimentos(queue_id, status, since, until, organization_id)
+    try:
+        rows, next_cursor = await atendimentos_page(query, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return AtendimentoPage(items=[AtendimentoRead(**row) for row in rows], next_cursor=next_cursor)
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, "value", value)
+
+
+async def _export_ndjson(query):
+    async for row in iter_atendimentos(query):
+        yield json.dumps({k: _export_value(v) for k, v in row.items()}) + "\n"
+
+
+async def _export_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ATENDIMENTO_FIELDS)
+    async for row in iter_atendimentos(query):
+        writer.writerow([_export_value(row[field]) for field in ATENDIMENTO_FIELDS])
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+# -----------------------
+# Export atendimentos (streaming)
 # -----------------------
-@router.get("/", response_model=List[AtendimentoRead])
-async def list_atendimentos():
+@router.get("/export")
+async def export_atendimentos(
+    format: str = "ndjson",
+    queue_id: Optional[int] = None,
+    status: Optional[AtendimentoStatus] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    organization_id: Optional[int] = None,
+    claims: dict = Depends(require_role("admin", "gestor"))
+):
     """
-    Return all atendimentos.
+    Stream every matching atendimento as NDJSON or CSV (managers only: the
+    export carries customer phone numbers). The table is read in keyset
+    chunks, so memory use does not grow with the history size.
     """
-    atendimentos = await Atendimento.all().prefetch_related("queue", "atendente")
-    return [AtendimentoRead.from_orm(a) for a in atendimentos]
+    query = filter_atendimentos(queue_id, status, since, until, organization_id)
+    if format == "ndjson":
+        return StreamingResponse(_export_ndjson(query), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(
+            _export_csv(query),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=atendimentos.csv"},
+        )
+    raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
 
 
 # -----------------------
@@ -57,31 +165,36 @@ async def list_atendimentos():
 @router.post("/next", response_model=AtendimentoRead)
 async def call_next(
     queue_id: int = Form(...),
-    atendente_id: int = Form(...),
-    background_tasks: BackgroundTasks = None
+    atendente_id: int = Form(...)
 ):
     """
     Call the next Atendimento in a queue and assign an attendant.
     """
-    atendimento = await Atendimento.filter(
-        queue_id=queue_id,
-        status=AtendimentoStatus.AGUARDANDO
-    ).first()
-    
+    atendimento = await engine.next(queue_id, atendente_id)
     if not atendimento:
         raise HTTPException(status_code=404, detail="No pending atendimentos")
 
-    atendimento.status = AtendimentoStatus.CHAMADO
-    atendimento.atendente_id = atendente_id
-    await atendimento.save()
-
-    # Schedule email notification
-    if background_tasks:
-        background_tasks.add_task(notify_called, atendimento.id, background_tasks)
+    # Queue email notification
+    await notify_called(atendimento)
 
     return AtendimentoRead.from_orm(atendimento)
 
 
+# -----------------------
+# Position and estimated wait (customer-facing)
+# -----------------------
+@router.get("/{atendimento_id}/position", response_model=AtendimentoPosition)
+async def atendimento_position(atendimento_id: int):
+    """
+    Where a ticket is in its queue and roughly when it will be called.
+    Answered from the queue engine's in-memory rank, without a query.
+    """
+    result = await ticket_position(atendimento_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Atendimento not found")
+    return result
+
+
 # -----------------------
 # Cancel atendimento
 # -----------------------
@@ -91,7 +204,9 @@ async def cancel_atendimento(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Cancel an atendimento. Only the attendant or admin can cancel.
+    Cancel an atendimento. An admin can cancel any ticket still waiting or
+    called; an attendant only the tickets they called. 409 once it has been
+    served or cancelled.
     """
     atendimento = await Atendimento.get_or_none(id=atendimento_id)
     if not atendimento:
@@ -100,8 +215,9 @@ async def cancel_atendimento(
     if atendimento.atendente_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to cancel")
     
-    atendimento.status = AtendimentoStatus.CANCELADO
-    await atendimento.save()
+    atendente_id = None if current_user.role == "admin" else current_user.id
+    if await engine.cancel(atendimento, atendente_id) is None:
+        raise HTTPException(status_code=409, detail="Atendimento can no longer be cancelled")
     return AtendimentoRead.from_orm(atendimento)
 
 
@@ -113,13 +229,25 @@ async def queue_stats(queue_id: int):
     """
     Return statistics for a queue.
     """
-    atendimentos = await Atendimento.filter(queue_id=queue_id)
-    total = len(atendimentos)
-    stats = {
-        "total": total,
-        "aguardando": sum(1 for a in atendimentos if a.status == AtendimentoStatus.AGUARDANDO),
-        "chamado": sum(1 for a in atendimentos if a.status == AtendimentoStatus.CHAMADO),
-        "cancelado": sum(1 for a in atendimentos if a.status == AtendimentoStatus.CANCELADO),
-        "atendido": sum(1 for a in atendimentos if a.status == AtendimentoStatus.ATENDIDO),
-    }
-    return stats
+    return queue_statistics(await queue_status_counts(queue_id))
+
+
+# -----------------------
+# Get queue analytics
+# -----------------------
+@router.get("/analytics/{queue_id}")
+async def analytics(
+    queue_id: int,
+    granularity: str = "hour",
+    by_atendente: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    claims: dict = Depends(require_role("admin", "gestor"))
+):
+    """
+    Throughput and wait times (avg, p50, p95) per hour or day, optionally per
+    attendant (managers only). Served from the pre-aggregated QueueRollup table.
+    """
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    return await queue_analytics(queue_id, granularity, by_atendente, since, until)
@@ -0,0 +1,43 @@
+# app/routers/organizations.py
+from fastapi import APIRouter, Form, Depends, HTTPException
+from typing import List
+import re
+from app.models import Organization
+from app.schemas import OrganizationRead
+from app.auth import require_role
+
+router = APIRouter()
+
+# Slugs name archive directories and config keys (mensagens.organizacoes.<slug>)
+SLUG_PATTERN = re.compile(r"^[a-z0-9][a-z0-9-]{0,49}$")
+
+
+# -----------------------
+# Create an organization (admin only)
+# -----------------------
+@router.post("/", response_model=OrganizationRead)
+async def create_organization(
+    slug: str = Form(...),
+    name: str = Form(...),
+    claims: dict = Depends(require_role("admin"))
+):
+    """
+    Create an organization (tenant). Queues created with its id belong to it.
+    """
+    if not SLUG_PATTERN.match(slug):
+        raise HTTPException(status_code=400, detail="slug must be lowercase letters, digits and dashes")
+    if await Organization.exists(slug=slug):
+        raise HTTPException(status_code=400, detail="Slug already in use")
+    organization = await Organization.create(slug=slug, name=name)
+    return OrganizationRead.from_orm(organization)
+
+
+# -----------------------
+# List organizations (admin only)
+# -----------------------
+@router.get("/", response_model=List[OrganizationRead])
+async def list_organizations(claims: dict = Depends(require_role("admin"))):
+    """
+    List all organizations.
+    """
+    return [OrganizationRead.from_orm(o) for o in await Organization.all().order_by("id")]
@@ -1,10 +1,16 @@
 # app/routers/queue.py
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Form
-from typing import List
-from app.models import Queue, User
-from app.schemas import QueueRead, QueueCreate
+from fastapi import APIRouter, Depends, HTTPException, Form, Request
+from fastapi.responses import HTMLResponse
+from typing import List, Optional
+from app.models import Organization, Queue, User
+from app.schemas import QueueRead
 from app.auth import get_current_user
-from app.utils import send_email, logger
+from app.config import get_settings
+from app.outbox import enqueue_email
+from app.events import sse_response
+from app.crud import now_serving
+from app.organizations import organizations
+from app.fragments import forget_queue_list, fragment_response, panel
 
 router = APIRouter()
 
@@ -14,19 +20,23 @@ router = APIRouter()
 @router.post("/", response_model=QueueRead)
 async def create_queue(
     name: str = Form(...),
-    current_user: User = Depends(get_current_user),
-    background_tasks: BackgroundTasks = None
+    organization_id: Optional[int] = Form(None),
+    current_user: User = Depends(get_current_user)
 ):
     """
-    Create a new queue. Only authenticated users can create queues.
+    Create a new queue, optionally for an organization (fixed for the
+    queue's lifetime). Only authenticated users can create queues.
     """
-    queue = await Queue.create(name=name, created_by=current_user)
+    if organization_id is not None and not await Organization.exists(id=organization_id):
+        raise HTTPException(status_code=404, detail="Organization not found")
+    queue = await Queue.create(name=name, created_by=current_user, organization_id=organization_id)
+    organizations.remember(queue)
+    forget_queue_list()
     # Optional: send notification email to admin
-    if "notification_email" in background_tasks.app.state.config:
-        email = background_tasks.app.state.config["notification_email"]
-        background_tasks.add_task(
-            send_email,
-            to_email=email,
+    notification_email = get_settings().notification_email
+    if notification_email:
+        await enqueue_email(
+            to_email=notification_email,
             subject="New Queue Created",
             content=f"Queue '{name}' created by {current_user.name}"
         )
@@ -56,6 +66,42 @@ async def get_queue(queue_id: int):
         raise HTTPException(status_code=404, detail="Queue not found")
     return QueueRead.from_orm(queue)
 
+# -----------------------
+# Now serving (shared by all workers)
+# -----------------------
+@router.get("/{queue_id}/now-serving")
+async def queue_now_serving(queue_id: int):
+    """
+    Ticket being served and queue counters, as seen by every worker.
+    """
+    return await now_serving(queue_id)
+
+
+# -----------------------
+# Queue panel (HTMX fragment, ETag)
+# -----------------------
+@router.get("/{queue_id}/panel", response_class=HTMLResponse)
+async def queue_panel(request: Request, queue_id: int):
+    """
+    The queue's section as an HTML fragment for panels that poll. Rendered
+    once per queue state; answers 304 while the client's copy is current.
+    """
+    fragment = await panel(queue_id)
+    if fragment is None:
+        raise HTTPException(status_code=404, detail="Queue not found")
+    return fragment_response(request, fragment.etag, fragment.html)
+
+
+# -----------------------
+# Live queue events (SSE)
+# -----------------------
+@router.get("/{queue_id}/events")
+async def queue_events(queue_id: int):
+    """
+    Stream ticket changes of a queue as Server-Sent Events (no DB access).
+    """
+    return sse_response(queue_id)
+
 # -----------------------
 # Update queue
 # -----------------------
@@ -77,6 +123,7 @@ async def update_queue(
     queue.name = name
     queue.active = active
     await queue.save()
+    forget_queue_list()
     return QueueRead.from_orm(queue)
 
 # -----------------------
@@ -93,4 +140,5 @@ async def delete_queue(queue_id: int, current_user: User = Depends(get_current_u
     if queue.created_by_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     await queue.delete()
+    forget_queue_list()
     return {"status": "deleted", "queue_id": queue_id}
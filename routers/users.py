@@ -3,7 +3,10 @@ from fastapi import APIRouter, Form, Depends, HTTPException
 from typing import List
 from app.models import User
 from app.schemas import UserRead, UserCreate
-from app.auth import hash_password, authenticate_user, create_access_token, get_current_user
+from app.auth import (
+    hash_password_async, authenticate_user, create_access_token, get_current_user, get_token_claims,
+    require_role, auth_cache_stats, logout
+)
 
 router = APIRouter()
 
@@ -17,14 +20,11 @@ async def register_user(
     phone: str = Form(...),
     password: str = Form(...),
     role: str = Form(...),
-    current_user: User = Depends(get_current_user)  # Optional: Only admin can create users
+    claims: dict = Depends(require_role("admin"))  # Only admin can create users
 ):
     """
     Register a new user. Only admin can create users.
     """
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Only admin can create users")
-
     existing_user = await User.get_or_none(phone=phone)
     if existing_user:
         raise HTTPException(status_code=400, detail="Phone already registered")
@@ -32,7 +32,7 @@ async def register_user(
     user = await User.create(
         name=name,
         phone=phone,
-        password_hash=hash_password(password),
+        password_hash=await hash_password_async(password),
         role=role
     )
     return UserRead.from_orm(user)
@@ -54,17 +54,26 @@ async def login_user(phone: str = Form(...), password: str = Form(...)):
     return {"access_token": token, "token_type": "bearer", "role": user.role}
 
 
+# -----------------------
+# Logout
+# -----------------------
+@router.post("/logout")
+async def logout_user(all_sessions: bool = Form(False), claims: dict = Depends(get_token_claims)):
+    """
+    Revoke the presented token (or, with all_sessions, every token of the user)
+    """
+    await logout(claims, all_sessions)
+    return {"status": "logged out"}
+
+
 # -----------------------
 # List all users (admin only)
 # -----------------------
 @router.get("/", response_model=List[UserRead])
-async def list_users(current_user: User = Depends(get_current_user)):
+async def list_users(claims: dict = Depends(require_role("admin"))):
     """
     List all registered users. Admin only.
     """
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
     users = await User.all()
     return [UserRead.from_orm(u) for u in users]
 
@@ -78,3 +87,14 @@ async def get_me(current_user: User = Depends(get_current_user)):
     Get info about the currently logged-in user
     """
     return UserRead.from_orm(current_user)
+
+
+# -----------------------
+# Auth cache statistics (admin only)
+# -----------------------
+@router.get("/cache-stats")
+async def cache_stats(claims: dict = Depends(require_role("admin"))):
+    """
+    Hit/miss counters of the token and user caches
+    """
+    return auth_cache_stats()